@@ -0,0 +1,165 @@
+"""
+Asaas API client
+One long-lived httpx.AsyncClient per process with keep-alive connection
+pooling, so payment calls neither block the event loop nor pay a TLS
+handshake per request. Opened on app startup and closed on shutdown.
+Every request goes through the "asaas" resilience policy: reads are
+retried and hedged, writes are only retried when the connection was never
+established, and an open breaker fails calls without waiting on Asaas
+"""
+
+import logging
+import os
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+import httpx
+
+from resilience import CircuitOpenError, ResiliencePolicy
+
+logger = logging.getLogger(__name__)
+
+
+class AsaasUnavailable(Exception):
+    """5xx/429 from Asaas: counts as a failure for the breaker and may be retried"""
+
+    def __init__(self, response: httpx.Response):
+        super().__init__(f"Asaas respondeu {response.status_code}")
+        self.response = response
+
+
+class AsaasResult(NamedTuple):
+    """Outcome of an Asaas call: the JSON body on success, otherwise the HTTP status and error codes
+
+    status_code is None when Asaas never answered (timeout, connection
+    error, open breaker): the request may or may not have been applied
+    """
+
+    data: Optional[Dict[str, Any]]
+    status_code: Optional[int] = None
+    error_codes: Tuple[str, ...] = ()
+
+    @property
+    def customer_rejected(self) -> bool:
+        """Asaas refused the customer itself (removed or invalid), not a transient failure"""
+        if self.status_code is None or self.status_code == 429 or not 400 <= self.status_code < 500:
+            return False
+        return self.status_code == 404 or any("customer" in code for code in self.error_codes)
+
+
+def _error_codes(response: httpx.Response) -> Tuple[str, ...]:
+    try:
+        errors = response.json().get("errors") or []
+    except ValueError:
+        return ()
+    return tuple(str(error.get("code", "")).lower() for error in errors if isinstance(error, dict))
+
+
+# Falhas em que a requisição nem chegou à Asaas: seguras de repetir mesmo em POST
+CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+IDEMPOTENT_METHODS = {"GET", "HEAD"}
+
+
+class AsaasClient:
+    """Async wrapper around the Asaas REST API (v3)"""
+
+    def __init__(
+        self,
+        base_url: str,
+        token: str,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 30.0,
+        timeout: float = 15.0,
+        connect_timeout: float = 5.0
+    ):
+        self.base_url = base_url.rstrip('/')
+        self.token = token
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self._client: Optional[httpx.AsyncClient] = None
+        self.resilience = ResiliencePolicy.from_env("asaas", hedge_after=2.0)
+
+    @classmethod
+    def from_env(cls) -> "AsaasClient":
+        return cls(
+            base_url=os.environ.get('ASAAS_API_URL', 'https://sandbox.asaas.com/api/v3'),
+            token=os.environ.get('ASAAS_TOKEN', ''),
+            max_connections=int(os.environ.get('ASAAS_MAX_CONNECTIONS', '20')),
+            max_keepalive_connections=int(os.environ.get('ASAAS_MAX_KEEPALIVE', '10')),
+            keepalive_expiry=float(os.environ.get('ASAAS_KEEPALIVE_SECONDS', '30')),
+            timeout=float(os.environ.get('ASAAS_TIMEOUT_SECONDS', '15')),
+            connect_timeout=float(os.environ.get('ASAAS_CONNECT_TIMEOUT_SECONDS', '5'))
+        )
+
+    async def start(self):
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={'access_token': self.token, 'Content-Type': 'application/json'},
+                limits=self.limits,
+                timeout=self.timeout
+            )
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def request(self, method: str, path: str, *, json: Any = None, timeout: Optional[float] = None) -> httpx.Response:
+        """Send a request on the pooled connection (timeout overrides the default for this call)"""
+        if self._client is None or self._client.is_closed:
+            # Fora do ciclo de vida da app (scripts, testes): abre sob demanda
+            await self.start()
+        kwargs = {"json": json} if json is not None else {}
+        if timeout is not None:
+            kwargs["timeout"] = httpx.Timeout(timeout, connect=self.timeout.connect)
+
+        async def send() -> httpx.Response:
+            response = await self._client.request(method, path, **kwargs)
+            if response.status_code >= 500 or response.status_code == 429:
+                raise AsaasUnavailable(response)
+            return response
+
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        try:
+            return await self.resilience.call(
+                send,
+                retry_on=(httpx.TransportError, AsaasUnavailable) if idempotent else CONNECT_ERRORS,
+                hedge=idempotent
+            )
+        except AsaasUnavailable as e:
+            return e.response
+
+    async def _result(self, action: str, method: str, path: str, ok=(200,), **kwargs) -> AsaasResult:
+        try:
+            response = await self.request(method, path, **kwargs)
+        except httpx.HTTPError as e:
+            logger.error(f"❌ Exceção ao {action}: {type(e).__name__}: {e}")
+            return AsaasResult(None)
+        except CircuitOpenError as e:
+            logger.warning(f"⚠️ Asaas indisponível, não foi possível {action}: {e}")
+            return AsaasResult(None)
+        if response.status_code in ok:
+            return AsaasResult(response.json(), response.status_code)
+        logger.error(f"❌ Erro ao {action}: {response.status_code} - {response.text}")
+        return AsaasResult(None, response.status_code, _error_codes(response))
+
+    async def _json_or_none(self, action: str, method: str, path: str, ok=(200,), **kwargs) -> Optional[Dict[str, Any]]:
+        return (await self._result(action, method, path, ok, **kwargs)).data
+
+    async def create_customer(self, customer_data: Dict[str, Any], timeout: Optional[float] = None):
+        return await self._json_or_none("criar cliente Asaas", "POST", "/customers", ok=(200, 201), json=customer_data, timeout=timeout)
+
+    async def create_payment(self, payment_data: Dict[str, Any], timeout: Optional[float] = None) -> AsaasResult:
+        """Create a charge; the result tells a refused customer apart from a transient failure"""
+        return await self._result("criar cobrança Asaas", "POST", "/payments", ok=(200, 201), json=payment_data, timeout=timeout)
+
+    async def get_pix_qrcode(self, payment_id: str, timeout: Optional[float] = None):
+        return await self._json_or_none("obter QR Code PIX", "GET", f"/payments/{payment_id}/pixQrCode", timeout=timeout)
+
+    async def get_payment(self, payment_id: str, timeout: Optional[float] = None):
+        return await self._json_or_none("consultar cobrança Asaas", "GET", f"/payments/{payment_id}", timeout=timeout)
@@ -0,0 +1,103 @@
+"""
+Asaas customer resolution keyed by CPF
+A taxista only needs one Asaas customer. Before creating one, the resolver
+looks in a bounded in-process LRU cache and then in MongoDB (subscriptions
+and earlier asaas_payments rows); the Asaas customer API is only called on
+a true miss. Concurrent requests for the same CPF share one lookup.
+A customer id Asaas refused a charge for is forgotten and not reused from
+MongoDB either, so the next attempt for that CPF creates a fresh customer
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from cachetools import LRUCache
+
+from lookup_fields import digits_only
+
+logger = logging.getLogger(__name__)
+
+
+class CustomerResolver:
+    """Resolve the Asaas customer id for a CPF, creating the customer only when needed"""
+
+    def __init__(self, create_customer: Callable[..., Awaitable[Optional[Dict[str, Any]]]], maxsize: int = 5000):
+        self._create_customer = create_customer
+        self._cache: LRUCache = LRUCache(maxsize=maxsize)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # CPF -> id recusado pela Asaas (cliente apagado ou inválido)
+        self._rejected: LRUCache = LRUCache(maxsize=maxsize)
+        self.stats = {"cache_hits": 0, "storage_hits": 0, "misses": 0, "errors": 0}
+
+    def snapshot(self) -> Dict[str, Any]:
+        lookups = self.stats["cache_hits"] + self.stats["storage_hits"] + self.stats["misses"]
+        hits = self.stats["cache_hits"] + self.stats["storage_hits"]
+        return {
+            **self.stats,
+            "cache_size": len(self._cache),
+            "cache_maxsize": self._cache.maxsize,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0
+        }
+
+    def forget(self, cpf: str, customer_id: str):
+        """Stop using customer_id for this CPF (creating a charge for it failed)"""
+        cpf_digits = digits_only(cpf)
+        if not cpf_digits:
+            return
+        if self._cache.get(cpf_digits) == customer_id:
+            del self._cache[cpf_digits]
+        self._rejected[cpf_digits] = customer_id
+
+    async def _stored_customer_id(self, db, cpf_digits: str) -> Optional[str]:
+        subscription = await db.subscriptions.find_one(
+            {"cpf_digits": cpf_digits, "asaas_customer_id": {"$nin": [None, ""]}},
+            {"_id": 0, "asaas_customer_id": 1}
+        )
+        if subscription:
+            return subscription["asaas_customer_id"]
+        payment = await db.asaas_payments.find_one(
+            {"cpf_digits": cpf_digits, "asaas_customer_id": {"$nin": [None, ""]}},
+            {"_id": 0, "asaas_customer_id": 1},
+            sort=[("created_at", -1)]
+        )
+        return payment["asaas_customer_id"] if payment else None
+
+    async def _resolve(self, db, cpf_digits: str, name: str, email: str, cpf: str, phone: str) -> Optional[str]:
+        customer_id = await self._stored_customer_id(db, cpf_digits)
+        if customer_id and customer_id == self._rejected.get(cpf_digits):
+            customer_id = None
+        if customer_id:
+            self.stats["storage_hits"] += 1
+        else:
+            self.stats["misses"] += 1
+            customer = await self._create_customer(name, email, cpf, phone)
+            if not customer:
+                self.stats["errors"] += 1
+                return None
+            customer_id = customer["id"]
+            self._rejected.pop(cpf_digits, None)
+        self._cache[cpf_digits] = customer_id
+        return customer_id
+
+    async def resolve(self, db, name: str, email: str, cpf: str, phone: str) -> Optional[str]:
+        """Asaas customer id for this CPF (None if the customer could not be created)"""
+        cpf_digits = digits_only(cpf)
+        if not cpf_digits:
+            self.stats["misses"] += 1
+            customer = await self._create_customer(name, email, cpf, phone)
+            return customer["id"] if customer else None
+
+        customer_id = self._cache.get(cpf_digits)
+        if customer_id:
+            self.stats["cache_hits"] += 1
+            return customer_id
+
+        inflight = self._inflight.get(cpf_digits)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        task = asyncio.ensure_future(self._resolve(db, cpf_digits, name, email, cpf, phone))
+        self._inflight[cpf_digits] = task
+        task.add_done_callback(lambda _: self._inflight.pop(cpf_digits, None))
+        return await asyncio.shield(task)
@@ -0,0 +1,100 @@
+"""
+Benchmark for the Asaas HTTP client
+Starts the fake Asaas server locally and runs the customer -> charge ->
+PIX QR code sequence for many concurrent registrations, comparing the
+previous blocking `requests` calls inside async code with the pooled
+AsaasClient. Reports throughput and how long the event loop stalled
+
+Usage (from backend/):
+    python benchmarks/bench_asaas_client.py
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import requests  # noqa: E402
+import uvicorn  # noqa: E402
+
+from asaas_client import AsaasClient  # noqa: E402
+import fake_asaas  # noqa: E402
+
+PORT = int(os.environ.get('FAKE_ASAAS_PORT', '8765'))
+BASE_URL = f"http://127.0.0.1:{PORT}"
+CONCURRENCY = [1, 10, 50]
+REGISTRATIONS = 100
+HEADERS = {'access_token': 'bench', 'Content-Type': 'application/json'}
+
+
+def start_fake_server():
+    server = uvicorn.Server(uvicorn.Config(fake_asaas.app, host="127.0.0.1", port=PORT, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def blocking_flow(n: int, _client):
+    """Previous implementation: synchronous requests inside an async handler"""
+    customer = requests.post(f"{BASE_URL}/customers", json={"name": f"T{n}", "cpfCnpj": f"{n:011d}"}, headers=HEADERS, timeout=30).json()
+    payment = requests.post(f"{BASE_URL}/payments", json={"customer": customer["id"], "value": 150.0}, headers=HEADERS, timeout=30).json()
+    requests.get(f"{BASE_URL}/payments/{payment['id']}/pixQrCode", headers=HEADERS, timeout=30)
+
+
+async def pooled_flow(n: int, client: AsaasClient):
+    customer = await client.create_customer({"name": f"T{n}", "cpfCnpj": f"{n:011d}"})
+    payment = await client.create_payment({"customer": customer["id"], "value": 150.0})
+    await client.get_pix_qrcode(payment.data["id"])
+
+
+async def loop_lag_monitor(stop: asyncio.Event, samples: list):
+    """Largest delay observed by a 10 ms ticker: how long the event loop was frozen"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.01)
+        samples.append(time.perf_counter() - started - 0.01)
+
+
+async def run(flow, client, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(n):
+        async with semaphore:
+            await flow(n, client)
+
+    stop, lags = asyncio.Event(), []
+    monitor = asyncio.create_task(loop_lag_monitor(stop, lags))
+    started = time.perf_counter()
+    await asyncio.gather(*(one(n) for n in range(REGISTRATIONS)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await monitor
+    return REGISTRATIONS / elapsed, max(lags) * 1000 if lags else 0.0
+
+
+async def main():
+    client = AsaasClient(BASE_URL, "bench", max_connections=50, max_keepalive_connections=50)
+    await client.start()
+    try:
+        for concurrency in CONCURRENCY:
+            for label, flow in (("requests (bloqueante)", blocking_flow), ("AsaasClient (pool)", pooled_flow)):
+                throughput, max_lag = await run(flow, client, concurrency)
+                print(f"concorrência {concurrency:>3} | {label:>22} | {throughput:>7.1f} cadastros/s | "
+                      f"maior travamento do loop {max_lag:>7.1f} ms")
+    finally:
+        await client.close()
+
+
+if __name__ == "__main__":
+    server = start_fake_server()
+    try:
+        asyncio.run(main())
+    finally:
+        server.should_exit = True
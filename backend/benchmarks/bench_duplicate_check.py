@@ -0,0 +1,100 @@
+"""
+Benchmark for check_duplicate_registration
+Seeds a scratch database with synthetic subscriptions and measures the
+duplicate check latency as the collection grows from 1k to 500k documents
+
+Usage (from backend/):
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/bench_duplicate_check.py
+"""
+
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'bench_duplicate_check')
+
+from motor.motor_asyncio import AsyncIOMotorClient  # noqa: E402
+
+from db_indexes import ensure_indexes  # noqa: E402
+from lookup_fields import build_lookup_fields  # noqa: E402
+from server import check_duplicate_registration  # noqa: E402
+
+SIZES = [1_000, 10_000, 100_000, 500_000]
+PROBES = 200
+BATCH = 10_000
+
+
+def make_subscription(n: int) -> dict:
+    subscription = {
+        "id": f"bench-{n}",
+        "name": f"Taxista Numero {n}",
+        "email": f"taxista{n}@bench.example.com",
+        "phone": f"(27) 9{n:08d}",
+        "cpf": f"{n:011d}",
+        "car_plate": f"BEN{n % 10000:04d}",
+        "license_number": f"TA-{n:06d}",
+        "city": "Vitória",
+        "status": "pending",
+    }
+    subscription.update(build_lookup_fields(subscription))
+    return subscription
+
+
+async def seed(db, start: int, end: int):
+    for offset in range(start, end, BATCH):
+        batch = [make_subscription(n) for n in range(offset, min(offset + BATCH, end))]
+        await db.subscriptions.insert_many(batch, ordered=False)
+
+
+async def measure(db, size: int) -> dict:
+    timings = []
+    for _ in range(PROBES):
+        n = random.randrange(size * 2)  # metade acerta, metade não existe
+        probe = make_subscription(n)
+        started = time.perf_counter()
+        await check_duplicate_registration(
+            db, probe["name"], probe["email"], probe["cpf"],
+            probe["phone"], probe["car_plate"], probe["license_number"]
+        )
+        timings.append((time.perf_counter() - started) * 1000)
+
+    explain = await db.command(
+        "explain",
+        {"find": "subscriptions", "filter": {"$or": [{"email_lower": "nobody@bench.example.com"}, {"name_normalized": "ninguem"}]}},
+        verbosity="executionStats"
+    )
+    timings.sort()
+    return {
+        "size": size,
+        "median_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(timings[int(len(timings) * 0.95) - 1], 3),
+        "docs_examined": explain["executionStats"]["totalDocsExamined"],
+    }
+
+
+async def main():
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        await db.subscriptions.drop()
+        await ensure_indexes(db)
+        seeded = 0
+        for size in SIZES:
+            await seed(db, seeded, size)
+            seeded = size
+            result = await measure(db, size)
+            print(f"{result['size']:>8} subscriptions | mediana {result['median_ms']:>7} ms | "
+                  f"p95 {result['p95_ms']:>7} ms | docs examinados {result['docs_examined']}")
+    finally:
+        await db.subscriptions.drop()
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,108 @@
+"""
+Benchmark for /api/admin/financial-stats
+Seeds a scratch database with 100k subscriptions and compares the previous
+approach (load every paid subscription into Python and loop) with the
+server-side aggregation used by get_financial_stats
+
+Usage (from backend/):
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/bench_financial_stats.py
+"""
+
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'bench_financial_stats')
+
+from motor.motor_asyncio import AsyncIOMotorClient  # noqa: E402
+
+from server import financial_stats_pipeline  # noqa: E402
+
+SIZE = 100_000
+RUNS = 20
+BATCH = 10_000
+
+
+def make_subscription(n: int, now: datetime) -> dict:
+    subscription = {
+        "id": f"bench-{n}",
+        "status": random.choice(["paid", "active", "pending", "pending"]),
+        "subscription_date": (now - timedelta(days=random.randrange(120), minutes=random.randrange(1440))).isoformat(),
+        "original_price": random.choice([150, 150, 200]),
+    }
+    roll = random.random()
+    if roll < 0.1:
+        subscription["bonus"] = True
+    elif roll < 0.3:
+        subscription["discount"] = random.choice([10, 20, 50])
+    return subscription
+
+
+async def python_loop(db, now: datetime) -> dict:
+    """Previous implementation, without the 1000-document cap so the totals match"""
+    today = now.date()
+    week_start = today - timedelta(days=today.weekday())
+    month_start = today.replace(day=1)
+    totals = {"today": [0, 0], "week": [0, 0], "month": [0, 0]}
+    async for sub in db.subscriptions.find():
+        if sub.get('status') in ['paid', 'active']:
+            sub_date = datetime.fromisoformat(sub['subscription_date'].replace('Z', '+00:00')).date()
+            price = sub.get('original_price', 150)
+            if sub.get('bonus'):
+                revenue = 0
+            elif sub.get('discount'):
+                revenue = price * (1 - sub['discount'] / 100)
+            else:
+                revenue = price
+            for name, start in (("today", today), ("week", week_start), ("month", month_start)):
+                if sub_date >= start and (name != "today" or sub_date == today):
+                    totals[name][0] += 1
+                    totals[name][1] += revenue
+    return totals
+
+
+async def aggregation(db, now: datetime) -> dict:
+    rows = await db.subscriptions.aggregate(financial_stats_pipeline(now)).to_list(length=1)
+    row = rows[0] if rows else {}
+    return {name: [row.get(f"{name}_paid", 0), row.get(f"{name}_revenue", 0)] for name in ("today", "week", "month")}
+
+
+async def timed(fn, db, now: datetime):
+    timings = []
+    result = None
+    for _ in range(RUNS):
+        started = time.perf_counter()
+        result = await fn(db, now)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return result, round(statistics.median(timings), 2), round(timings[int(len(timings) * 0.95) - 1], 2)
+
+
+async def main():
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    now = datetime.now(timezone.utc)
+    try:
+        await db.subscriptions.drop()
+        for offset in range(0, SIZE, BATCH):
+            await db.subscriptions.insert_many(
+                [make_subscription(n, now) for n in range(offset, min(offset + BATCH, SIZE))], ordered=False
+            )
+
+        for label, fn in (("loop Python", python_loop), ("agregação", aggregation)):
+            result, median, p95 = await timed(fn, db, now)
+            print(f"{label:>12} | mediana {median:>8} ms | p95 {p95:>8} ms | {result}")
+    finally:
+        await db.subscriptions.drop()
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
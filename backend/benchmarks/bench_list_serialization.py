@@ -0,0 +1,85 @@
+"""
+Benchmark for list endpoint serialization
+Compares the per-request response work of the subscriptions list at 1k, 10k
+and 50k rows: the previous path (build UserSubscription objects, let FastAPI
+re-validate them against response_model and encode with json) against the
+trusted path (ModelCodec.dump + orjson). Documents are generated in memory
+so only the serialization cost is measured
+
+Usage (from backend/):
+    python benchmarks/bench_list_serialization.py
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'bench_list_serialization')
+
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_response_field  # noqa: E402
+
+from fast_json import trusted_json  # noqa: E402
+from server import UserSubscription, parse_from_mongo, subscription_codec  # noqa: E402
+
+SIZES = [1_000, 10_000, 50_000]
+RUNS = 5
+
+
+def make_document(n: int) -> dict:
+    created = datetime(2025, 1, 1, tzinfo=timezone.utc) + timedelta(minutes=n)
+    return {
+        "_id": uuid.uuid4().hex, "id": str(uuid.uuid4()), "name": f"Taxista Numero {n}",
+        "email": f"taxista{n}@bench.example.com", "phone": f"(27) 9{n:08d}", "cpf": f"{n:011d}",
+        "car_plate": f"BEN{n % 10000:04d}", "license_number": f"TA-{n:06d}", "city": "Vitória",
+        "status": "paid" if n % 3 else "pending", "course_access": "granted",
+        "temporary_password": "x", "lgpd_consent": True, "lgpd_consent_date": created,
+        "subscription_date": created, "created_at": created,
+    }
+
+
+def subscriptions_response_field():
+    # O mesmo campo que FastAPI monta para response_model=List[UserSubscription]
+    return create_response_field(name="Response_List_UserSubscription", type_=List[UserSubscription], mode="serialization")
+
+
+async def previous_path(documents, field) -> bytes:
+    models = [UserSubscription(**parse_from_mongo(document)) for document in documents]
+    content = await serialize_response(field=field, response_content=models)
+    return JSONResponse(content).body
+
+
+async def trusted_path(documents, field) -> bytes:
+    return trusted_json([subscription_codec.dump(document) for document in documents]).body
+
+
+async def timed(fn, documents, field):
+    timings = []
+    for _ in range(RUNS):
+        started = time.perf_counter()
+        body = await fn(documents, field)
+        timings.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(timings), 1), len(body)
+
+
+async def main():
+    field = subscriptions_response_field()
+    for size in SIZES:
+        documents = [make_document(n) for n in range(size)]
+        previous_ms, previous_bytes = await timed(previous_path, documents, field)
+        trusted_ms, trusted_bytes = await timed(trusted_path, documents, field)
+        print(f"{size:>7} linhas | anterior {previous_ms:>9} ms ({previous_bytes} bytes) | "
+              f"rápido {trusted_ms:>8} ms ({trusted_bytes} bytes) | {previous_ms / trusted_ms:.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
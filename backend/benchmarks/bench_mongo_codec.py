@@ -0,0 +1,80 @@
+"""
+Microbenchmark for the MongoDB document converters
+Measures the per-document cost of the recursive prepare_for_mongo /
+parse_from_mongo helpers against the per-model ModelCodec for the models
+served by the list endpoints. No database is needed
+
+Usage (from backend/):
+    python benchmarks/bench_mongo_codec.py
+"""
+
+import os
+import sys
+import timeit
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'bench_mongo_codec')
+
+from server import (  # noqa: E402
+    ChatMessage, Course, StatusCheck, UserSubscription,
+    chat_message_codec, course_codec, parse_from_mongo, prepare_for_mongo,
+    status_check_codec, subscription_codec,
+)
+
+NUMBER = 20_000
+
+
+def stored_subscription() -> dict:
+    now = datetime.now(timezone.utc)
+    return {
+        "_id": uuid.uuid4().hex, "id": str(uuid.uuid4()), "name": "Taxista Exemplo",
+        "email": "taxista@example.com", "phone": "(27) 99999-0000", "cpf": "52998224725",
+        "car_plate": "ABC1234", "license_number": "TA-123456", "city": "Vitória",
+        "status": "paid", "course_access": "granted", "temporary_password": "x",
+        "lgpd_consent": True, "lgpd_consent_date": now, "subscription_date": now, "created_at": now,
+        "name_normalized": "taxista exemplo", "email_lower": "taxista@example.com",
+        "cpf_digits": "52998224725", "phone_digits": "5527999990000", "phone_suffix": "99990000",
+        "plate_norm": "ABC1234", "license_norm": "TA123456", "lookup_version": 3,
+        "asaas_payment_id": "pay_123", "payment_confirmed_at": now,
+    }
+
+
+CASES = [
+    ("UserSubscription", UserSubscription, subscription_codec, stored_subscription()),
+    ("ChatMessage", ChatMessage, chat_message_codec, {
+        "_id": "x", "id": "1", "session_id": "s", "user_message": "oi", "bot_response": "olá",
+        "timestamp": datetime.now(timezone.utc)
+    }),
+    ("StatusCheck", StatusCheck, status_check_codec, {
+        "_id": "x", "id": "1", "client_name": "c", "timestamp": datetime.now(timezone.utc)
+    }),
+    ("Course", Course, course_codec, {
+        "_id": "x", "id": "1", "name": "Curso", "description": "d", "price": 150.0,
+        "duration_hours": 28, "category": "obrigatorio", "active": True,
+        "created_at": datetime.now(timezone.utc)
+    }),
+]
+
+
+def per_document_us(statement) -> float:
+    return round(min(timeit.repeat(statement, number=NUMBER, repeat=5)) / NUMBER * 1_000_000, 3)
+
+
+def main():
+    print(f"{'modelo':>16} | {'operação':>10} | {'genérico µs':>11} | {'codec µs':>9}")
+    for label, model, codec, document in CASES:
+        rows = [
+            ("escrita", lambda: prepare_for_mongo(document), lambda: codec.to_mongo(document)),
+            ("leitura", lambda: parse_from_mongo(document), lambda: codec.from_mongo(document)),
+            ("modelo", lambda: model(**parse_from_mongo(document)), lambda: codec.load(document)),
+        ]
+        for operation, generic, compiled in rows:
+            print(f"{label:>16} | {operation:>10} | {per_document_us(generic):>11} | {per_document_us(compiled):>9}")
+
+
+if __name__ == "__main__":
+    main()
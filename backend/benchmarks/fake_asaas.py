@@ -0,0 +1,100 @@
+"""
+Local fake of the Asaas API (v3) for offline benchmarks
+Implements the endpoints the platform uses with a configurable artificial
+latency, so the HTTP client can be measured without the sandbox
+
+Usage (from backend/):
+    FAKE_ASAAS_LATENCY_MS=80 python benchmarks/fake_asaas.py  # http://127.0.0.1:8765
+"""
+
+import asyncio
+import base64
+import os
+import uuid
+from datetime import datetime, timedelta
+
+from fastapi import FastAPI, HTTPException, Request
+
+LATENCY_SECONDS = float(os.environ.get('FAKE_ASAAS_LATENCY_MS', '50')) / 1000
+
+app = FastAPI(title="Fake Asaas")
+customers = {}
+payments = {}
+
+
+async def simulate_latency():
+    if LATENCY_SECONDS:
+        await asyncio.sleep(LATENCY_SECONDS)
+
+
+def check_token(request: Request):
+    if not request.headers.get("access_token"):
+        raise HTTPException(status_code=401, detail="access_token ausente")
+
+
+@app.post("/customers")
+async def create_customer(request: Request):
+    check_token(request)
+    await simulate_latency()
+    data = await request.json()
+    customer = {"object": "customer", "id": f"cus_{uuid.uuid4().hex[:12]}", **data}
+    customers[customer["id"]] = customer
+    return customer
+
+
+@app.get("/customers")
+async def list_customers(request: Request, cpfCnpj: str = ""):
+    check_token(request)
+    await simulate_latency()
+    found = [customer for customer in customers.values() if customer.get("cpfCnpj") == cpfCnpj]
+    return {"object": "list", "totalCount": len(found), "data": found}
+
+
+@app.post("/payments")
+async def create_payment(request: Request):
+    check_token(request)
+    await simulate_latency()
+    data = await request.json()
+    if data.get("customer") not in customers:
+        raise HTTPException(status_code=400, detail="Cliente inexistente")
+    payment = {
+        "object": "payment",
+        "id": f"pay_{uuid.uuid4().hex[:12]}",
+        "status": "PENDING",
+        "dueDate": data.get("dueDate") or (datetime.now() + timedelta(days=7)).strftime('%Y-%m-%d'),
+        "invoiceUrl": "https://sandbox.asaas.com/i/fake",
+        **data,
+    }
+    payments[payment["id"]] = payment
+    return payment
+
+
+@app.get("/payments/{payment_id}")
+async def get_payment(payment_id: str, request: Request):
+    check_token(request)
+    await simulate_latency()
+    if payment_id not in payments:
+        raise HTTPException(status_code=404, detail="Cobrança não encontrada")
+    return payments[payment_id]
+
+
+@app.get("/payments/{payment_id}/pixQrCode")
+async def get_pix_qrcode(payment_id: str, request: Request):
+    check_token(request)
+    # O QR Code é a chamada mais lenta da Asaas
+    await simulate_latency()
+    await simulate_latency()
+    if payment_id not in payments:
+        raise HTTPException(status_code=404, detail="Cobrança não encontrada")
+    payload = f"00020126580014br.gov.bcb.pix0136{payment_id}5204000053039865802BR6007VITORIA6304ABCD"
+    return {
+        "encodedImage": base64.b64encode(os.urandom(4096)).decode(),
+        "payload": payload,
+        "expirationDate": (datetime.now() + timedelta(days=7)).strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host="127.0.0.1", port=int(os.environ.get('FAKE_ASAAS_PORT', '8765')), log_level="warning")
@@ -0,0 +1,188 @@
+"""
+In-memory course catalog snapshot
+Course modules, videos and question counts change rarely but are read on every
+portal load. The catalog is precomputed into one versioned document, persisted
+in MongoDB for the other workers and served from process memory.
+Writers to the course collections bump `source_version` on that document;
+a build records the source version it started from and is only published
+if no write landed while it was loading, so a version never carries older
+content than a version before it
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+CATALOG_SNAPSHOT_ID = "course_catalog"
+DIFFICULTIES = ("facil", "media", "dificil")
+
+
+async def mark_catalog_changed(db):
+    """Record a write to course_modules, course_videos or questions"""
+    await db.catalog_snapshots.update_one(
+        {"_id": CATALOG_SNAPSHOT_ID},
+        {"$inc": {"source_version": 1}},
+        upsert=True
+    )
+
+
+class CatalogSnapshot:
+    def __init__(self, document: Dict[str, Any]):
+        self.version: int = document.get("version", 0)
+        self.built_at: Optional[datetime] = document.get("built_at")
+        self.modules: List[Dict[str, Any]] = document.get("modules", [])
+        self.videos_by_module: Dict[str, List[Dict[str, Any]]] = document.get("videos_by_module", {})
+        self.question_counts: Dict[str, Dict[str, int]] = document.get("question_counts", {})
+
+
+async def build_catalog_document(db) -> Dict[str, Any]:
+    """Read the course collections and precompute the catalog document"""
+    modules = await db.course_modules.find({"active": True}).sort("order", 1).to_list(length=None)
+
+    videos_by_module: Dict[str, List[Dict[str, Any]]] = {}
+    async for video in db.course_videos.find({}).sort([("module_id", 1), ("order", 1)]):
+        if not video.get("module_id"):
+            continue
+        video["_id"] = str(video["_id"])
+        videos_by_module.setdefault(str(video["module_id"]), []).append(video)
+
+    question_counts: Dict[str, Dict[str, int]] = {}
+    pipeline = [{"$group": {"_id": {"module_id": "$module_id", "difficulty": "$difficulty"}, "count": {"$sum": 1}}}]
+    async for row in db.questions.aggregate(pipeline):
+        if not row["_id"].get("module_id"):
+            continue
+        counts = question_counts.setdefault(str(row["_id"]["module_id"]), {**{d: 0 for d in DIFFICULTIES}, "total": 0})
+        difficulty = row["_id"].get("difficulty")
+        if difficulty in DIFFICULTIES:
+            counts[difficulty] += row["count"]
+        counts["total"] += row["count"]
+
+    catalog_modules = []
+    for module in modules:
+        module_id = module.get("id")
+        catalog_modules.append({
+            "id": module_id,
+            "name": module.get("name", ""),
+            "description": module.get("description", ""),
+            "duration_hours": module.get("duration_hours", 0),
+            "color": module.get("color", "#3b82f6"),
+            "question_count": question_counts.get(module_id, {}).get("total", 0),
+            "videos": [
+                {
+                    "id": video.get("id"),
+                    "title": video.get("title", ""),
+                    "description": video.get("description", ""),
+                    "youtube_url": video.get("youtube_url", ""),
+                    "duration_minutes": video.get("duration_minutes", 0),
+                    "created_at": video.get("created_at")
+                }
+                for video in videos_by_module.get(module_id, [])
+            ]
+        })
+
+    return {
+        "modules": catalog_modules,
+        "videos_by_module": videos_by_module,
+        "question_counts": question_counts,
+    }
+
+
+class CourseCatalog:
+    """Process-local holder of the latest catalog snapshot"""
+
+    def __init__(self, refresh_interval: float = 30.0):
+        self.refresh_interval = refresh_interval
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version if self._snapshot else 0
+
+    async def rebuild(self, db, attempts: int = 3) -> CatalogSnapshot:
+        """Recompute the snapshot and publish a new version (redone if the source changes meanwhile)"""
+        async with self._lock:
+            for _ in range(attempts):
+                marker = await db.catalog_snapshots.find_one({"_id": CATALOG_SNAPSHOT_ID}, {"source_version": 1})
+                if marker is not None and "source_version" in marker:
+                    source_filter = {"source_version": marker["source_version"]}
+                else:
+                    source_filter = {"source_version": {"$exists": False}}
+                document = await build_catalog_document(db)
+                document["built_at"] = datetime.now(timezone.utc)
+                document["built_from"] = (marker or {}).get("source_version", 0)
+                try:
+                    stored = await db.catalog_snapshots.find_one_and_update(
+                        {"_id": CATALOG_SNAPSHOT_ID, **source_filter},
+                        {"$set": document, "$inc": {"version": 1}},
+                        upsert=marker is None,
+                        return_document=ReturnDocument.AFTER
+                    )
+                except DuplicateKeyError:
+                    stored = None
+                if stored is not None:
+                    self._snapshot = CatalogSnapshot(stored)
+                    self._checked_at = time.monotonic()
+                    logger.info(f"✅ Catálogo de cursos reconstruído (versão {self._snapshot.version})")
+                    return self._snapshot
+                logger.info("🔄 Catálogo alterado durante a reconstrução, recomeçando")
+
+            # Escritas seguidas: quem escreveu por último publica; fica com o que está no banco
+            snapshot = await self._load(db)
+            if snapshot is None:
+                raise RuntimeError("catálogo de cursos não publicado")
+            self._snapshot = snapshot
+            self._checked_at = time.monotonic()
+            return snapshot
+
+    async def changed(self, db) -> CatalogSnapshot:
+        """Record a write to the course collections and publish a fresh snapshot"""
+        await mark_catalog_changed(db)
+        return await self.rebuild(db)
+
+    async def _load(self, db) -> Optional[CatalogSnapshot]:
+        stored = await db.catalog_snapshots.find_one({"_id": CATALOG_SNAPSHOT_ID})
+        return CatalogSnapshot(stored) if stored else None
+
+    async def _refresh_if_newer(self, db):
+        """Pick up a snapshot published by another worker"""
+        try:
+            stored = await db.catalog_snapshots.find_one(
+                {"_id": CATALOG_SNAPSHOT_ID}, {"version": 1, "source_version": 1, "built_from": 1}
+            )
+            if stored and stored.get("source_version", 0) > stored.get("built_from", 0):
+                # Escrita sem reconstrução (seed, processo que caiu no meio): reconstrói aqui
+                await self.rebuild(db)
+            elif stored and stored.get("version", 0) > self.version:
+                snapshot = await self._load(db)
+                if snapshot and snapshot.version > self.version:
+                    self._snapshot = snapshot
+                    logger.info(f"🔄 Catálogo de cursos atualizado para a versão {snapshot.version}")
+        except Exception as e:
+            logger.error(f"❌ Erro ao verificar versão do catálogo: {e}")
+
+    async def get(self, db) -> CatalogSnapshot:
+        """Current snapshot; the version check against MongoDB runs in the background"""
+        if self._snapshot is None:
+            async with self._lock:
+                if self._snapshot is None:
+                    self._snapshot = await self._load(db)
+                    self._checked_at = time.monotonic()
+            if self._snapshot is None:
+                return await self.rebuild(db)
+
+        if time.monotonic() - self._checked_at > self.refresh_interval and not (
+            self._refresh_task and not self._refresh_task.done()
+        ):
+            self._checked_at = time.monotonic()
+            self._refresh_task = asyncio.create_task(self._refresh_if_newer(db))
+        return self._snapshot
@@ -0,0 +1,148 @@
+"""
+Per-city, per-status subscription counters
+The city_stats collection holds one document per (canonical city, status)
+pair, kept up to date with atomic $inc operations on every subscription
+write, so the city dashboards read a handful of documents instead of
+grouping the whole subscriptions collection
+
+Usage (from backend/), to rebuild the rollup from scratch:
+    python city_rollup.py
+"""
+
+import asyncio
+import logging
+import os
+import unicodedata
+import uuid
+from typing import Any, Dict, List, Optional
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_COLLECTION = "city_stats"
+# Campos da inscrição que o rollup precisa para calcular a diferença de uma escrita
+ROLLUP_PROJECTION = {"_id": 0, "city": 1, "status": 1}
+
+
+def canonical_city(city: Optional[str]) -> Optional[str]:
+    """Accent-free, lowercase city key ("Vitória " and "vitoria" are the same city)"""
+    if not city:
+        return None
+    folded = unicodedata.normalize("NFKD", str(city))
+    folded = "".join(char for char in folded if not unicodedata.combining(char))
+    return " ".join(folded.lower().split()) or None
+
+
+def _rollup_key(city: Optional[str], status: Optional[str]):
+    city_key = canonical_city(city)
+    if not city_key:
+        return None
+    return {"city_key": city_key, "status": status or "pending"}
+
+
+def _increment(city: str, status: Optional[str], amount: int) -> Optional[UpdateOne]:
+    key = _rollup_key(city, status)
+    if key is None:
+        return None
+    return UpdateOne(
+        {"_id": f"{key['city_key']}|{key['status']}"},
+        {
+            "$inc": {"count": amount},
+            "$set": {"city_key": key["city_key"], "status": key["status"]},
+            "$setOnInsert": {"city": " ".join(str(city).split())}
+        },
+        upsert=True
+    )
+
+
+async def apply_subscription_change(db, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]):
+    """Move one subscription between rollup buckets (before=None: created, after=None: deleted)"""
+    old_key = _rollup_key(before.get("city"), before.get("status")) if before else None
+    new_key = _rollup_key(after.get("city"), after.get("status")) if after else None
+    if old_key == new_key:
+        return
+
+    operations = [op for op in (
+        _increment(before.get("city"), before.get("status"), -1) if old_key else None,
+        _increment(after.get("city"), after.get("status"), 1) if new_key else None,
+    ) if op is not None]
+    try:
+        await db[ROLLUP_COLLECTION].bulk_write(operations, ordered=False)
+    except Exception as e:
+        # A escrita principal já foi feita; a reconciliação corrige o contador
+        logger.error(f"❌ Erro ao atualizar estatísticas por cidade: {e}")
+
+
+async def rebuild_city_rollup(db) -> int:
+    """Recompute the rollup from the subscriptions collection"""
+    pipeline = [{"$group": {"_id": {"city": "$city", "status": "$status"}, "count": {"$sum": 1}}}]
+    buckets: Dict[str, Dict[str, Any]] = {}
+    async for row in db.subscriptions.aggregate(pipeline):
+        city = row["_id"].get("city")
+        key = _rollup_key(city, row["_id"].get("status"))
+        if key is None:
+            continue
+        bucket_id = f"{key['city_key']}|{key['status']}"
+        bucket = buckets.setdefault(bucket_id, {"_id": bucket_id, **key, "city": " ".join(str(city).split()), "count": 0})
+        bucket["count"] += row["count"]
+
+    # Monta em coleção temporária e troca de uma vez para não expor um rollup pela metade;
+    # nome único por execução: workers reconstruindo juntos não pisam na mesma coleção
+    if buckets:
+        staging = db[f"{ROLLUP_COLLECTION}_rebuild_{uuid.uuid4().hex}"]
+        try:
+            await staging.insert_many(list(buckets.values()))
+            await staging.rename(ROLLUP_COLLECTION, dropTarget=True)
+        finally:
+            await staging.drop()
+    else:
+        await db[ROLLUP_COLLECTION].delete_many({})
+
+    logger.info(f"✅ Estatísticas por cidade reconstruídas ({len(buckets)} grupos)")
+    return len(buckets)
+
+
+async def ensure_city_rollup(db):
+    """Build the rollup on first start when subscriptions already exist"""
+    if await db[ROLLUP_COLLECTION].find_one({}, {"_id": 1}):
+        return
+    if await db.subscriptions.find_one({}, {"_id": 1}):
+        await rebuild_city_rollup(db)
+
+
+async def read_city_stats(db) -> List[Dict[str, Any]]:
+    """Per-city totals with paid and pending counts, largest cities first"""
+    cities: Dict[str, Dict[str, Any]] = {}
+    async for bucket in db[ROLLUP_COLLECTION].find({"count": {"$gt": 0}}):
+        city = cities.setdefault(bucket["city_key"], {
+            "city": bucket.get("city"), "total": 0, "paid": 0, "pending": 0, "_largest": 0
+        })
+        city["total"] += bucket["count"]
+        if bucket["status"] in ("paid", "pending"):
+            city[bucket["status"]] += bucket["count"]
+        # Exibe a grafia do grupo mais numeroso
+        if bucket["count"] > city["_largest"]:
+            city["_largest"] = bucket["count"]
+            city["city"] = bucket.get("city")
+
+    stats = []
+    for city in cities.values():
+        city.pop("_largest")
+        stats.append(city)
+    stats.sort(key=lambda city: city["total"], reverse=True)
+    return stats
+
+
+if __name__ == "__main__":
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    async def main():
+        client = AsyncIOMotorClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+        try:
+            print(await rebuild_city_rollup(client[os.environ.get('DB_NAME', 'test_database')]))
+        finally:
+            client.close()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,141 @@
+"""
+Migration of ISO-string timestamps to native BSON dates
+Older documents stored datetimes as ISO strings, which sort lexically and
+cannot serve date range queries. The migration walks each collection in
+_id order, converts string date fields in batches and records a checkpoint
+after every batch, so an interrupted run resumes where it stopped
+
+Usage (from backend/):
+    python date_migration.py
+"""
+
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_ID = "native_dates"
+
+# Campos de data gravados como string ISO por versões anteriores
+DATE_FIELDS: Dict[str, List[str]] = {
+    "subscriptions": [
+        "subscription_date", "created_at", "lgpd_consent_date",
+        "payment_created_at", "payment_confirmed_at", "updated_at"
+    ],
+    "asaas_payments": ["created_at", "updated_at", "processed_at"],
+    "users": ["created_at", "updated_at"],
+    "admin_users": ["created_at", "updated_at", "last_login"],
+    "courses": ["created_at", "updated_at"],
+    "exams": ["created_at"],
+    "status_checks": ["timestamp"],
+    "chat_messages": ["timestamp"],
+}
+
+
+def parse_iso_datetime(value: str) -> Optional[datetime]:
+    """Parse an ISO-8601 string into an aware UTC datetime (None when not a date)"""
+    try:
+        parsed = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    except (ValueError, AttributeError):
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def _string_date_filter(fields: List[str]) -> Dict[str, Any]:
+    return {"$or": [{field: {"$type": "string"}} for field in fields]}
+
+
+async def migrate_collection(db, collection_name: str, fields: List[str], batch_size: int = 500) -> int:
+    """Convert string dates in one collection, resuming from the stored checkpoint"""
+    checkpoint_id = f"{MIGRATION_ID}:{collection_name}"
+    checkpoint = await db.migrations.find_one({"_id": checkpoint_id}) or {}
+    if checkpoint.get("completed"):
+        return 0
+
+    query = _string_date_filter(fields)
+    if checkpoint.get("last_id") is not None:
+        query = {"$and": [query, {"_id": {"$gt": checkpoint["last_id"]}}]}
+
+    projection = {field: 1 for field in fields}
+    converted = checkpoint.get("converted", 0)
+    migrated_now = 0
+    operations = []
+    last_id = None
+
+    async def flush():
+        nonlocal operations
+        if operations:
+            await db[collection_name].bulk_write(operations, ordered=False)
+        await db.migrations.update_one(
+            {"_id": checkpoint_id},
+            {"$set": {"last_id": last_id, "converted": converted, "updated_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+        operations = []
+
+    cursor = db[collection_name].find(query, projection).sort("_id", 1).batch_size(batch_size)
+    async for document in cursor:
+        last_id = document["_id"]
+        updates = {}
+        for field in fields:
+            value = document.get(field)
+            if isinstance(value, str):
+                parsed = parse_iso_datetime(value)
+                if parsed is not None:
+                    updates[field] = parsed
+        if updates:
+            operations.append(UpdateOne({"_id": document["_id"], **{f: document[f] for f in updates}}, {"$set": updates}))
+            converted += 1
+            migrated_now += 1
+        if len(operations) >= batch_size:
+            await flush()
+
+    if last_id is not None:
+        await flush()
+    await db.migrations.update_one(
+        {"_id": checkpoint_id},
+        {"$set": {"completed": True, "converted": converted, "updated_at": datetime.now(timezone.utc)}},
+        upsert=True
+    )
+    if migrated_now:
+        logger.info(f"✅ {collection_name}: {migrated_now} documentos com datas convertidas para BSON")
+    return migrated_now
+
+
+async def migrate_string_dates(db, batch_size: int = 500) -> Dict[str, int]:
+    """Run the date migration over every known collection"""
+    report = {}
+    for collection_name, fields in DATE_FIELDS.items():
+        report[collection_name] = await migrate_collection(db, collection_name, fields, batch_size)
+    return report
+
+
+async def reset_migration(db):
+    """Forget checkpoints so the next run scans every collection again"""
+    await db.migrations.delete_many({"_id": {"$regex": f"^{MIGRATION_ID}:"}})
+
+
+if __name__ == "__main__":
+    import sys
+
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    async def main():
+        client = AsyncIOMotorClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'), tz_aware=True)
+        db = client[os.environ.get('DB_NAME', 'test_database')]
+        try:
+            if "--reset" in sys.argv:
+                await reset_migration(db)
+            print(await migrate_string_dates(db))
+        finally:
+            client.close()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,142 @@
+"""
+MongoDB index bootstrap for the EAD platform
+Creates and verifies the indexes behind the hot lookups and backfills the
+normalized lookup fields of existing subscriptions
+"""
+
+import asyncio
+import logging
+import os
+from typing import Any, Dict, List
+
+from pymongo import ASCENDING, DESCENDING, IndexModel, UpdateOne
+
+from lookup_fields import LOOKUP_FIELDS_VERSION, build_lookup_fields
+
+logger = logging.getLogger(__name__)
+
+# Indexes are not unique on purpose: legacy data may hold duplicates and a
+# failing unique build would block startup. Uniqueness stays enforced by the
+# duplicate check at registration time.
+INDEX_SPECS: Dict[str, List[IndexModel]] = {
+    "subscriptions": [
+        IndexModel([("id", ASCENDING)], name="id_1"),
+        IndexModel([("email_lower", ASCENDING)], name="email_lower_1"),
+        IndexModel([("name_normalized", ASCENDING)], name="name_normalized_1"),
+        IndexModel([("cpf_digits", ASCENDING)], name="cpf_digits_1"),
+        IndexModel([("phone_digits", ASCENDING)], name="phone_digits_1"),
+        IndexModel([("phone_suffix", ASCENDING)], name="phone_suffix_1"),
+        IndexModel([("plate_norm", ASCENDING)], name="plate_norm_1", sparse=True),
+        IndexModel([("license_norm", ASCENDING)], name="license_norm_1", sparse=True),
+        IndexModel([("asaas_payment_id", ASCENDING)], name="asaas_payment_id_1", sparse=True),
+        IndexModel([("status", ASCENDING)], name="status_1"),
+        IndexModel([("city", ASCENDING)], name="city_1"),
+        IndexModel([("created_at", ASCENDING), ("_id", ASCENDING)], name="created_at_1__id_1"),
+        IndexModel([("lookup_version", ASCENDING)], name="lookup_version_1"),
+        IndexModel([("status", ASCENDING), ("subscription_date", ASCENDING)], name="status_1_subscription_date_1"),
+        IndexModel([("status", ASCENDING), ("created_at", ASCENDING)], name="status_1_created_at_1"),
+        IndexModel([("payment_confirmed_at", ASCENDING)], name="payment_confirmed_at_1", sparse=True),
+    ],
+    "asaas_payments": [
+        IndexModel([("asaas_payment_id", ASCENDING)], name="asaas_payment_id_1"),
+        IndexModel([("user_email", ASCENDING)], name="user_email_1"),
+        IndexModel([("id", ASCENDING)], name="id_1"),
+        IndexModel([("created_at", ASCENDING), ("_id", ASCENDING)], name="created_at_1__id_1"),
+        IndexModel([("status", ASCENDING), ("created_at", ASCENDING)], name="status_1_created_at_1"),
+        IndexModel([("cpf_digits", ASCENDING), ("created_at", DESCENDING)], name="cpf_digits_1_created_at_-1", sparse=True),
+    ],
+    "chat_messages": [
+        IndexModel([("session_id", ASCENDING), ("timestamp", DESCENDING)], name="session_id_1_timestamp_-1"),
+    ],
+    "course_videos": [
+        IndexModel([("module_id", ASCENDING), ("order", ASCENDING)], name="module_id_1_order_1"),
+        IndexModel([("id", ASCENDING)], name="id_1"),
+    ],
+    "questions": [
+        IndexModel([("module_id", ASCENDING)], name="module_id_1"),
+        IndexModel([("id", ASCENDING)], name="id_1"),
+    ],
+    "user_progress": [
+        IndexModel([("user_id", ASCENDING), ("module_id", ASCENDING)], name="user_id_1_module_id_1"),
+    ],
+    "webhook_inbox": [
+        # Único de propósito (coleção nova, sem legado): barra reentregas da Asaas
+        IndexModel([("idempotency_key", ASCENDING)], name="idempotency_key_1", unique=True),
+        IndexModel([("status", ASCENDING), ("available_at", ASCENDING)], name="status_1_available_at_1"),
+        # Cada partição pega o evento mais antigo dos seus slots (ordem de chegada)
+        IndexModel([("status", ASCENDING), ("slot", ASCENDING), ("received_at", ASCENDING)], name="status_1_slot_1_received_at_1"),
+        IndexModel([("payment_id", ASCENDING), ("received_at", ASCENDING)], name="payment_id_1_received_at_1"),
+        # Eventos brutos ficam 90 dias para reprocessamento e auditoria
+        IndexModel([("received_at", ASCENDING)], name="received_at_1", expireAfterSeconds=90 * 24 * 3600),
+    ],
+}
+
+
+async def ensure_indexes(db) -> Dict[str, Any]:
+    """Create the declared indexes and verify they exist afterwards"""
+    report = {}
+    for collection_name, indexes in INDEX_SPECS.items():
+        collection = db[collection_name]
+        expected = [index.document["name"] for index in indexes]
+        try:
+            await collection.create_indexes(indexes)
+            existing = await collection.index_information()
+            missing = [name for name in expected if name not in existing]
+            report[collection_name] = {"ok": not missing, "missing": missing}
+            if missing:
+                logger.warning(f"⚠️ Índices ausentes em {collection_name}: {missing}")
+        except Exception as e:
+            logger.error(f"❌ Erro ao criar índices em {collection_name}: {e}")
+            report[collection_name] = {"ok": False, "missing": expected, "error": str(e)}
+    return report
+
+
+async def backfill_lookup_fields(db, batch_size: int = 500) -> int:
+    """Write the normalized lookup fields on subscriptions that lack them"""
+    projection = {"name": 1, "email": 1, "cpf": 1, "phone": 1, "car_plate": 1, "license_number": 1}
+    cursor = db.subscriptions.find(
+        {"lookup_version": {"$ne": LOOKUP_FIELDS_VERSION}},
+        projection
+    ).batch_size(batch_size)
+
+    updated = 0
+    operations = []
+    async for subscription in cursor:
+        operations.append(UpdateOne(
+            {"_id": subscription["_id"]},
+            {"$set": build_lookup_fields(subscription)}
+        ))
+        if len(operations) >= batch_size:
+            result = await db.subscriptions.bulk_write(operations, ordered=False)
+            updated += result.modified_count
+            operations = []
+
+    if operations:
+        result = await db.subscriptions.bulk_write(operations, ordered=False)
+        updated += result.modified_count
+
+    if updated:
+        logger.info(f"✅ Campos normalizados preenchidos em {updated} inscrições")
+    return updated
+
+
+async def bootstrap_database(db) -> Dict[str, Any]:
+    """Backfill lookup fields and make sure every index is in place"""
+    backfilled = await backfill_lookup_fields(db)
+    report = await ensure_indexes(db)
+    return {"backfilled": backfilled, "indexes": report}
+
+
+if __name__ == "__main__":
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    async def main():
+        client = AsyncIOMotorClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+        try:
+            result = await bootstrap_database(client[os.environ.get('DB_NAME', 'test_database')])
+            print(result)
+        finally:
+            client.close()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,77 @@
+"""
+Fast JSON responses
+orjson-based response classes plus a trusted path for list endpoints:
+documents already shaped by a ModelCodec are serialized directly, without
+building Pydantic objects and running jsonable_encoder on them again
+
+JSON_RESPONSE_CLASS selects the app-wide default response class
+("orjson" or "json"); orjson falls back to the standard library when the
+package is not installed
+"""
+
+import json
+import logging
+import os
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Optional, Type
+
+from bson import ObjectId
+from fastapi import Response
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson é opcional
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+
+def _default(value: Any):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Tipo não serializável em JSON: {type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """Serialize to JSON bytes (orjson when available, same datetime format as Pydantic)"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def trusted_json(content: Any, response: Optional[Response] = None, status_code: int = 200) -> Response:
+    """Serialize already-shaped content as-is, skipping response_model validation
+
+    Headers set on the injected `response` parameter (e.g. X-Next-Cursor) are
+    carried over, since FastAPI ignores it when a Response is returned.
+    """
+    headers = dict(response.headers) if response is not None else None
+    if headers:
+        headers.pop("content-length", None)
+    return Response(content=dumps(content), status_code=status_code, media_type="application/json", headers=headers)
+
+
+def resolve_default_response_class() -> Type[JSONResponse]:
+    """Response class configured by JSON_RESPONSE_CLASS (orjson by default)"""
+    choice = os.environ.get('JSON_RESPONSE_CLASS', 'orjson').lower()
+    if choice == "json":
+        return JSONResponse
+    if choice != "orjson":
+        logger.warning(f"⚠️ JSON_RESPONSE_CLASS inválido ({choice}), usando orjson")
+    if orjson is None:
+        logger.warning("⚠️ orjson não instalado, usando JSONResponse padrão")
+        return JSONResponse
+    return FastJSONResponse
@@ -0,0 +1,114 @@
+"""
+Conditional GET support for read-mostly endpoints
+Collection version counters bump on every write; responses are cached per
+route together with the versions they were built from and carry a
+content-hash ETag, so repeat visits are answered with 304 Not Modified
+"""
+
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, Tuple
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+# Sem max-age: o navegador sempre revalida, mas com If-None-Match
+CACHE_CONTROL = "no-cache"
+
+
+class CollectionVersions:
+    """Per-collection write counters stored in collection_versions and cached in-process"""
+
+    def __init__(self, ttl: float = 2.0):
+        self.ttl = ttl
+        self._versions: Dict[str, int] = {}
+        self._fetched_at: Dict[str, float] = {}
+
+    async def bump(self, db, *names: str):
+        """Record a write on the given collections"""
+        for name in names:
+            try:
+                stored = await db.collection_versions.find_one_and_update(
+                    {"_id": name},
+                    {"$inc": {"version": 1}},
+                    upsert=True,
+                    return_document=True
+                )
+                self._versions[name] = stored["version"]
+                self._fetched_at[name] = time.monotonic()
+            except Exception as e:
+                # Sem o contador o cache expira pelo TTL; a escrita principal já foi feita
+                logger.error(f"❌ Erro ao incrementar versão de {name}: {e}")
+                self._fetched_at.pop(name, None)
+
+    async def get(self, db, names: Iterable[str]) -> Tuple[int, ...]:
+        """Current versions, re-read from MongoDB at most once per TTL"""
+        names = tuple(names)
+        now = time.monotonic()
+        stale = [name for name in names if now - self._fetched_at.get(name, float("-inf")) > self.ttl]
+        if stale:
+            async for stored in db.collection_versions.find({"_id": {"$in": stale}}):
+                self._versions[stored["_id"]] = stored.get("version", 0)
+            for name in stale:
+                self._fetched_at[name] = now
+        return tuple(self._versions.get(name, 0) for name in names)
+
+
+class _CachedBody:
+    def __init__(self, versions: Tuple[Any, ...], body: bytes):
+        self.versions = versions
+        self.body = body
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+class ConditionalResponder:
+    """Build JSON responses once per data version and answer revalidations with 304"""
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, _CachedBody]" = OrderedDict()
+
+    def invalidate(self, prefix: str = ""):
+        for key in [key for key in self._entries if key.startswith(prefix)]:
+            del self._entries[key]
+
+    async def respond(
+        self,
+        request: Request,
+        key: str,
+        versions: Tuple[Any, ...],
+        build: Callable[[], Awaitable[Any]]
+    ) -> Response:
+        """Serve `build()` as JSON with an ETag, reusing the body while versions are unchanged
+
+        A build that raises caches nothing: the error reaches the caller and
+        the next request builds again
+        """
+        entry = self._entries.get(key)
+        if entry is None or entry.versions != versions:
+            content = await build()
+            body = JSONResponse(content=jsonable_encoder(content)).body
+            entry = _CachedBody(versions, body)
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(key)
+
+        headers = {"ETag": entry.etag, "Cache-Control": CACHE_CONTROL}
+        if _etag_matches(request, entry.etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry.body, media_type="application/json", headers=headers)
@@ -0,0 +1,108 @@
+"""
+Normalized lookup fields for subscriptions
+Builds the shadow fields that let hot queries use exact indexed equality
+instead of case-insensitive regex scans
+"""
+
+import re
+from typing import Any, Dict, Optional
+
+# Bump whenever the shape of the shadow fields changes so the backfill
+# re-processes documents written by an older version
+LOOKUP_FIELDS_VERSION = 3
+
+
+def normalize_email(email: Optional[str]) -> Optional[str]:
+    """Lowercase and strip an email address"""
+    if not email:
+        return None
+    return str(email).strip().lower()
+
+
+def digits_only(value: Optional[str]) -> Optional[str]:
+    """Keep only the digits of a value (CPF, phone)"""
+    if not value:
+        return None
+    digits = re.sub(r'[^\d]', '', str(value))
+    return digits or None
+
+
+def normalize_phone(phone: Optional[str]) -> Dict[str, Optional[str]]:
+    """
+    Canonicalize a Brazilian phone number.
+
+    Returns ``phone_digits`` (E.164 digits, e.g. 5527999998888, when the DDD is
+    known; the bare local number otherwise), ``phone_local`` (number without
+    country code and DDD) and ``phone_suffix`` (last 8 digits, which survive
+    the mobile ninth-digit prefix and a missing DDD).
+    """
+    digits = digits_only(phone)
+    if not digits:
+        return {"phone_digits": None, "phone_local": None, "phone_suffix": None}
+
+    if digits.startswith("00"):
+        digits = digits[2:]
+    if len(digits) in (12, 13) and digits.startswith("55"):
+        digits = digits[2:]
+    elif len(digits) in (11, 12) and digits.startswith("0"):
+        digits = digits[1:]  # prefixo de discagem 0 + DDD
+
+    if len(digits) in (10, 11):
+        local = digits[2:]
+        canonical = f"55{digits}"
+    else:
+        local = digits
+        canonical = digits
+
+    return {"phone_digits": canonical, "phone_local": local, "phone_suffix": local[-8:]}
+
+
+def phone_duplicate_query(phone: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Indexed query matching subscriptions that hold the same phone number"""
+    normalized = normalize_phone(phone)
+    if not normalized["phone_digits"]:
+        return None
+    if normalized["phone_digits"] != normalized["phone_local"]:
+        # Com DDD: mesmo número completo ou cadastro antigo sem DDD
+        return {"phone_digits": {"$in": [normalized["phone_digits"], normalized["phone_local"]]}}
+    # Sem DDD: qualquer número terminado nos mesmos 8 dígitos
+    return {"phone_suffix": normalized["phone_suffix"]}
+
+
+def normalize_name(name: Optional[str]) -> Optional[str]:
+    """Lowercase a name and collapse repeated whitespace"""
+    if not name:
+        return None
+    normalized = " ".join(str(name).strip().lower().split())
+    return normalized or None
+
+
+def normalize_plate(plate: Optional[str]) -> Optional[str]:
+    """Uppercase a car plate and drop separators (ABC-1234 -> ABC1234)"""
+    if not plate:
+        return None
+    normalized = re.sub(r'[^A-Z0-9]', '', str(plate).upper())
+    return normalized or None
+
+
+def normalize_license(license_number: Optional[str]) -> Optional[str]:
+    """Uppercase a taxi license number and drop separators"""
+    if not license_number:
+        return None
+    normalized = re.sub(r'[^A-Z0-9]', '', str(license_number).upper())
+    return normalized or None
+
+
+def build_lookup_fields(subscription: Dict[str, Any]) -> Dict[str, Any]:
+    """Compute the normalized shadow fields for a subscription document"""
+    phone = normalize_phone(subscription.get("phone"))
+    return {
+        "name_normalized": normalize_name(subscription.get("name")),
+        "email_lower": normalize_email(subscription.get("email")),
+        "cpf_digits": digits_only(subscription.get("cpf")),
+        "phone_digits": phone["phone_digits"],
+        "phone_suffix": phone["phone_suffix"],
+        "plate_norm": normalize_plate(subscription.get("car_plate")),
+        "license_norm": normalize_license(subscription.get("license_number")),
+        "lookup_version": LOOKUP_FIELDS_VERSION,
+    }
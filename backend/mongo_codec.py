@@ -0,0 +1,92 @@
+"""
+Per-model MongoDB converters compiled from Pydantic models
+The generic prepare_for_mongo/parse_from_mongo helpers walk every key of
+every document. A ModelCodec inspects the model once, remembers which
+fields hold datetimes and only touches those on each conversion
+"""
+
+import typing
+from datetime import datetime, timezone
+from typing import Any, Dict, Generic, Optional, Tuple, Type, TypeVar
+
+from pydantic import BaseModel
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+
+def _is_datetime(annotation: Any) -> bool:
+    if annotation is datetime:
+        return True
+    # Optional[datetime] / Union[datetime, ...]
+    return any(arg is datetime for arg in typing.get_args(annotation))
+
+
+def _parse_datetime(value: str) -> Any:
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return value
+
+
+class ModelCodec(Generic[ModelT]):
+    """Convert documents of one model to and from their MongoDB representation"""
+
+    def __init__(self, model: Type[ModelT]):
+        self.model = model
+        self.fields: Tuple[str, ...] = tuple(model.model_fields)
+        self.date_fields: Tuple[str, ...] = tuple(
+            name for name, field in model.model_fields.items() if _is_datetime(field.annotation)
+        )
+        self.required: Tuple[str, ...] = tuple(
+            name for name, field in model.model_fields.items() if field.is_required()
+        )
+        self._optional = {name: field for name, field in model.model_fields.items() if not field.is_required()}
+
+    def to_mongo(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Copy of `data` ready for insert: date fields as aware UTC datetimes (BSON dates)"""
+        prepared = dict(data)
+        for name in self.date_fields:
+            value = prepared.get(name)
+            if isinstance(value, str):
+                value = _parse_datetime(value)
+            if isinstance(value, datetime) and value.tzinfo is None:
+                value = value.replace(tzinfo=timezone.utc)
+            if name in prepared:
+                prepared[name] = value
+        return prepared
+
+    def from_mongo(self, document: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Document without _id and with legacy ISO-string dates parsed"""
+        if document is None:
+            return None
+        parsed = dict(document)
+        parsed.pop("_id", None)
+        for name in self.date_fields:
+            value = parsed.get(name)
+            if isinstance(value, str):
+                parsed[name] = _parse_datetime(value)
+        return parsed
+
+    def load(self, document: Dict[str, Any]) -> ModelT:
+        """Build the model from a stored document, passing only the declared fields"""
+        return self.model(**{name: document[name] for name in self.fields if name in document})
+
+    def dump(self, document: Dict[str, Any]) -> Dict[str, Any]:
+        """Shape a trusted stored document like model_dump(), without validating it
+
+        Documents missing a required field go through the model instead, so
+        malformed legacy data still fails the same way it used to.
+        """
+        for name in self.required:
+            if name not in document:
+                return self.load(document).model_dump()
+        shaped = {}
+        for name in self.fields:
+            if name in document:
+                value = document[name]
+                if isinstance(value, str) and name in self.date_fields:
+                    value = _parse_datetime(value)
+            else:
+                value = self._optional[name].get_default(call_default_factory=True)
+            shaped[name] = value
+        return shaped
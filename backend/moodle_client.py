@@ -11,6 +11,8 @@ from pydantic import BaseModel
 from datetime import datetime, timedelta
 import os
 
+from resilience import ResiliencePolicy
+
 class MoodleUser(BaseModel):
     id: Optional[int] = None
     username: str
@@ -40,7 +42,17 @@ class MoodleAPIClient:
         self.token = token
         self.api_url = f"{base_url}/webservice/rest/server.php"
         self.logger = logging.getLogger(__name__)
+        # Read-only calls slower than 2s get a second, hedged request (MOODLE_HEDGE_AFTER_MS overrides)
+        self.resilience = ResiliencePolicy.from_env("moodle", hedge_after=2.0)
         
+    async def _post(self, data: Dict[str, Any], timeout: int) -> httpx.Response:
+        async with httpx.AsyncClient(timeout=timeout) as client:
+            response = await client.post(self.api_url, data=data)
+            # Only server errors count against the circuit breaker; 4xx is raised by the caller
+            if response.status_code >= 500:
+                response.raise_for_status()
+            return response
+
     async def _make_request(
         self, 
         function: str, 
@@ -49,26 +61,31 @@ class MoodleAPIClient:
     ) -> Dict[str, Any]:
         """Make authenticated request to Moodle API"""
         try:
-            async with httpx.AsyncClient(timeout=timeout) as client:
-                data = {
-                    'wstoken': self.token,
-                    'wsfunction': function,
-                    'moodlewsrestformat': 'json',
-                    **params
-                }
-                
-                self.logger.info(f"Making Moodle API request: {function}")
-                response = await client.post(self.api_url, data=data)
-                response.raise_for_status()
-                
-                result = response.json()
-                
-                if isinstance(result, dict) and 'exception' in result:
-                    raise Exception(f"Moodle API Error: {result.get('message', 'Unknown error')}")
-                    
-                self.logger.info(f"Moodle API response received for: {function}")
-                return result
+            data = {
+                'wstoken': self.token,
+                'wsfunction': function,
+                'moodlewsrestformat': 'json',
+                **params
+            }
+            
+            self.logger.info(f"Making Moodle API request: {function}")
+            # Reads may be retried and hedged; writes only when the connection never opened
+            read_only = '_get_' in function
+            response = await self.resilience.call(
+                lambda: self._post(data, timeout),
+                retry_on=(httpx.TransportError, httpx.HTTPStatusError) if read_only else (httpx.ConnectError, httpx.ConnectTimeout),
+                hedge=read_only
+            )
+            response.raise_for_status()
+            
+            result = response.json()
+            
+            if isinstance(result, dict) and 'exception' in result:
+                raise Exception(f"Moodle API Error: {result.get('message', 'Unknown error')}")
                 
+            self.logger.info(f"Moodle API response received for: {function}")
+            return result
+            
         except httpx.RequestError as e:
             self.logger.error(f"Request error: {e}")
             raise Exception(f"Failed to connect to Moodle API: {e}")
@@ -0,0 +1,123 @@
+"""
+Keyset pagination helpers for admin list endpoints
+Pages are addressed by an opaque cursor holding the sort value and _id of the
+last document returned, so each page is an indexed range scan
+"""
+
+import base64
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId, json_util
+from pymongo import ASCENDING, DESCENDING
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Tipos que um cursor pode carregar; qualquer outro (ex.: {"$ne": ...}) viraria operador no filtro
+CURSOR_VALUE_TYPES = (str, int, float, bool, datetime, ObjectId)
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a pagination cursor cannot be decoded"""
+
+
+def encode_cursor(sort_value: Any, object_id: Any) -> str:
+    """Encode the position after a document as an opaque cursor"""
+    raw = json_util.dumps([sort_value, object_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, Any]:
+    """Decode a cursor produced by encode_cursor"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, object_id = json_util.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except Exception as e:
+        raise InvalidCursorError(f"Cursor inválido: {cursor}") from e
+    if not isinstance(object_id, CURSOR_VALUE_TYPES) or not (sort_value is None or isinstance(sort_value, CURSOR_VALUE_TYPES)):
+        raise InvalidCursorError(f"Cursor inválido: {cursor}")
+    return sort_value, object_id
+
+
+def clamp_limit(limit: Optional[int]) -> int:
+    """Keep a requested page size within the allowed bounds"""
+    if not limit or limit < 1:
+        return DEFAULT_PAGE_SIZE
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def keyset_query(
+    query: Dict[str, Any],
+    sort_field: str,
+    descending: bool,
+    after: Optional[str]
+) -> Dict[str, Any]:
+    """Combine a filter with the keyset condition for the page after a cursor"""
+    if not after:
+        return query
+
+    sort_value, object_id = decode_cursor(after)
+    op = "$lt" if descending else "$gt"
+    if sort_field == "_id":
+        position = {"_id": {op: object_id}}
+    elif sort_value is None:
+        # Documentos sem o campo ordenam antes de qualquer valor
+        position = {"$or": [{sort_field: None, "_id": {op: object_id}}]}
+        if not descending:
+            position["$or"].insert(0, {sort_field: {"$ne": None}})
+    else:
+        position = {"$or": [
+            {sort_field: {op: sort_value}},
+            {sort_field: sort_value, "_id": {op: object_id}},
+        ]}
+        if descending:
+            # Em ordem decrescente os documentos sem o campo vêm por último
+            position["$or"].append({sort_field: None})
+    return {"$and": [query, position]} if query else position
+
+
+def sorted_cursor(
+    collection,
+    query: Dict[str, Any],
+    projection: Dict[str, int],
+    sort_field: str = "_id",
+    descending: bool = False,
+    after: Optional[str] = None
+):
+    """Open a cursor ordered by (sort_field, _id) starting after a cursor"""
+    direction = DESCENDING if descending else ASCENDING
+    sort = [(sort_field, direction)]
+    if sort_field != "_id":
+        sort.append(("_id", direction))
+
+    projection = {**projection, "_id": 1}
+    if sort_field != "_id":
+        projection[sort_field] = 1
+
+    return collection.find(
+        keyset_query(query, sort_field, descending, after),
+        projection
+    ).sort(sort)
+
+
+async def fetch_page(
+    collection,
+    query: Dict[str, Any],
+    projection: Dict[str, int],
+    sort_field: str = "_id",
+    descending: bool = False,
+    after: Optional[str] = None,
+    limit: Optional[int] = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Fetch one page of documents and the cursor for the next page"""
+    limit = clamp_limit(limit)
+    cursor = sorted_cursor(collection, query, projection, sort_field, descending, after).limit(limit + 1)
+    documents = await cursor.to_list(length=limit + 1)
+
+    next_cursor = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        last = documents[-1]
+        next_cursor = encode_cursor(last.get(sort_field), last["_id"])
+    return documents, next_cursor
@@ -0,0 +1,153 @@
+"""
+Content-addressed store for PIX QR code images
+The PNG returned by Asaas used to live base64-encoded inside every
+asaas_payments document, so listings and webhook lookups dragged a few KB
+of image per row. Images now live in their own collection keyed by the
+sha256 of the bytes; payments keep only the id, and the image is served on
+demand as an immutable resource
+
+The move runs once: completion is recorded in the migrations collection
+and rows whose image is not valid base64 are flagged, so later startups
+skip the unindexed scan
+
+Usage (from backend/), to move images out of existing payments
+(--reset scans again, flagged rows included):
+    python pix_images.py [--reset]
+"""
+
+import asyncio
+import base64
+import binascii
+import hashlib
+import logging
+import os
+import re
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from bson import Binary
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+IMAGE_COLLECTION = "pix_qrcode_images"
+IMAGE_ID_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+MIGRATION_ID = "pix_inline_images"
+
+
+def image_id_for(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def image_url(image_id: Optional[str]) -> Optional[str]:
+    return f"/api/pix-images/{image_id}" if image_id else None
+
+
+async def store_image(db, data: bytes, content_type: str = "image/png") -> str:
+    """Store the image once and return its content id (storing it again is a no-op)"""
+    image_id = image_id_for(data)
+    try:
+        await db[IMAGE_COLLECTION].update_one(
+            {"_id": image_id},
+            {"$setOnInsert": {
+                "data": Binary(data),
+                "content_type": content_type,
+                "size": len(data),
+                "created_at": datetime.now(timezone.utc)
+            }},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # Outro upsert com o mesmo conteúdo venceu a corrida
+        pass
+    return image_id
+
+
+async def store_encoded_image(db, encoded: Optional[str]) -> Optional[str]:
+    """Store a base64 image as returned by Asaas (None when missing or invalid)"""
+    if not encoded:
+        return None
+    try:
+        data = base64.b64decode(encoded, validate=True)
+    except (binascii.Error, ValueError):
+        logger.warning("⚠️ Imagem do QR Code PIX em base64 inválido, ignorada")
+        return None
+    return await store_image(db, data)
+
+
+async def load_image(db, image_id: str) -> Optional[Dict[str, Any]]:
+    if not IMAGE_ID_PATTERN.match(image_id):
+        return None
+    return await db[IMAGE_COLLECTION].find_one({"_id": image_id}, {"data": 1, "content_type": 1})
+
+
+async def migrate_inline_images(db, batch_size: int = 200) -> int:
+    """Move base64 images embedded in asaas_payments into the image store (once)"""
+    if (await db.migrations.find_one({"_id": MIGRATION_ID}) or {}).get("completed"):
+        return 0
+
+    moved = 0
+    operations = []
+    cursor = db.asaas_payments.find(
+        {"pix_qrcode_image": {"$type": "string"}, "pix_qrcode_image_invalid": {"$ne": True}},
+        {"_id": 1, "pix_qrcode_image": 1}
+    ).batch_size(batch_size)
+    async for payment in cursor:
+        encoded = payment["pix_qrcode_image"]
+        image_id = await store_encoded_image(db, encoded)
+        if image_id is None:
+            # Base64 inválido: mantém a única cópia em vez de apagá-la, marcada para não ser relida
+            logger.warning(f"⚠️ Cobrança {payment['_id']}: imagem do QR Code PIX não migrada (base64 inválido)")
+            operations.append(UpdateOne(
+                {"_id": payment["_id"], "pix_qrcode_image": encoded},
+                {"$set": {"pix_qrcode_image_invalid": True}}
+            ))
+        else:
+            # Filtra pelo valor original: não sobrescreve um QR gravado nesse meio tempo
+            operations.append(UpdateOne(
+                {"_id": payment["_id"], "pix_qrcode_image": encoded},
+                {"$set": {"pix_qrcode_image_id": image_id}, "$unset": {"pix_qrcode_image": ""}}
+            ))
+            moved += 1
+        if len(operations) >= batch_size:
+            await db.asaas_payments.bulk_write(operations, ordered=False)
+            operations = []
+    if operations:
+        await db.asaas_payments.bulk_write(operations, ordered=False)
+    await db.migrations.update_one(
+        {"_id": MIGRATION_ID},
+        {"$set": {"completed": True, "moved": moved, "updated_at": datetime.now(timezone.utc)}},
+        upsert=True
+    )
+    if moved:
+        logger.info(f"✅ {moved} imagens de QR Code PIX movidas para {IMAGE_COLLECTION}")
+    return moved
+
+
+async def reset_migration(db):
+    """Forget the completion record and the invalid-image flags so the next run scans again"""
+    await db.migrations.delete_one({"_id": MIGRATION_ID})
+    await db.asaas_payments.update_many(
+        {"pix_qrcode_image_invalid": True},
+        {"$unset": {"pix_qrcode_image_invalid": ""}}
+    )
+
+
+if __name__ == "__main__":
+    import sys
+
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    async def main():
+        client = AsyncIOMotorClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'), tz_aware=True)
+        db = client[os.environ.get('DB_NAME', 'test_database')]
+        try:
+            if "--reset" in sys.argv:
+                await reset_migration(db)
+            print(await migrate_inline_images(db))
+        finally:
+            client.close()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,115 @@
+"""
+Deferred PIX QR code retrieval
+The Asaas pixQrCode call is the slowest step of payment creation. The
+fetch starts as soon as the charge exists and runs alongside the MongoDB
+writes; its result is stored on the asaas_payments row once that row has
+been written. When the image can be rendered locally (pix_render) only the
+payload is kept; otherwise the Asaas PNG goes to the content-addressed
+store in pix_images. One fetch per payment is in flight at a time, and callers
+(the create-payment handler, GET /api/payments/{id}/pix) wait on it with a
+bounded timeout instead of blocking on Asaas
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from pix_images import image_url, store_encoded_image
+from pix_render import QR_RENDERING_AVAILABLE
+
+logger = logging.getLogger(__name__)
+
+
+def rendered_image_url(payment_id: str) -> str:
+    return f"/api/payments/{payment_id}/pix/qrcode.png"
+
+
+async def store_pix_data(db, pix_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Asaas pixQrCode response -> fields stored on asaas_payments (image kept apart)"""
+    stored = {"pix_qrcode": pix_data.get('payload')}
+    if not (QR_RENDERING_AVAILABLE and stored["pix_qrcode"]):
+        stored["pix_qrcode_image_id"] = await store_encoded_image(db, pix_data.get('encodedImage'))
+    return stored
+
+
+def pix_fields(payment_id: str, stored: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Stored PIX fields -> what the API returns (the image is linked, not inlined)"""
+    if not stored:
+        return {"pix_qrcode": None, "pix_qrcode_image_url": None}
+    if QR_RENDERING_AVAILABLE and stored.get("pix_qrcode"):
+        url = rendered_image_url(payment_id)
+    else:
+        url = image_url(stored.get("pix_qrcode_image_id"))
+    return {"pix_qrcode": stored.get("pix_qrcode"), "pix_qrcode_image_url": url}
+
+
+class PixQrCodeFetcher:
+    """Background pixQrCode fetches, one per payment id, persisted when done"""
+
+    def __init__(self, fetch_qrcode: Callable[[str], Awaitable[Optional[Dict[str, Any]]]]):
+        self._fetch_qrcode = fetch_qrcode
+        self._inflight: Dict[str, asyncio.Task] = {}
+        # Referências fortes: o loop só guarda referências fracas às tasks
+        self._tasks: Set[asyncio.Task] = set()
+
+    def inflight(self, payment_id: str) -> bool:
+        return payment_id in self._inflight
+
+    async def _fetch_and_store(self, db, payment_id: str, record_written: Optional[Awaitable]) -> Optional[Dict[str, Any]]:
+        pix_data = await self._fetch_qrcode(payment_id)
+        if not pix_data:
+            return None
+        stored = await store_pix_data(db, pix_data)
+        if record_written is not None:
+            # O QR pode chegar antes do insert da cobrança terminar
+            try:
+                await record_written
+            except Exception as e:
+                logger.error(f"❌ Cobrança {payment_id} não foi gravada, QR Code PIX descartado: {e}")
+                return stored
+        try:
+            await db.asaas_payments.update_one(
+                {"asaas_payment_id": payment_id},
+                {"$set": stored}
+            )
+        except Exception as e:
+            logger.error(f"❌ Erro ao gravar QR Code PIX da cobrança {payment_id}: {e}")
+        return stored
+
+    def start(self, db, payment_id: str, record_written: Optional[Awaitable] = None) -> asyncio.Task:
+        """Start fetching the QR code for payment_id (reuses a fetch already in flight)"""
+        task = self._inflight.get(payment_id)
+        if task is not None:
+            return task
+        task = asyncio.ensure_future(self._fetch_and_store(db, payment_id, record_written))
+        self._inflight[payment_id] = task
+        self._tasks.add(task)
+        task.add_done_callback(lambda done: self._finish(payment_id, done))
+        return task
+
+    def _finish(self, payment_id: str, task: asyncio.Task):
+        self._tasks.discard(task)
+        if self._inflight.get(payment_id) is task:
+            del self._inflight[payment_id]
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"❌ Erro ao obter QR Code PIX da cobrança {payment_id}: {task.exception()}")
+
+    async def wait(self, task: asyncio.Task, timeout: float) -> Optional[Dict[str, Any]]:
+        """Stored PIX fields if the fetch finishes within timeout, otherwise None (the fetch keeps running)"""
+        if not task.done():
+            if timeout <= 0:
+                return None
+            try:
+                await asyncio.wait_for(asyncio.shield(task), timeout)
+            except asyncio.TimeoutError:
+                return None
+            except Exception:
+                return None
+        if task.cancelled() or task.exception() is not None:
+            return None
+        return task.result()
+
+    async def close(self):
+        """Wait for the fetches still running (called on shutdown)"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -0,0 +1,131 @@
+"""
+Local PIX QR code rendering
+Renders the QR image from the stored BR Code payload with Pillow instead of
+downloading the PNG Asaas generates. The QR matrix is encoded once per
+payload and each requested size is drawn from it; both are kept in LRU
+caches keyed by the payload hash. Encoding is pure Python, so it runs in a
+small worker pool off the event loop. The `qrcode` package is optional:
+without it callers fall back to the image stored from Asaas
+"""
+
+import asyncio
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Dict, List, Optional, Tuple
+
+from cachetools import LRUCache
+from PIL import Image
+
+try:
+    import qrcode
+    from qrcode.constants import ERROR_CORRECT_M
+except ImportError:  # pragma: no cover - optional dependency
+    qrcode = None
+
+logger = logging.getLogger(__name__)
+
+QR_RENDERING_AVAILABLE = qrcode is not None
+# Tamanhos servidos (px); pedidos intermediários sobem para o próximo
+RENDER_SIZES = (128, 256, 512, 1024)
+DEFAULT_RENDER_SIZE = 256
+
+
+def payload_hash(payload: str) -> str:
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def snap_size(size: int) -> int:
+    for allowed in RENDER_SIZES:
+        if size <= allowed:
+            return allowed
+    return RENDER_SIZES[-1]
+
+
+def encode_matrix(payload: str) -> List[List[bool]]:
+    """QR modules for the payload, quiet zone included (error correction M, like Asaas)"""
+    code = qrcode.QRCode(error_correction=ERROR_CORRECT_M, box_size=1, border=4)
+    code.add_data(payload)
+    code.make(fit=True)
+    return code.get_matrix()
+
+
+def draw_png(matrix: List[List[bool]], size: int) -> bytes:
+    """Draw the matrix filling a size x size PNG (never below one pixel per module)"""
+    modules = len(matrix)
+    qr = Image.new("1", (modules, modules), 1)
+    qr.putdata([0 if dark else 1 for row in matrix for dark in row])
+    # NEAREST em tamanho não múltiplo: módulos com no máximo 1px de diferença entre si,
+    # em vez de uma escala inteira arredondada para baixo que deixa a imagem menor que o pedido
+    size = max(size, modules)
+    qr = qr.resize((size, size), Image.NEAREST)
+    buffer = BytesIO()
+    qr.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+
+class QrRenderer:
+    """Render and cache PIX QR images by payload hash and size"""
+
+    def __init__(self, max_workers: int = 2, max_payloads: int = 2000, max_images: int = 2000):
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._max_workers = max_workers
+        self._matrices: LRUCache = LRUCache(maxsize=max_payloads)
+        self._images: LRUCache = LRUCache(maxsize=max_images)
+        self._inflight: Dict[Tuple[str, int], asyncio.Future] = {}
+        self.stats = {"hits": 0, "renders": 0, "errors": 0}
+
+    @property
+    def available(self) -> bool:
+        return QR_RENDERING_AVAILABLE
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix="pix-qr")
+        return self._executor
+
+    @staticmethod
+    def _render(payload: str, size: int, matrix: Optional[List[List[bool]]]):
+        # Roda no pool: os caches (não thread-safe) só são tocados no loop
+        if matrix is None:
+            matrix = encode_matrix(payload)
+        return matrix, draw_png(matrix, size)
+
+    async def _render_and_cache(self, key: str, payload: str, size: int) -> bytes:
+        loop = asyncio.get_running_loop()
+        matrix, image = await loop.run_in_executor(self._pool(), self._render, payload, size, self._matrices.get(key))
+        self._matrices[key] = matrix
+        self._images[(key, size)] = image
+        return image
+
+    async def render(self, payload: str, size: int = DEFAULT_RENDER_SIZE) -> Tuple[str, int, bytes]:
+        """(payload hash, served size, PNG bytes); concurrent requests for one image share a render"""
+        if not QR_RENDERING_AVAILABLE:
+            raise RuntimeError("pacote qrcode não instalado")
+        key, size = payload_hash(payload), snap_size(size)
+        image = self._images.get((key, size))
+        if image is not None:
+            self.stats["hits"] += 1
+            return key, size, image
+
+        inflight = self._inflight.get((key, size))
+        if inflight is None:
+            inflight = asyncio.ensure_future(self._render_and_cache(key, payload, size))
+            self._inflight[(key, size)] = inflight
+            inflight.add_done_callback(lambda _: self._inflight.pop((key, size), None))
+            self.stats["renders"] += 1
+        try:
+            image = await asyncio.shield(inflight)
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+        return key, size, image
+
+    def snapshot(self) -> Dict[str, int]:
+        return {**self.stats, "cached_payloads": len(self._matrices), "cached_images": len(self._images)}
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,61 @@
+"""
+Per-request MongoDB query counting for debug mode
+A pymongo command listener counts the commands issued while a request is
+being handled so N+1 regressions show up in the X-DB-Query-Count header
+"""
+
+import logging
+from contextvars import ContextVar
+from typing import List, Optional
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+QUERY_COUNT_HEADER = "X-DB-Query-Count"
+
+# Comandos internos do driver que não representam consultas da aplicação
+_IGNORED_COMMANDS = {"hello", "ismaster", "isMaster", "endSessions", "ping", "saslStart", "saslContinue"}
+
+# Lista mutável para que o executor do Motor (que copia o contexto) some no mesmo contador
+_request_counter: ContextVar[Optional[List[int]]] = ContextVar("request_query_counter", default=None)
+
+
+class QueryCountListener(monitoring.CommandListener):
+    """Count the commands sent to MongoDB on behalf of the current request"""
+
+    def started(self, event):
+        counter = _request_counter.get()
+        if counter is not None and event.command_name not in _IGNORED_COMMANDS:
+            counter[0] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def start_request_count() -> List[int]:
+    """Start counting queries for the current request"""
+    counter = [0]
+    _request_counter.set(counter)
+    return counter
+
+
+def current_query_count() -> Optional[int]:
+    """Number of queries issued so far by the current request (None outside a request)"""
+    counter = _request_counter.get()
+    return counter[0] if counter is not None else None
+
+
+def install_query_count_middleware(app):
+    """Expose the per-request query count as a response header"""
+
+    @app.middleware("http")
+    async def count_db_queries(request, call_next):
+        counter = start_request_count()
+        response = await call_next(request)
+        response.headers[QUERY_COUNT_HEADER] = str(counter[0])
+        logger.debug(f"{request.method} {request.url.path}: {counter[0]} consultas MongoDB")
+        return response
@@ -0,0 +1,277 @@
+"""
+Resilience layer for calls to external services (Asaas, Moodle, LLM)
+Each service gets a circuit breaker: after a run of consecutive failures it
+opens and calls fail immediately with CircuitOpenError until a cool-down
+has passed, then a single trial call decides whether it closes again.
+Retries use full-jitter backoff and draw from one retry budget shared by
+every service, so a provider outage cannot multiply the load on it.
+Idempotent reads can be hedged: if the first attempt is slow, a second one
+is started and the first answer wins
+"""
+
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple, Type
+
+logger = logging.getLogger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the service while its breaker is open"""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"Circuito '{name}' aberto, nova tentativa em {retry_in:.1f}s")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a half-open trial call"""
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+        self.stats = {"successes": 0, "failures": 0, "rejected": 0, "opened": 0}
+
+    def before_call(self):
+        """Raise CircuitOpenError if the call must not reach the service"""
+        if self.state == OPEN:
+            elapsed = time.monotonic() - self.opened_at
+            if elapsed < self.reset_timeout:
+                self.stats["rejected"] += 1
+                raise CircuitOpenError(self.name, self.reset_timeout - elapsed)
+            self.state = HALF_OPEN
+            self._trial_running = False
+        if self.state == HALF_OPEN:
+            if self._trial_running:
+                self.stats["rejected"] += 1
+                raise CircuitOpenError(self.name, 0.0)
+            self._trial_running = True
+
+    def release(self):
+        """The call was cancelled by its caller: it says nothing about the service"""
+        self._trial_running = False
+
+    def record_success(self):
+        self.stats["successes"] += 1
+        if self.state != CLOSED:
+            logger.info(f"✅ Circuito '{self.name}' fechado novamente")
+        self.state = CLOSED
+        self.failures = 0
+        self._trial_running = False
+
+    def record_failure(self):
+        self.stats["failures"] += 1
+        self.failures += 1
+        self._trial_running = False
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.stats["opened"] += 1
+                logger.warning(f"⚠️ Circuito '{self.name}' aberto após {self.failures} falhas seguidas")
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    def snapshot(self) -> Dict[str, Any]:
+        retry_in = 0.0
+        if self.state == OPEN:
+            retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+        return {
+            "name": self.name,
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "failure_threshold": self.failure_threshold,
+            "reset_timeout": self.reset_timeout,
+            "retry_in": round(retry_in, 1),
+            **self.stats
+        }
+
+
+class RetryBudget:
+    """Allow retries up to `ratio` of the calls seen in the last `window` seconds (plus a small floor)"""
+
+    def __init__(self, ratio: float = 0.2, min_retries: int = 10, window: float = 10.0):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window = window
+        self._calls: Deque[float] = deque()
+        self._retries: Deque[float] = deque()
+        self.exhausted = 0
+
+    def _trim(self, now: float):
+        for events in (self._calls, self._retries):
+            while events and now - events[0] > self.window:
+                events.popleft()
+
+    def record_call(self):
+        self._calls.append(time.monotonic())
+
+    def try_spend(self) -> bool:
+        now = time.monotonic()
+        self._trim(now)
+        if len(self._retries) >= self.min_retries + self.ratio * len(self._calls):
+            self.exhausted += 1
+            return False
+        self._retries.append(now)
+        return True
+
+    def snapshot(self) -> Dict[str, Any]:
+        self._trim(time.monotonic())
+        return {
+            "ratio": self.ratio,
+            "window": self.window,
+            "calls_in_window": len(self._calls),
+            "retries_in_window": len(self._retries),
+            "exhausted": self.exhausted
+        }
+
+
+# Orçamento único: novas tentativas de todos os serviços somam no mesmo limite
+RETRY_BUDGET = RetryBudget(
+    ratio=float(os.environ.get('RETRY_BUDGET_RATIO', '0.2')),
+    min_retries=int(os.environ.get('RETRY_BUDGET_MIN_RETRIES', '10')),
+    window=float(os.environ.get('RETRY_BUDGET_WINDOW_SECONDS', '10'))
+)
+
+_POLICIES: Dict[str, "ResiliencePolicy"] = {}
+
+
+class ResiliencePolicy:
+    """Breaker + budgeted jittered retries (+ optional hedging) for one external service"""
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        max_retries: int = 2,
+        base_delay: float = 0.2,
+        max_delay: float = 2.0,
+        attempt_timeout: Optional[float] = None,
+        hedge_after: Optional[float] = None,
+        budget: RetryBudget = RETRY_BUDGET
+    ):
+        self.name = name
+        self.breaker = CircuitBreaker(name, failure_threshold, reset_timeout)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.attempt_timeout = attempt_timeout
+        self.hedge_after = hedge_after
+        self.budget = budget
+        self.stats = {"calls": 0, "retries": 0, "hedges": 0, "hedge_wins": 0}
+
+    @classmethod
+    def from_env(cls, name: str, **defaults) -> "ResiliencePolicy":
+        """Policy registered under name; <NAME>_BREAKER_THRESHOLD etc. override the defaults"""
+        if name in _POLICIES:
+            return _POLICIES[name]
+        prefix = name.upper()
+
+        def env(key: str, cast, default):
+            value = os.environ.get(f"{prefix}_{key}")
+            return cast(value) if value not in (None, "") else default
+
+        hedge_ms = env("HEDGE_AFTER_MS", float, None)
+        policy = cls(
+            name,
+            failure_threshold=env("BREAKER_THRESHOLD", int, defaults.get("failure_threshold", 5)),
+            reset_timeout=env("BREAKER_RESET_SECONDS", float, defaults.get("reset_timeout", 30.0)),
+            max_retries=env("MAX_RETRIES", int, defaults.get("max_retries", 2)),
+            base_delay=defaults.get("base_delay", 0.2),
+            max_delay=defaults.get("max_delay", 2.0),
+            attempt_timeout=env("ATTEMPT_TIMEOUT_SECONDS", float, defaults.get("attempt_timeout")),
+            hedge_after=hedge_ms / 1000 if hedge_ms is not None else defaults.get("hedge_after")
+        )
+        _POLICIES[name] = policy
+        return policy
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: espalha as novas tentativas de clientes que falharam juntos
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    async def _attempt(self, call: Callable[[], Awaitable[Any]]) -> Any:
+        if self.attempt_timeout:
+            return await asyncio.wait_for(call(), self.attempt_timeout)
+        return await call()
+
+    async def _hedged_attempt(self, call: Callable[[], Awaitable[Any]]) -> Any:
+        first = asyncio.ensure_future(self._attempt(call))
+        done, _ = await asyncio.wait({first}, timeout=self.hedge_after)
+        if done or not self.budget.try_spend():
+            return await first
+        self.stats["hedges"] += 1
+        second = asyncio.ensure_future(self._attempt(call))
+        pending = {first, second}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self.stats["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def call(
+        self,
+        call: Callable[[], Awaitable[Any]],
+        retry_on: Tuple[Type[BaseException], ...] = (Exception,),
+        hedge: bool = False
+    ) -> Any:
+        """Run call() through the breaker; retry exceptions in retry_on while the budget allows
+
+        Only pass hedge=True or a broad retry_on for idempotent calls: a timed
+        out POST may already have been applied upstream
+        """
+        self.stats["calls"] += 1
+        self.budget.record_call()
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            try:
+                if hedge and self.hedge_after is not None:
+                    result = await self._hedged_attempt(call)
+                else:
+                    result = await self._attempt(call)
+            except asyncio.CancelledError:
+                self.breaker.release()
+                raise
+            except Exception as e:
+                self.breaker.record_failure()
+                if not isinstance(e, retry_on) or attempt >= self.max_retries or self.breaker.state == OPEN or not self.budget.try_spend():
+                    raise
+                attempt += 1
+                self.stats["retries"] += 1
+                delay = self._backoff(attempt)
+                logger.warning(f"⚠️ {self.name}: falha ({type(e).__name__}: {e}), tentativa {attempt + 1} em {delay:.2f}s")
+                await asyncio.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.breaker.snapshot(), **self.stats, "max_retries": self.max_retries, "hedge_after": self.hedge_after}
+
+
+def resilience_snapshot() -> Dict[str, Any]:
+    """Breaker state of every registered service and the shared retry budget"""
+    return {
+        "services": [policy.snapshot() for policy in _POLICIES.values()],
+        "retry_budget": RETRY_BUDGET.snapshot()
+    }
@@ -8,6 +8,8 @@ from motor.motor_asyncio import AsyncIOMotorClient
 from datetime import datetime, timezone
 import uuid
 
+from catalog import mark_catalog_changed
+
 # Configuração do banco
 mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
 db_name = os.environ.get('DB_NAME', 'test_database')
@@ -616,6 +618,10 @@ async def seed_database():
         await db.questions.insert_many(questions_to_insert)
         print(f"✅ {len(questions_to_insert)} questões inseridas")
         
+        # Os servidores reconstroem o catálogo em memória ao ver a nova versão
+        await mark_catalog_changed(db)
+        await db.collection_versions.update_one({"_id": "questions"}, {"$inc": {"version": 1}}, upsert=True)
+        
         print("\n🎉 Banco de dados populado com sucesso!")
         print("\n📊 Resumo:")
         print(f"  • {len(MODULES_DATA)} módulos")
@@ -1,7 +1,8 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Form, File, UploadFile
+from fastapi import FastAPI, APIRouter, HTTPException, Form, File, UploadFile, Query, Request, Response
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
 import os
 import logging
 import asyncio
@@ -24,6 +25,25 @@ import base64
 from io import BytesIO
 from PIL import Image
 import magic
+from db_indexes import bootstrap_database
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidCursorError, fetch_page, sorted_cursor
+from streaming import resolve_stream_mode, stream_cursor
+from catalog import CourseCatalog
+from http_cache import CollectionVersions, ConditionalResponder
+from ttl_cache import SingleFlightCache
+from date_migration import migrate_string_dates
+from city_rollup import ROLLUP_PROJECTION, apply_subscription_change, ensure_city_rollup, read_city_stats, rebuild_city_rollup
+from query_metrics import QUERY_COUNT_HEADER, QueryCountListener, install_query_count_middleware
+from mongo_codec import ModelCodec
+from asaas_client import AsaasClient, AsaasResult
+from resilience import ResiliencePolicy, resilience_snapshot
+from webhook_inbox import WebhookInbox, idempotency_key
+from asaas_customers import CustomerResolver
+from pix_qrcodes import PixQrCodeFetcher, pix_fields
+from pix_images import IMAGE_COLLECTION, load_image, migrate_inline_images, store_encoded_image
+from pix_render import DEFAULT_RENDER_SIZE, RENDER_SIZES, QrRenderer
+from fast_json import resolve_default_response_class, trusted_json
+from lookup_fields import build_lookup_fields, normalize_email, normalize_name, digits_only, normalize_plate, normalize_license, phone_duplicate_query
 # Removed Moodle imports - replaced with video management utilities
 
 ROOT_DIR = Path(__file__).parent
@@ -31,13 +51,41 @@ load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# Contagem de consultas por requisição (header X-DB-Query-Count) em modo debug
+DEBUG_DB_QUERIES = os.environ.get('DEBUG_DB_QUERIES', 'false').lower() == 'true'
+# tz_aware: datas BSON voltam como datetime UTC com fuso, iguais às que gravamos
+client = AsyncIOMotorClient(mongo_url, tz_aware=True, event_listeners=[QueryCountListener()] if DEBUG_DB_QUERIES else [])
 db = client[os.environ['DB_NAME']]
 
-# Asaas API Configuration
-ASAAS_API_URL = os.environ.get('ASAAS_API_URL', 'https://sandbox.asaas.com/api/v3')
-ASAAS_TOKEN = os.environ.get('ASAAS_TOKEN', '')
+# Asaas API Configuration (ASAAS_API_URL, ASAAS_TOKEN e limites do pool lidos por AsaasClient.from_env)
 ASAAS_WEBHOOK_URL = os.environ.get('ASAAS_WEBHOOK_URL', '')
+# Cliente HTTP único (pool keep-alive) para a Asaas, aberto no startup e fechado no shutdown
+asaas_client = AsaasClient.from_env()
+# Cliente Asaas por CPF: cache LRU -> banco -> API (cria só quando não existe)
+asaas_customers = CustomerResolver(
+    lambda name, email, cpf, phone: create_asaas_customer(name, email, cpf, phone),
+    maxsize=int(os.environ.get('ASAAS_CUSTOMER_CACHE_SIZE', '5000'))
+)
+# QR Code PIX buscado em segundo plano enquanto a cobrança é gravada no banco
+pix_qrcodes = PixQrCodeFetcher(lambda payment_id: get_asaas_pix_qrcode(payment_id))
+# Quanto o cadastro espera pelo QR Code antes de responder sem ele. O checkout consulta pix_url
+# enquanto recebe 202, então por padrão a resposta não espera a Asaas
+PIX_QRCODE_GRACE_SECONDS = float(os.environ.get('PIX_QRCODE_GRACE_SECONDS', '0'))
+# Quanto GET /api/payments/{id}/pix espera por uma busca em andamento antes de responder 202
+PIX_QRCODE_POLL_WAIT_SECONDS = float(os.environ.get('PIX_QRCODE_POLL_WAIT_SECONDS', '2'))
+# Imagens de QR Code PIX desenhadas localmente a partir do payload (cache por hash e tamanho)
+pix_renderer = QrRenderer(
+    max_workers=int(os.environ.get('PIX_RENDER_WORKERS', '2')),
+    max_images=int(os.environ.get('PIX_RENDER_CACHE_SIZE', '2000'))
+)
+PIX_IMAGE_CACHE_HEADERS = {"Cache-Control": "public, max-age=31536000, immutable"}
+# Circuit breaker, novas tentativas e timeout por tentativa nas chamadas ao LLM do chat
+llm_resilience = ResiliencePolicy.from_env(
+    "llm",
+    max_retries=1,
+    attempt_timeout=float(os.environ.get('LLM_TIMEOUT_SECONDS', '20')),
+    base_delay=0.5
+)
 
 # Utility Functions for Video Management
 def extract_youtube_id(url: str) -> str:
@@ -72,8 +120,25 @@ def format_duration(minutes: int) -> str:
 # Moodle service disabled - replaced with video management
 moodle_service = None
 
+# Snapshot do catálogo de cursos (módulos, vídeos e contagem de questões) servido da memória
+course_catalog = CourseCatalog(refresh_interval=float(os.environ.get('CATALOG_REFRESH_SECONDS', '30')))
+
+# Contadores de escrita por coleção e respostas com ETag para GETs condicionais
+collection_versions = CollectionVersions(ttl=float(os.environ.get('COLLECTION_VERSION_TTL_SECONDS', '2')))
+conditional_responses = ConditionalResponder()
+
+# Estatísticas do painel admin: recalculadas no máximo uma vez por TTL, mesmo com vários admins
+admin_stats_cache = SingleFlightCache(ttl=float(os.environ.get('ADMIN_STATS_TTL_SECONDS', '10')))
+
 # Create the main app without a prefix
-app = FastAPI(title="EAD Taxista ES API", description="API para plataforma EAD dos Taxistas do Espírito Santo")
+app = FastAPI(
+    title="EAD Taxista ES API",
+    description="API para plataforma EAD dos Taxistas do Espírito Santo",
+    default_response_class=resolve_default_response_class()
+)
+
+if DEBUG_DB_QUERIES:
+    install_query_count_middleware(app)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -296,7 +361,8 @@ def prepare_for_mongo(data):
         prepared = {}
         for key, value in data.items():
             if isinstance(value, datetime):
-                prepared[key] = value.isoformat()
+                # Datas ficam como BSON date (ordenáveis e indexáveis); sem fuso assume-se UTC
+                prepared[key] = value if value.tzinfo else value.replace(tzinfo=timezone.utc)
             elif isinstance(value, dict):
                 prepared[key] = prepare_for_mongo(value)
             elif isinstance(value, list):
@@ -315,6 +381,7 @@ def parse_from_mongo(item):
             if key == '_id':
                 continue
             elif key.endswith('_date') or key == 'timestamp':
+                # Documentos antigos ainda não migrados guardam a data como string ISO
                 if isinstance(value, str):
                     try:
                         parsed[key] = datetime.fromisoformat(value.replace('Z', '+00:00'))
@@ -331,6 +398,13 @@ def parse_from_mongo(item):
         return parsed
     return item
 
+# Conversores por modelo: só tocam os campos de data declarados, sem percorrer o documento inteiro
+subscription_codec = ModelCodec(UserSubscription)
+chat_message_codec = ModelCodec(ChatMessage)
+status_check_codec = ModelCodec(StatusCheck)
+course_codec = ModelCodec(Course)
+user_codec = ModelCodec(User)
+
 # Chat Bot Helper Functions
 def generate_password(length=10):
     """Gera uma senha segura e legível"""
@@ -468,87 +542,51 @@ async def validate_cpf_with_api(cpf: str) -> dict:
     return result
 
 async def check_duplicate_registration(db, name: str, email: str, cpf: str, phone: str = None, car_plate: str = None, license_number: str = None) -> dict:
-    """Verifica duplicidade de todos os campos importantes"""
-    duplicates = {}
-    
-    # Verificar email duplicado (case-insensitive)
-    email_normalized = email.strip().lower()
-    email_exists = await db.subscriptions.find_one({
-        "email": {"$regex": f"^{re.escape(email_normalized)}$", "$options": "i"}
-    })
-    if email_exists:
-        duplicates["email"] = {
-            "field": "Email", 
-            "value": email,
-            "existing_user": email_exists.get("name")
-        }
-    
-    # Verificar CPF duplicado
-    clean_cpf = re.sub(r'[^\d]', '', cpf)
-    cpf_exists = await db.subscriptions.find_one({
-        "cpf": {"$regex": f"^{re.escape(clean_cpf)}$"}
-    })
-    if cpf_exists:
-        duplicates["cpf"] = {
-            "field": "CPF", 
-            "value": cpf,
-            "existing_user": cpf_exists.get("name")
-        }
-    
-    # Verificar telefone duplicado
-    if phone:
-        clean_phone = re.sub(r'[^\d]', '', phone)
-        phone_exists = await db.subscriptions.find_one({
-            "phone": {"$regex": f"^.*{re.escape(clean_phone)}.*$"}
-        })
-        if phone_exists:
-            duplicates["phone"] = {
-                "field": "Telefone", 
-                "value": phone,
-                "existing_user": phone_exists.get("name")
-            }
-    
-    # Verificar placa duplicada
-    if car_plate:
-        clean_plate = car_plate.upper().strip()
-        plate_exists = await db.subscriptions.find_one({
-            "car_plate": {"$regex": f"^{re.escape(clean_plate)}$", "$options": "i"}
-        })
-        if plate_exists:
-            duplicates["car_plate"] = {
-                "field": "Placa do Veículo", 
-                "value": car_plate,
-                "existing_user": plate_exists.get("name")
-            }
-    
-    # Verificar alvará duplicado
-    if license_number:
-        clean_license = license_number.upper().strip()
-        license_exists = await db.subscriptions.find_one({
-            "license_number": {"$regex": f"^{re.escape(clean_license)}$", "$options": "i"}
-        })
-        if license_exists:
-            duplicates["license_number"] = {
-                "field": "Número do Alvará", 
-                "value": license_number,
-                "existing_user": license_exists.get("name")
-            }
-    
-    # Verificar nome duplicado (ignorando case e espaços extras)
-    name_normalized = " ".join(name.strip().lower().split())
-    existing_names = await db.subscriptions.find({}, {"name": 1}).to_list(length=None)
-    
-    for existing in existing_names:
-        existing_normalized = " ".join(existing["name"].strip().lower().split())
-        if existing_normalized == name_normalized:
-            duplicates["name"] = {
-                "field": "Nome", 
-                "value": name,
-                "existing_user": existing.get("name")
-            }
+    """Verifica duplicidade de todos os campos importantes em uma única consulta indexada"""
+    def equals(field, normalized):
+        return {field: normalized} if normalized else None
+    
+    # (chave do resultado, rótulo, valor informado, consulta indexada)
+    checks = [
+        ("email", "Email", email, equals("email_lower", normalize_email(email))),
+        ("cpf", "CPF", cpf, equals("cpf_digits", digits_only(cpf))),
+        ("phone", "Telefone", phone, phone_duplicate_query(phone)),
+        ("car_plate", "Placa do Veículo", car_plate, equals("plate_norm", normalize_plate(car_plate))),
+        ("license_number", "Número do Alvará", license_number, equals("license_norm", normalize_license(license_number))),
+        ("name", "Nome", name, equals("name_normalized", normalize_name(name))),
+    ]
+    checks = [check for check in checks if check[3]]
+    if not checks:
+        return {}
+    
+    def matches(existing, query):
+        for field, condition in query.items():
+            if isinstance(condition, dict):
+                if existing.get(field) not in condition["$in"]:
+                    return False
+            elif existing.get(field) != condition:
+                return False
+        return True
+    
+    projection = {"_id": 0, "name": 1}
+    for check in checks:
+        projection.update({field: 1 for field in check[3]})
+    cursor = db.subscriptions.find({"$or": [check[3] for check in checks]}, projection)
+    
+    found = {}
+    async for existing in cursor:
+        for key, label, value, query in checks:
+            if key not in found and matches(existing, query):
+                found[key] = {
+                    "field": label,
+                    "value": value,
+                    "existing_user": existing.get("name")
+                }
+        if len(found) == len(checks):
             break
     
-    return duplicates
+    # Manter a ordem dos campos na resposta
+    return {check[0]: found[check[0]] for check in checks if check[0] in found}
 
 def validate_email_format(email: str) -> bool:
     """Valida formato de email conforme RFC 5322"""
@@ -935,7 +973,7 @@ async def get_chat_history(session_id: str, limit: int = 10):
         {"session_id": session_id}
     ).sort("timestamp", -1).limit(limit).to_list(limit)
     
-    return [ChatMessage(**parse_from_mongo(msg)) for msg in reversed(history)]
+    return [chat_message_codec.load(msg) for msg in reversed(history)]
 
 async def save_chat_message(session_id: str, user_message: str, bot_response: str):
     """Salva mensagem do chat no banco"""
@@ -944,7 +982,7 @@ async def save_chat_message(session_id: str, user_message: str, bot_response: st
         user_message=user_message,
         bot_response=bot_response
     )
-    prepared_data = prepare_for_mongo(chat_msg.dict())
+    prepared_data = chat_message_codec.to_mongo(chat_msg.dict())
     await db.chat_messages.insert_one(prepared_data)
     return chat_msg
 
@@ -977,14 +1015,15 @@ async def root():
 async def create_status_check(input: StatusCheckCreate):
     status_dict = input.dict()
     status_obj = StatusCheck(**status_dict)
-    prepared_data = prepare_for_mongo(status_obj.dict())
+    prepared_data = status_check_codec.to_mongo(status_obj.dict())
     _ = await db.status_checks.insert_one(prepared_data)
     return status_obj
 
 @api_router.get("/status", response_model=List[StatusCheck])
 async def get_status_checks():
     status_checks = await db.status_checks.find().to_list(1000)
-    return [StatusCheck(**parse_from_mongo(status_check)) for status_check in status_checks]
+    # Documentos gravados pelo próprio codec: serializados direto, sem revalidar pelo response_model
+    return trusted_json([status_check_codec.dump(status_check) for status_check in status_checks])
 
 # Subscription routes
 @api_router.post("/auth/login", response_model=LoginResponse)
@@ -995,9 +1034,7 @@ async def login_student(login_request: LoginRequest):
         email_normalized = login_request.email.strip().lower()
         
         # Buscar usuário no banco
-        user = await db.subscriptions.find_one({
-            "email": {"$regex": f"^{re.escape(email_normalized)}$", "$options": "i"}
-        })
+        user = await db.subscriptions.find_one({"email_lower": email_normalized})
         
         if not user:
             raise HTTPException(
@@ -1075,8 +1112,9 @@ async def create_course(course: CourseCreate):
             "created_at": datetime.now(timezone.utc)
         }
         
-        prepared_data = prepare_for_mongo(course_data)
+        prepared_data = course_codec.to_mongo(course_data)
         result = await db.courses.insert_one(prepared_data)
+        await collection_versions.bump(db, "courses")
         
         logging.info(f"Curso criado: {course.name} - Preço: R${course.price}")
         
@@ -1091,7 +1129,7 @@ async def get_courses():
     """Listar todos os cursos"""
     try:
         courses = await db.courses.find().to_list(length=None)
-        return [parse_from_mongo(course) for course in courses]
+        return [course_codec.from_mongo(course) for course in courses]
     except Exception as e:
         logging.error(f"Erro ao buscar cursos: {str(e)}")
         raise HTTPException(status_code=500, detail="Erro ao buscar cursos")
@@ -1104,6 +1142,7 @@ async def delete_course(course_id: str):
         
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Curso não encontrado")
+        await collection_versions.bump(db, "courses")
         
         logging.info(f"Curso excluído: ID {course_id}")
         return {"message": "Curso excluído com sucesso"}
@@ -1128,7 +1167,7 @@ async def update_course(course_id: str, course: CourseCreate):
             "updated_at": datetime.now(timezone.utc)
         }
         
-        prepared_data = prepare_for_mongo(update_data)
+        prepared_data = course_codec.to_mongo(update_data)
         result = await db.courses.update_one(
             {"id": course_id},
             {"$set": prepared_data}
@@ -1136,12 +1175,13 @@ async def update_course(course_id: str, course: CourseCreate):
         
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="Curso não encontrado")
+        await collection_versions.bump(db, "courses")
         
         logging.info(f"Curso atualizado: ID {course_id} - Novo preço: R${course.price}")
         
         # Buscar curso atualizado
         updated_course = await db.courses.find_one({"id": course_id})
-        return parse_from_mongo(updated_course)
+        return course_codec.from_mongo(updated_course)
         
     except HTTPException:
         raise
@@ -1149,19 +1189,26 @@ async def update_course(course_id: str, course: CourseCreate):
         logging.error(f"Erro ao atualizar curso: {str(e)}")
         raise HTTPException(status_code=500, detail="Erro ao atualizar curso")
 
+async def fetch_default_course_price():
+    """Preço do curso padrão (EAD Taxista), R$ 150 se não houver curso padrão
+
+    Erros do banco sobem para o chamador: o fallback não pode entrar no cache de ETag
+    """
+    # Buscar curso padrão
+    default_course = await db.courses.find_one({"category": "obrigatorio", "active": True})
+    
+    if default_course:
+        return {"price": default_course.get("price", 150.0)}
+    else:
+        # Se não houver curso padrão, retornar preço padrão de R$ 150
+        return {"price": 150.0}
+
 @api_router.get("/courses/default/price")
-async def get_default_course_price():
+async def get_default_course_price(request: Request):
     """Obter preço do curso padrão (EAD Taxista)"""
     try:
-        # Buscar curso padrão
-        default_course = await db.courses.find_one({"category": "obrigatorio", "active": True})
-        
-        if default_course:
-            return {"price": default_course.get("price", 150.0)}
-        else:
-            # Se não houver curso padrão, retornar preço padrão de R$ 150
-            return {"price": 150.0}
-        
+        versions = await collection_versions.get(db, ["courses"])
+        return await conditional_responses.respond(request, "courses:default_price", versions, fetch_default_course_price)
     except Exception as e:
         logging.error(f"Erro ao buscar preço do curso padrão: {str(e)}")
         return {"price": 150.0}  # Fallback
@@ -1183,76 +1230,91 @@ async def create_payment_asaas(request: dict):
             raise HTTPException(status_code=400, detail="Dados incompletos para criar pagamento")
         
         # Buscar preço do curso
-        course_price_response = await get_default_course_price()
+        try:
+            course_price_response = await fetch_default_course_price()
+        except Exception as e:
+            logging.error(f"Erro ao buscar preço do curso padrão: {str(e)}")
+            course_price_response = {"price": 150.0}  # Fallback
         course_price = course_price_response.get('price', 150.00)
         
-        # 1. Criar cliente na Asaas
-        customer = await create_asaas_customer(name, email, cpf, phone)
-        if not customer:
+        # 1. Reaproveitar o cliente Asaas do CPF ou criar um novo
+        customer_id = await asaas_customers.resolve(db, name, email, cpf, phone)
+        if not customer_id:
             raise HTTPException(status_code=500, detail="Erro ao criar cliente na Asaas")
         
         # 2. Criar cobrança PIX com descrição detalhada
         description = f"Curso EAD Taxista Espírito Santo - {name} - 28h de conteúdo completo"
         external_reference = f"ead-taxi-{email.replace('@', '-').replace('.', '-')}-{int(datetime.now().timestamp())}"
         
-        payment = await create_asaas_payment(
-            customer['id'], 
+        payment_result = await create_asaas_payment(
+            customer_id, 
             course_price, 
             description, 
             external_reference
         )
+        payment = payment_result.data
         
         if not payment:
+            if payment_result.customer_rejected:
+                # Cliente apagado ou inválido na Asaas: a próxima tentativa cria outro.
+                # Timeout, 5xx e circuito aberto não dizem nada sobre o cliente (e a cobrança pode ter sido criada)
+                asaas_customers.forget(cpf, customer_id)
             raise HTTPException(status_code=500, detail="Erro ao criar cobrança na Asaas")
         
-        # 3. Obter QR Code PIX
-        pix_qrcode = await get_asaas_pix_qrcode(payment['id'])
-        
-        # 4. Salvar dados da cobrança no banco
+        # 3. Salvar dados da cobrança no banco (QR Code PIX chega depois)
         payment_record = {
             "id": str(uuid.uuid4()),
             "asaas_payment_id": payment['id'],
-            "asaas_customer_id": customer['id'],
+            "asaas_customer_id": customer_id,
             "user_email": email,
             "user_name": name,
             "user_cpf": cpf,
+            "cpf_digits": digits_only(cpf),
             "amount": course_price,
             "status": "pending",
-            "created_at": datetime.now(timezone.utc).isoformat(),
+            "created_at": datetime.now(timezone.utc),
             "external_reference": external_reference,
             "payment_method": "PIX",
             "due_date": payment.get('dueDate'),
-            "pix_qrcode": pix_qrcode.get('payload') if pix_qrcode else None,
-            "pix_qrcode_image": pix_qrcode.get('encodedImage') if pix_qrcode else None
+            "pix_qrcode": None,
+            "pix_qrcode_image_id": None
         }
+        record_written = asyncio.ensure_future(db.asaas_payments.insert_one(payment_record))
         
-        await db.asaas_payments.insert_one(payment_record)
+        # 4. Buscar QR Code PIX em paralelo com as gravações
+        pix_task = pix_qrcodes.start(db, payment['id'], record_written=record_written)
         
         # 5. Atualizar subscription com dados do pagamento
-        await db.subscriptions.update_one(
-            {"email": email},
-            {
-                "$set": {
-                    "asaas_payment_id": payment['id'],
-                    "asaas_customer_id": customer['id'],
-                    "payment_status": "pending",
-                    "payment_created_at": datetime.now(timezone.utc).isoformat()
+        await asyncio.gather(
+            record_written,
+            db.subscriptions.update_one(
+                {"email_lower": normalize_email(email)},
+                {
+                    "$set": {
+                        "asaas_payment_id": payment['id'],
+                        "asaas_customer_id": customer_id,
+                        "payment_status": "pending",
+                        "payment_created_at": datetime.now(timezone.utc)
+                    }
                 }
-            }
+            )
         )
         
+        pix_qrcode = await pix_qrcodes.wait(pix_task, PIX_QRCODE_GRACE_SECONDS)
+        
         logging.info(f"✅ Pagamento Asaas criado: {payment['id']} - {name} - R$ {course_price}")
         
         return {
             "success": True,
             "payment_id": payment['id'],
-            "customer_id": customer['id'],
+            "customer_id": customer_id,
             "amount": course_price,
             "status": payment['status'],
             "due_date": payment['dueDate'],
             "payment_url": payment.get('invoiceUrl'),
-            "pix_qrcode": pix_qrcode.get('payload') if pix_qrcode else None,
-            "pix_qrcode_image": pix_qrcode.get('encodedImage') if pix_qrcode else None,
+            **pix_fields(payment['id'], pix_qrcode),
+            "pix_status": "ready" if pix_qrcode else "pending",
+            "pix_url": f"/api/payments/{payment['id']}/pix",
             "message": "Pagamento PIX criado com sucesso!"
         }
         
@@ -1262,6 +1324,97 @@ async def create_payment_asaas(request: dict):
         logging.error(f"❌ Erro ao criar pagamento: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
 
+@api_router.get("/payments/{payment_id}/pix")
+async def get_payment_pix(payment_id: str, response: Response):
+    """QR Code PIX da cobrança; 202 enquanto a busca na Asaas ainda não terminou"""
+    try:
+        payment_record = await db.asaas_payments.find_one(
+            {"asaas_payment_id": payment_id},
+            {"_id": 0, "pix_qrcode": 1, "pix_qrcode_image_id": 1}
+        )
+        # Cobrança ainda sem QR vem como {} pela projeção: só None é "não encontrado"
+        if payment_record is None:
+            raise HTTPException(status_code=404, detail="Pagamento não encontrado")
+        
+        if payment_record.get("pix_qrcode"):
+            return {"payment_id": payment_id, "pix_status": "ready", **pix_fields(payment_id, payment_record)}
+        
+        # Ainda sem QR: aguarda a busca em andamento ou inicia uma nova (ex.: após reinício)
+        pix_qrcode = await pix_qrcodes.wait(pix_qrcodes.start(db, payment_id), PIX_QRCODE_POLL_WAIT_SECONDS)
+        if pix_qrcode:
+            return {"payment_id": payment_id, "pix_status": "ready", **pix_fields(payment_id, pix_qrcode)}
+        
+        response.status_code = 202
+        return {"payment_id": payment_id, "pix_status": "pending", **pix_fields(payment_id, None)}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"❌ Erro ao obter QR Code PIX: {str(e)}")
+        raise HTTPException(status_code=500, detail="Erro ao obter QR Code PIX")
+
+@api_router.get("/pix-images/{image_id}")
+async def get_pix_image(image_id: str, request: Request):
+    """Imagem do QR Code PIX; o id é o hash do conteúdo, então a resposta nunca muda"""
+    etag = f'"{image_id}"'
+    cache_headers = {"ETag": etag, **PIX_IMAGE_CACHE_HEADERS}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=cache_headers)
+    image = await load_image(db, image_id)
+    if not image:
+        raise HTTPException(status_code=404, detail="Imagem não encontrada")
+    return Response(content=bytes(image["data"]), media_type=image.get("content_type", "image/png"), headers=cache_headers)
+
+async def upstream_pix_image(payment_id: str, image_id: Optional[str]):
+    """Fallback: PNG gerado pela Asaas (guardado ou buscado agora)"""
+    if not image_id:
+        pix_data = await get_asaas_pix_qrcode(payment_id)
+        image_id = await store_encoded_image(db, pix_data.get('encodedImage') if pix_data else None)
+        if not image_id:
+            return None
+        await db.asaas_payments.update_one({"asaas_payment_id": payment_id}, {"$set": {"pix_qrcode_image_id": image_id}})
+    return image_id, await load_image(db, image_id)
+
+@api_router.get("/payments/{payment_id}/pix/qrcode.png")
+async def get_payment_pix_image(
+    payment_id: str,
+    request: Request,
+    size: int = Query(DEFAULT_RENDER_SIZE, ge=64, le=RENDER_SIZES[-1])
+):
+    """Imagem do QR Code PIX no tamanho pedido, desenhada a partir do payload"""
+    try:
+        payment_record = await db.asaas_payments.find_one(
+            {"asaas_payment_id": payment_id},
+            {"_id": 0, "pix_qrcode": 1, "pix_qrcode_image_id": 1}
+        )
+        if payment_record is None:
+            raise HTTPException(status_code=404, detail="Pagamento não encontrado")
+        payload = payment_record.get("pix_qrcode")
+        
+        if payload and pix_renderer.available:
+            try:
+                key, served_size, image = await pix_renderer.render(payload, size)
+                etag = f'"{key[:32]}-{served_size}"'
+                headers = {"ETag": etag, **PIX_IMAGE_CACHE_HEADERS}
+                if request.headers.get("if-none-match") == etag:
+                    return Response(status_code=304, headers=headers)
+                return Response(content=image, media_type="image/png", headers=headers)
+            except Exception as e:
+                logging.error(f"❌ Erro ao desenhar QR Code PIX {payment_id}, usando imagem da Asaas: {e}")
+        
+        upstream = await upstream_pix_image(payment_id, payment_record.get("pix_qrcode_image_id"))
+        if not upstream or not upstream[1]:
+            raise HTTPException(status_code=404, detail="QR Code PIX ainda não disponível")
+        image_id, image = upstream
+        headers = {"ETag": f'"{image_id}"', **PIX_IMAGE_CACHE_HEADERS}
+        return Response(content=bytes(image["data"]), media_type=image.get("content_type", "image/png"), headers=headers)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"❌ Erro ao obter imagem do QR Code PIX: {str(e)}")
+        raise HTTPException(status_code=500, detail="Erro ao obter imagem do QR Code PIX")
+
 @api_router.post("/courses/default/set-price")
 async def set_default_course_price(price_data: dict):
     """Definir preço do curso padrão"""
@@ -1288,6 +1441,7 @@ async def set_default_course_price(price_data: dict):
             },
             upsert=True
         )
+        await collection_versions.bump(db, "courses")
         
         logging.info(f"Preço do curso padrão atualizado para: R${new_price}")
         return {"message": "Preço atualizado com sucesso", "price": new_price}
@@ -1375,7 +1529,7 @@ async def create_admin_user(user_data: AdminUserCreate):
             "password": user_data.password,  # Em produção: hash da senha
             "full_name": user_data.full_name,
             "role": user_data.role,
-            "created_at": datetime.now(timezone.utc).isoformat(),
+            "created_at": datetime.now(timezone.utc),
             "active": True
         }
         
@@ -1405,7 +1559,7 @@ async def reset_admin_password(user_id: str, request: AdminPasswordReset):
             {"id": user_id},
             {"$set": {
                 "password": request.new_password,  # Em produção: hash da senha
-                "updated_at": datetime.now(timezone.utc).isoformat()
+                "updated_at": datetime.now(timezone.utc)
             }}
         )
         
@@ -1447,45 +1601,12 @@ async def delete_admin_user(user_id: str):
         raise HTTPException(status_code=500, detail="Erro ao excluir usuário administrativo")
 
 @api_router.get("/stats/cities")
-async def get_city_stats():
+async def get_city_stats(request: Request):
     """Obter estatísticas por cidade"""
     try:
-        pipeline = [
-            {
-                "$group": {
-                    "_id": "$city",
-                    "count": {"$sum": 1},
-                    "paid": {
-                        "$sum": {
-                            "$cond": [{"$eq": ["$status", "paid"]}, 1, 0]
-                        }
-                    },
-                    "pending": {
-                        "$sum": {
-                            "$cond": [{"$eq": ["$status", "pending"]}, 1, 0]
-                        }
-                    }
-                }
-            },
-            {
-                "$sort": {"count": -1}
-            }
-        ]
-        
-        city_stats = await db.subscriptions.aggregate(pipeline).to_list(length=None)
-        
-        # Formatar resultado
-        formatted_stats = []
-        for stat in city_stats:
-            if stat["_id"]:  # Ignorar cidades vazias
-                formatted_stats.append({
-                    "city": stat["_id"],
-                    "total": stat["count"],
-                    "paid": stat["paid"],
-                    "pending": stat["pending"]
-                })
-        
-        return formatted_stats
+        versions = await collection_versions.get(db, ["subscriptions"])
+        # Lê o rollup city_stats (um documento por cidade e status) em vez de agrupar as inscrições
+        return await conditional_responses.respond(request, "stats:cities", versions, lambda: read_city_stats(db))
         
     except Exception as e:
         logging.error(f"Erro ao obter estatísticas de cidades: {str(e)}")
@@ -1620,14 +1741,18 @@ async def create_subscription(subscription: UserSubscriptionCreate):
             "temporary_password": temporary_password,
             "lgpd_consent": subscription.lgpd_consent,
             "lgpd_consent_date": datetime.now(timezone.utc),
+            "subscription_date": datetime.now(timezone.utc),
             "created_at": datetime.now(timezone.utc)
         }
+        subscription_data.update(build_lookup_fields(subscription_data))
         
         # Preparar para MongoDB
-        prepared_data = prepare_for_mongo(subscription_data)
+        prepared_data = subscription_codec.to_mongo(subscription_data)
         
         # Salvar no banco
         result = await db.subscriptions.insert_one(prepared_data)
+        await apply_subscription_change(db, None, prepared_data)
+        await collection_versions.bump(db, "subscriptions")
         
         # Enviar senha por email e WhatsApp
         email_sent = await send_password_email(subscription.email, normalized_name, temporary_password)
@@ -1654,19 +1779,13 @@ async def create_subscription(subscription: UserSubscriptionCreate):
         logging.error(f"Erro ao criar inscrição: {str(e)}")
         raise HTTPException(status_code=500, detail="Erro ao processar cadastro")
 
-@api_router.get("/subscriptions", response_model=List[UserSubscription])
-async def get_subscriptions():
-    """Get all subscriptions"""
-    subscriptions = await db.subscriptions.find().to_list(1000)
-    return [UserSubscription(**parse_from_mongo(sub)) for sub in subscriptions]
-
 @api_router.get("/subscriptions/{subscription_id}", response_model=UserSubscription)
 async def get_subscription(subscription_id: str):
     """Get subscription by ID"""
     subscription = await db.subscriptions.find_one({"id": subscription_id})
     if not subscription:
         raise HTTPException(status_code=404, detail="Inscrição não encontrada")
-    return UserSubscription(**parse_from_mongo(subscription))
+    return subscription_codec.load(subscription)
 
 @api_router.put("/subscriptions/{subscription_id}/status")
 async def update_subscription_status(subscription_id: str, status: str, payment_method: Optional[str] = None, discount: Optional[int] = None, bonus: Optional[bool] = None):
@@ -1679,13 +1798,17 @@ async def update_subscription_status(subscription_id: str, status: str, payment_
     if bonus is not None:
         update_data["bonus"] = bonus
     
-    result = await db.subscriptions.update_one(
+    previous = await db.subscriptions.find_one_and_update(
         {"id": subscription_id},
-        {"$set": update_data}
+        {"$set": update_data},
+        projection=ROLLUP_PROJECTION,
+        return_document=ReturnDocument.BEFORE
     )
     
-    if result.matched_count == 0:
+    if previous is None:
         raise HTTPException(status_code=404, detail="Inscrição não encontrada")
+    await apply_subscription_change(db, previous, {**previous, "status": status})
+    await collection_versions.bump(db, "subscriptions")
     
     return {"message": f"Status da inscrição atualizado para: {status}"}
 
@@ -1703,50 +1826,73 @@ async def reset_user_password(user_id: str, request: ResetPasswordAdminRequest):
     
     return {"message": "Senha alterada com sucesso"}
 
+def financial_stats_pipeline(now: datetime) -> List[dict]:
+    """Paid counts and revenue for today, this week and this month, computed by MongoDB"""
+    today_start = datetime.combine(now.date(), datetime.min.time(), tzinfo=timezone.utc)
+    tomorrow_start = today_start + timedelta(days=1)
+    week_start = today_start - timedelta(days=today_start.weekday())
+    month_start = today_start.replace(day=1)
+    
+    # Receita considerando desconto/bonus: bonus zera, desconto é percentual sobre o preço original
+    price = {"$ifNull": ["$original_price", 150]}
+    revenue = {
+        "$cond": [
+            "$bonus", 0,
+            {"$cond": [
+                "$discount",
+                {"$multiply": [price, {"$subtract": [1, {"$divide": ["$discount", 100]}]}]},
+                price
+            ]}
+        ]
+    }
+    
+    def window(condition):
+        return {
+            "paid": {"$sum": {"$cond": [condition, 1, 0]}},
+            "revenue": {"$sum": {"$cond": [condition, "$revenue", 0]}}
+        }
+    
+    is_today = {"$and": [{"$gte": ["$sub_date", today_start]}, {"$lt": ["$sub_date", tomorrow_start]}]}
+    in_week = {"$gte": ["$sub_date", week_start]}
+    in_month = {"$gte": ["$sub_date", month_start]}
+    
+    period_start = min(week_start, month_start)
+    return [
+        # Faixa de datas BSON: varredura nos índices (status, subscription_date) e (status, created_at)
+        {"$match": {
+            "status": {"$in": ["paid", "active"]},
+            "$or": [
+                {"subscription_date": {"$gte": period_start}},
+                {"subscription_date": {"$exists": False}, "created_at": {"$gte": period_start}}
+            ]
+        }},
+        {"$project": {
+            "_id": 0,
+            "sub_date": {"$ifNull": ["$subscription_date", "$created_at"]},
+            "revenue": revenue
+        }},
+        {"$group": {
+            "_id": None,
+            **{f"today_{k}": v for k, v in window(is_today).items()},
+            **{f"week_{k}": v for k, v in window(in_week).items()},
+            **{f"month_{k}": v for k, v in window(in_month).items()}
+        }}
+    ]
+
 @api_router.get("/admin/financial-stats")
 async def get_financial_stats():
     """Get detailed financial statistics"""
-    subscriptions = await db.subscriptions.find().to_list(1000)
-    
-    today = datetime.now(timezone.utc).date()
-    week_start = today - timedelta(days=today.weekday())
-    month_start = today.replace(day=1)
-    
-    today_paid = 0
-    week_paid = 0
-    month_paid = 0
-    today_revenue = 0
-    week_revenue = 0
-    month_revenue = 0
-    
-    for sub in subscriptions:
-        if sub.get('status') in ['paid', 'active']:
-            sub_date = datetime.fromisoformat(sub['subscription_date'].replace('Z', '+00:00')).date()
-            
-            # Calcular receita considerando desconto/bonus
-            price = sub.get('original_price', 150)
-            if sub.get('bonus'):
-                revenue = 0
-            elif sub.get('discount'):
-                revenue = price * (1 - sub['discount'] / 100)
-            else:
-                revenue = price
-            
-            if sub_date == today:
-                today_paid += 1
-                today_revenue += revenue
-            if sub_date >= week_start:
-                week_paid += 1
-                week_revenue += revenue
-            if sub_date >= month_start:
-                month_paid += 1
-                month_revenue += revenue
+    rows = await db.subscriptions.aggregate(financial_stats_pipeline(datetime.now(timezone.utc))).to_list(length=1)
+    totals = rows[0] if rows else {}
+    
+    def window(name):
+        return {"paid": totals.get(f"{name}_paid", 0), "revenue": totals.get(f"{name}_revenue", 0)}
     
     return {
-        "today": {"paid": today_paid, "revenue": today_revenue},
-        "week": {"paid": week_paid, "revenue": week_revenue},
-        "month": {"paid": month_paid, "revenue": month_revenue},
-        "total_revenue": month_revenue
+        "today": window("today"),
+        "week": window("week"),
+        "month": window("month"),
+        "total_revenue": totals.get("month_revenue", 0)
     }
 
 # User management routes
@@ -1771,7 +1917,7 @@ async def create_user(user_data: UserCreate):
 async def get_users():
     """Get all users"""
     users = await db.users.find().to_list(1000)
-    return [User(**parse_from_mongo(user)) for user in users]
+    return trusted_json([user_codec.dump(user) for user in users])
 
 @api_router.get("/users/{user_id}", response_model=User)
 async def get_user(user_id: str):
@@ -1784,10 +1930,12 @@ async def get_user(user_id: str):
 @api_router.delete("/subscriptions/{subscription_id}")
 async def delete_subscription(subscription_id: str):
     """Delete a subscription"""
-    result = await db.subscriptions.delete_one({"id": subscription_id})
+    deleted = await db.subscriptions.find_one_and_delete({"id": subscription_id}, projection=ROLLUP_PROJECTION)
     
-    if result.deleted_count == 0:
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Inscrição não encontrada")
+    await apply_subscription_change(db, deleted, None)
+    await collection_versions.bump(db, "subscriptions")
     
     logging.info(f"Inscrição excluída: {subscription_id}")
     
@@ -1796,73 +1944,100 @@ async def delete_subscription(subscription_id: str):
 # Webhook do Asaas para confirmar pagamentos
 @api_router.post("/webhook/asaas-payment")
 async def asaas_webhook(request: dict):
-    """Webhook para receber notificações de pagamento do Asaas - Versão Real"""
+    """Webhook para receber notificações de pagamento do Asaas - grava o evento e responde na hora"""
     try:
-        logging.info(f"🔔 Webhook Asaas recebido: {json.dumps(request, indent=2, default=str)}")
-        
-        event = request.get('event')
-        payment_data = request.get('payment', {})
-        
-        if event in ['PAYMENT_CONFIRMED', 'PAYMENT_RECEIVED', 'PAYMENT_OVERDUE', 'PAYMENT_DELETED']:
-            payment_id = payment_data.get('id')
-            value = payment_data.get('value')
-            customer_id = payment_data.get('customer')
-            billing_type = payment_data.get('billingType')
-            status = payment_data.get('status')
-            external_reference = payment_data.get('externalReference')
-            
-            logging.info(f"📋 Processando: Event={event}, Payment={payment_id}, Customer={customer_id}, Value=R${value}, Status={status}")
-            
-            # 1. Buscar registro de pagamento na nossa base
-            payment_record = await db.asaas_payments.find_one({
-                "asaas_payment_id": payment_id
-            })
-            
-            if not payment_record:
-                logging.warning(f"⚠️ Pagamento não encontrado na base: {payment_id}")
-                return {"status": "error", "message": "Pagamento não encontrado"}
-            
-            user_email = payment_record.get('user_email')
-            user_name = payment_record.get('user_name')
-            
-            logging.info(f"👤 Pagamento encontrado para: {user_name} ({user_email})")
-            
-            # 2. Atualizar status do pagamento
-            payment_update = {
+        event_id = await webhook_inbox.enqueue(db, request)
+    except Exception as e:
+        logging.error(f"❌ Erro ao registrar webhook Asaas: {str(e)}")
+        # Sem 200 a Asaas reenvia o evento
+        raise HTTPException(status_code=500, detail="Erro ao registrar webhook")
+    
+    if event_id is None:
+        # Reentrega de um evento já recebido: 200 para a Asaas parar de reenviar
+        logging.info(f"🔁 Webhook Asaas duplicado ignorado: {idempotency_key(request)}")
+        return {"status": "duplicate", "message": "Evento já recebido"}
+    
+    logging.info(f"🔔 Webhook Asaas recebido: {request.get('event')} - {(request.get('payment') or {}).get('id')}")
+    return {"status": "received", "event_id": str(event_id)}
+
+@api_router.get("/admin/webhooks/inbox")
+async def get_webhook_inbox_stats():
+    """Fila de webhooks: pendentes, falhas e atraso de processamento"""
+    return await webhook_inbox.snapshot()
+
+async def process_asaas_event(request: dict) -> dict:
+    """Processar um evento de pagamento da Asaas (chamado pelos workers do webhook_inbox)
+    
+    Cada coleção é atualizada com um único find_one_and_update condicionado ao status
+    atual, então eventos repetidos ou fora de ordem não desfazem nem repetem nada.
+    Erros de banco sobem para o inbox, que tenta de novo depois
+    """
+    event = request.get('event')
+    payment_data = request.get('payment', {})
+    
+    if event in PAYMENT_STATUS_GUARDS:
+        payment_id = payment_data.get('id')
+        value = payment_data.get('value')
+        customer_id = payment_data.get('customer')
+        billing_type = payment_data.get('billingType')
+        status = payment_data.get('status')
+        
+        logging.info(f"📋 Processando: Event={event}, Payment={payment_id}, Customer={customer_id}, Value=R${value}, Status={status}")
+        
+        # 1. Atualizar a cobrança, a menos que ela já esteja num status que este evento não pode sobrescrever
+        payment_filter = {"asaas_payment_id": payment_id}
+        if PAYMENT_STATUS_GUARDS[event]:
+            payment_filter["status"] = {"$nin": PAYMENT_STATUS_GUARDS[event]}
+        payment_record = await db.asaas_payments.find_one_and_update(
+            payment_filter,
+            {"$set": {
                 "status": status.lower() if status else "unknown",
-                "updated_at": datetime.now(timezone.utc).isoformat(),
+                "updated_at": datetime.now(timezone.utc),
                 "webhook_data": payment_data,
-                "processed_at": datetime.now(timezone.utc).isoformat()
-            }
-            
-            await db.asaas_payments.update_one(
-                {"asaas_payment_id": payment_id},
-                {"$set": payment_update}
-            )
+                "processed_at": datetime.now(timezone.utc)
+            }},
+            projection=PAYMENT_WEBHOOK_PROJECTION,
+            return_document=ReturnDocument.BEFORE
+        )
+        
+        if payment_record is None:
+            if await db.asaas_payments.count_documents({"asaas_payment_id": payment_id}, limit=1):
+                logging.info(f"ℹ️ Evento {event} fora de ordem ignorado: cobrança {payment_id} já finalizada")
+                return {"status": "ignored", "message": "Cobrança já finalizada", "payment_id": payment_id}
+            logging.warning(f"⚠️ Pagamento não encontrado na base: {payment_id}")
+            return {"status": "error", "message": "Pagamento não encontrado"}
+        
+        user_email = payment_record.get('user_email')
+        user_name = payment_record.get('user_name')
+        
+        logging.info(f"👤 Pagamento encontrado para: {user_name} ({user_email})")
+        
+        # 2. Se pagamento foi confirmado, liberar curso
+        if event in ['PAYMENT_CONFIRMED', 'PAYMENT_RECEIVED'] and status in ['RECEIVED', 'CONFIRMED']:
             
-            # 3. Se pagamento foi confirmado, liberar curso
-            if event in ['PAYMENT_CONFIRMED', 'PAYMENT_RECEIVED'] and status in ['RECEIVED', 'CONFIRMED']:
-                
-                # Atualizar subscription
-                subscription_update = {
+            # Compare-and-set: só quem tira a inscrição de "não paga" libera o curso e notifica
+            previous = await db.subscriptions.find_one_and_update(
+                {"email_lower": normalize_email(user_email), "status": {"$ne": "paid"}},
+                {"$set": {
                     "status": "paid",
                     "course_access": "granted",
-                    "payment_confirmed_at": datetime.now(timezone.utc).isoformat(),
+                    "payment_confirmed_at": datetime.now(timezone.utc),
                     "asaas_payment_status": status,
                     "asaas_billing_type": billing_type
-                }
+                }},
+                projection={**ROLLUP_PROJECTION, "phone": 1},
+                return_document=ReturnDocument.BEFORE
+            )
+            
+            if previous is not None:
+                await apply_subscription_change(db, previous, {**previous, "status": "paid"})
+                await collection_versions.bump(db, "subscriptions")
                 
-                result = await db.subscriptions.update_one(
-                    {"email": user_email},
-                    {"$set": subscription_update}
-                )
+                logging.info(f"✅ Curso liberado para: {user_name} ({user_email})")
                 
-                if result.modified_count > 0:
-                    logging.info(f"✅ Curso liberado para: {user_name} ({user_email})")
-                    
-                    # Enviar notificação por WhatsApp
-                    try:
-                        whatsapp_message = f"""🎉 *CURSO LIBERADO!*
+                # Enviar notificação por WhatsApp
+                try:
+                    whatsapp_message = f"""🎉 *CURSO LIBERADO!*
 
 Olá *{user_name}*!
 
@@ -1886,59 +2061,71 @@ Olá *{user_name}*!
 • Mecânica Básica (4h)
 
 Bons estudos! 🚀"""
-                        
-                        # Buscar telefone do usuário
-                        user_data = await db.subscriptions.find_one({"email": user_email})
-                        if user_data and user_data.get('phone'):
-                            # Simular envio por WhatsApp (em produção, usar API real)
-                            logging.info(f"📱 WhatsApp enviado para {user_data.get('phone')}: {whatsapp_message}")
-                            
-                    except Exception as wpp_error:
-                        logging.error(f"❌ Erro ao enviar WhatsApp: {wpp_error}")
                     
-                    # Retornar resposta de sucesso
-                    return {
-                        "status": "success",
-                        "message": "Pagamento processado e curso liberado",
-                        "user_name": user_name,
-                        "user_email": user_email, 
-                        "payment_id": payment_id,
-                        "amount": value,
-                        "course_access": "granted"
-                    }
-                else:
-                    logging.error(f"❌ Falha ao liberar curso para: {user_email}")
-                    return {"status": "error", "message": "Falha ao liberar curso"}
-            
-            # 4. Se pagamento foi cancelado/vencido
-            elif event in ['PAYMENT_OVERDUE', 'PAYMENT_DELETED']:
-                await db.subscriptions.update_one(
-                    {"email": user_email},
-                    {"$set": {
-                        "status": "cancelled" if event == 'PAYMENT_DELETED' else "overdue",
-                        "course_access": "denied",
-                        "asaas_payment_status": status
-                    }}
-                )
-                
-                logging.info(f"⚠️ Pagamento {event.lower()}: {user_name} ({user_email})")
+                    if previous.get('phone'):
+                        # Simular envio por WhatsApp (em produção, usar API real)
+                        logging.info(f"📱 WhatsApp enviado para {previous.get('phone')}: {whatsapp_message}")
+                        
+                except Exception as wpp_error:
+                    logging.error(f"❌ Erro ao enviar WhatsApp: {wpp_error}")
                 
+                # Retornar resposta de sucesso
                 return {
-                    "status": "processed",
-                    "message": f"Pagamento {event.lower()}",
-                    "user_email": user_email,
-                    "payment_id": payment_id
+                    "status": "success",
+                    "message": "Pagamento processado e curso liberado",
+                    "user_name": user_name,
+                    "user_email": user_email, 
+                    "payment_id": payment_id,
+                    "amount": value,
+                    "course_access": "granted"
                 }
+            elif await db.subscriptions.count_documents({"email_lower": normalize_email(user_email)}, limit=1):
+                logging.info(f"ℹ️ Curso já liberado para: {user_email}")
+                return {"status": "success", "message": "Curso já liberado", "payment_id": payment_id, "course_access": "granted"}
+            else:
+                logging.error(f"❌ Falha ao liberar curso para: {user_email}")
+                return {"status": "error", "message": "Falha ao liberar curso"}
+        
+        # 3. Se pagamento foi cancelado/vencido (nunca revoga uma inscrição já paga)
+        elif event in ['PAYMENT_OVERDUE', 'PAYMENT_DELETED']:
+            new_status = "cancelled" if event == 'PAYMENT_DELETED' else "overdue"
+            # Evento repetido não reescreve a inscrição (nem versão, nem contagem por cidade)
+            previous = await db.subscriptions.find_one_and_update(
+                {"email_lower": normalize_email(user_email), "status": {"$nin": ["paid", new_status]}},
+                {"$set": {
+                    "status": new_status,
+                    "course_access": "denied",
+                    "asaas_payment_status": status
+                }},
+                projection=ROLLUP_PROJECTION,
+                return_document=ReturnDocument.BEFORE
+            )
+            if previous is not None:
+                await apply_subscription_change(db, previous, {**previous, "status": new_status})
+                await collection_versions.bump(db, "subscriptions")
             
-            return {"status": "processed", "message": "Webhook processado"}
-        
-        else:
-            logging.info(f"ℹ️ Evento não processado: {event}")
-            return {"status": "ignored", "message": f"Evento {event} não processado"}
+            logging.info(f"⚠️ Pagamento {event.lower()}: {user_name} ({user_email})")
             
-    except Exception as e:
-        logging.error(f"❌ Erro no webhook Asaas: {str(e)}")
-        return {"status": "error", "message": str(e)}
+            return {
+                "status": "processed",
+                "message": f"Pagamento {event.lower()}",
+                "user_email": user_email,
+                "payment_id": payment_id
+            }
+        
+        return {"status": "processed", "message": "Webhook processado"}
+    
+    else:
+        logging.info(f"ℹ️ Evento não processado: {event}")
+        return {"status": "ignored", "message": f"Evento {event} não processado"}
+
+# Eventos da Asaas processados em segundo plano: em paralelo entre cobranças, em ordem na mesma cobrança
+webhook_inbox = WebhookInbox(
+    process_asaas_event,
+    partitions=int(os.environ.get('WEBHOOK_PARTITIONS', '8')),
+    lease_seconds=float(os.environ.get('WEBHOOK_LEASE_SECONDS', '60')),
+    max_attempts=int(os.environ.get('WEBHOOK_MAX_ATTEMPTS', '5'))
+)
 
 @api_router.post("/payment/verify-status")
 async def verify_payment_status(request: dict):
@@ -1950,7 +2137,8 @@ async def verify_payment_status(request: dict):
             raise HTTPException(status_code=400, detail="Email é obrigatório")
         
         # Buscar inscrição
-        subscription = await db.subscriptions.find_one({"email": email})
+        email_lower = normalize_email(email)
+        subscription = await db.subscriptions.find_one({"email_lower": email_lower}, {"_id": 1})
         
         if not subscription:
             raise HTTPException(status_code=404, detail="Inscrição não encontrada")
@@ -1960,16 +2148,21 @@ async def verify_payment_status(request: dict):
         import random
         if random.random() > 0.3:
             # Atualizar como pago
-            await db.subscriptions.update_one(
-                {"email": email},
+            previous = await db.subscriptions.find_one_and_update(
+                {"email_lower": email_lower},
                 {
                     "$set": {
                         "status": "paid",
-                        "payment_confirmed_at": datetime.now(timezone.utc).isoformat(),
+                        "payment_confirmed_at": datetime.now(timezone.utc),
                         "course_access": "granted"
                     }
-                }
+                },
+                projection=ROLLUP_PROJECTION,
+                return_document=ReturnDocument.BEFORE
             )
+            if previous is not None:
+                await apply_subscription_change(db, previous, {**previous, "status": "paid"})
+            await collection_versions.bump(db, "subscriptions")
             
             return {
                 "status": "paid",
@@ -2006,18 +2199,20 @@ async def get_module_exam(module_id: str):
         raise HTTPException(status_code=404, detail="Exame não encontrado para este módulo")
     return Exam(**parse_from_mongo(exam))
 
+async def ask_llm(session_id: str, message: str) -> str:
+    """Uma tentativa de resposta do LLM (chat novo a cada tentativa, sem histórico duplicado)"""
+    chat = LlmChat(
+        api_key=os.getenv('EMERGENT_LLM_KEY'),
+        session_id=session_id,
+        system_message=get_bot_context()
+    ).with_model("openai", "gpt-4o-mini")
+    return await chat.send_message(UserMessage(text=message))
+
 # Chat Bot Routes
 @api_router.post("/chat", response_model=ChatResponse)
 async def chat_with_bot(chat_request: ChatRequest):
     """Chat com o bot IA dos taxistas"""
     try:
-        # Inicializar o chat com LLM
-        chat = LlmChat(
-            api_key=os.getenv('EMERGENT_LLM_KEY'),
-            session_id=chat_request.session_id,
-            system_message=get_bot_context()
-        ).with_model("openai", "gpt-4o-mini")
-        
         # Verificar se é uma solicitação de reset de senha
         if detect_password_reset_request(chat_request.message):
             response_text = """Entendo que você precisa resetar sua senha! 
@@ -2036,7 +2231,7 @@ Para questões mais técnicas, também pode entrar em contato com nosso suporte
         elif detect_value_question(chat_request.message):
             try:
                 # Buscar preço atual do curso
-                price_response = await get_default_course_price()
+                price_response = await fetch_default_course_price()
                 current_price = price_response.get("price", 150.0)
                 
                 response_text = f"💰 **VALOR DO CURSO EAD TAXISTA ES:**\n\n" \
@@ -2054,9 +2249,10 @@ Para questões mais técnicas, também pode entrar em contato com nosso suporte
                 response_text = "Os valores do treinamento serão divulgados em breve. Assim que tivermos os preços definidos, iremos comunicar através dos nossos canais oficiais. Enquanto isso, você pode se cadastrar para receber as informações assim que disponíveis!"
         
         else:
-            # Usar LLM para resposta normal
-            user_message = UserMessage(text=chat_request.message)
-            response_text = await chat.send_message(user_message)
+            # Usar LLM para resposta normal (circuito aberto cai direto na resposta de fallback)
+            response_text = await llm_resilience.call(
+                lambda: ask_llm(chat_request.session_id, chat_request.message)
+            )
         
         # Salvar no histórico
         await save_chat_message(
@@ -2127,86 +2323,77 @@ async def request_password_reset(reset_request: PasswordResetRequest):
         logging.error(f"Erro ao processar reset de senha: {str(e)}")
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
-# Statistics routes for admin
-@api_router.get("/admin/stats")
-async def get_admin_stats():
-    """Get admin statistics"""
-    total_subscriptions = await db.subscriptions.count_documents({})
-    total_users = await db.users.count_documents({})
-    active_users = await db.users.count_documents({"subscription_status": "active"})
-    completed_users = await db.users.count_documents({"subscription_status": "completed"})
-    
-    # Subscription status breakdown
-    pending_subscriptions = await db.subscriptions.count_documents({"status": "pending"})
-    paid_subscriptions = await db.subscriptions.count_documents({"status": "paid"})
-    active_subscriptions = await db.subscriptions.count_documents({"status": "active"})
+async def count_by_status(collection, status_field: str, statuses: List[str]):
+    """Total de documentos e contagem por status em uma única agregação $facet"""
+    pipeline = [{
+        "$facet": {
+            "total": [{"$count": "count"}],
+            "by_status": [
+                {"$match": {status_field: {"$in": statuses}}},
+                {"$group": {"_id": f"${status_field}", "count": {"$sum": 1}}}
+            ]
+        }
+    }]
+    result = (await collection.aggregate(pipeline).to_list(length=1))[0]
+    total = result["total"][0]["count"] if result["total"] else 0
+    counts = {status: 0 for status in statuses}
+    for row in result["by_status"]:
+        counts[row["_id"]] = row["count"]
+    return total, counts
+
+async def compute_admin_stats():
+    (total_subscriptions, subscription_counts), (total_users, user_counts) = await asyncio.gather(
+        count_by_status(db.subscriptions, "status", ["pending", "paid", "active"]),
+        count_by_status(db.users, "subscription_status", ["active", "completed"])
+    )
     
     return {
         "total_subscriptions": total_subscriptions,
         "total_users": total_users,
-        "active_users": active_users,
-        "completed_users": completed_users,
-        "pending_subscriptions": pending_subscriptions,
-        "paid_subscriptions": paid_subscriptions,
-        "active_subscriptions": active_subscriptions,
+        "active_users": user_counts["active"],
+        "completed_users": user_counts["completed"],
+        "pending_subscriptions": subscription_counts["pending"],
+        "paid_subscriptions": subscription_counts["paid"],
+        "active_subscriptions": subscription_counts["active"],
         "conversion_rate": round((total_users / total_subscriptions * 100) if total_subscriptions > 0 else 0, 2)
     }
 
+# Statistics routes for admin
+@api_router.get("/admin/stats")
+async def get_admin_stats():
+    """Get admin statistics"""
+    return await admin_stats_cache.get("admin_stats", compute_admin_stats)
+
 # Video Management Endpoints
 @api_router.get("/modules")
-async def get_modules():
+async def get_modules(request: Request):
     """Get course modules with real videos from database"""
     try:
-        # Buscar módulos e vídeos reais do banco
-        modules_cursor = db.course_modules.find({"active": True})
-        modules = await modules_cursor.to_list(length=None)
+        # Catálogo pré-computado em memória (reconstruído a cada alteração de conteúdo)
+        snapshot = await course_catalog.get(db)
         
-        result_modules = []
-        for module in modules:
-            # Buscar vídeos do módulo
-            videos_cursor = db.course_videos.find({"module_id": module.get("id")})
-            videos = await videos_cursor.to_list(length=None)
+        async def build():
+            result_modules = list(snapshot.modules)
             
-            # Formatar dados do módulo
-            module_data = {
-                "id": module.get("id"),
-                "name": module.get("name", ""),
-                "description": module.get("description", ""),
-                "duration_hours": module.get("duration_hours", 0),
-                "color": module.get("color", "#3b82f6"),
-                "videos": []
-            }
+            logging.info(f"✅ Retornando {len(result_modules)} módulos reais")
             
-            # Formatar dados dos vídeos
-            for video in videos:
-                video_data = {
-                    "id": video.get("id"),
-                    "title": video.get("title", ""),
-                    "description": video.get("description", ""),
-                    "youtube_url": video.get("youtube_url", ""),
-                    "duration_minutes": video.get("duration_minutes", 0),
-                    "created_at": video.get("created_at")
-                }
-                module_data["videos"].append(video_data)
+            # Se não há dados reais, retornar módulo de exemplo
+            if not result_modules:
+                result_modules = [
+                    {
+                        "id": "default_module",
+                        "name": "Curso EAD Taxista ES",
+                        "description": "Curso completo para taxistas do Espírito Santo",
+                        "duration_hours": 28,
+                        "color": "#3b82f6",
+                        "videos": []
+                    }
+                ]
             
-            result_modules.append(module_data)
-        
-        logging.info(f"✅ Retornando {len(result_modules)} módulos reais")
+            return {"modules": result_modules}
         
-        # Se não há dados reais, retornar módulo de exemplo
-        if not result_modules:
-            result_modules = [
-                {
-                    "id": "default_module",
-                    "name": "Curso EAD Taxista ES",
-                    "description": "Curso completo para taxistas do Espírito Santo",
-                    "duration_hours": 28,
-                    "color": "#3b82f6",
-                    "videos": []
-                }
-            ]
-        
-        return {"modules": result_modules}
+        # A versão do snapshot identifica o conteúdo: sem reler o banco a cada visita
+        return await conditional_responses.respond(request, "modules", (snapshot.version,), build)
         
     except Exception as e:
         logging.error(f"Error getting modules: {e}")
@@ -2239,6 +2426,7 @@ async def create_course_module(module: CourseModuleCreate):
         
         result = await db.course_modules.insert_one(new_module.dict())
         new_module.id = str(result.inserted_id)
+        await course_catalog.changed(db)
         
         return {"message": "Module created successfully", "module": new_module.dict()}
     except Exception as e:
@@ -2249,11 +2437,8 @@ async def create_course_module(module: CourseModuleCreate):
 async def get_module_videos(module_id: str):
     """Get all videos for a specific module"""
     try:
-        videos = await db.course_videos.find({"module_id": module_id}).sort("order", 1).to_list(None)
-        # Convert ObjectId to string
-        for video in videos:
-            video["_id"] = str(video["_id"])
-        return {"videos": videos}
+        snapshot = await course_catalog.get(db)
+        return {"videos": snapshot.videos_by_module.get(module_id, [])}
     except Exception as e:
         logging.error(f"Error getting module videos: {e}")
         raise HTTPException(status_code=500, detail="Failed to get videos")
@@ -2288,6 +2473,7 @@ async def create_course_video(video: CourseVideoCreate):
         
         result = await db.course_videos.insert_one(new_video.dict())
         new_video.id = str(result.inserted_id)
+        await course_catalog.changed(db)
         
         return {"message": "Video created successfully", "video": new_video.dict()}
     except HTTPException:
@@ -2303,6 +2489,7 @@ async def delete_course_video(video_id: str):
         result = await db.course_videos.delete_one({"id": video_id})
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Video not found")
+        await course_catalog.changed(db)
         
         return {"message": "Video deleted successfully"}
     except HTTPException:
@@ -2312,20 +2499,24 @@ async def delete_course_video(video_id: str):
         raise HTTPException(status_code=500, detail="Failed to delete video")
 
 @api_router.get("/questions/{module_id}")
-async def get_module_questions(module_id: str):
+async def get_module_questions(module_id: str, request: Request):
     """Get all questions for a specific module"""
     try:
-        questions = await db.questions.find({"module_id": module_id}).to_list(None)
-        # Convert ObjectId to string and organize by difficulty
-        organized_questions = {"facil": [], "media": [], "dificil": []}
-        
-        for question in questions:
-            question["_id"] = str(question["_id"])
-            difficulty = question.get("difficulty", "facil")
-            if difficulty in organized_questions:
-                organized_questions[difficulty].append(question)
+        async def build():
+            questions = await db.questions.find({"module_id": module_id}).to_list(None)
+            # Convert ObjectId to string and organize by difficulty
+            organized_questions = {"facil": [], "media": [], "dificil": []}
+            
+            for question in questions:
+                question["_id"] = str(question["_id"])
+                difficulty = question.get("difficulty", "facil")
+                if difficulty in organized_questions:
+                    organized_questions[difficulty].append(question)
+            
+            return {"questions": organized_questions}
         
-        return {"questions": organized_questions}
+        versions = await collection_versions.get(db, ["questions"])
+        return await conditional_responses.respond(request, f"questions:{module_id}", versions, build)
     except Exception as e:
         logging.error(f"Error getting module questions: {e}")
         raise HTTPException(status_code=500, detail="Failed to get questions")
@@ -2354,6 +2545,8 @@ async def create_question(question: QuestionCreate):
         
         result = await db.questions.insert_one(new_question.dict())
         new_question.id = str(result.inserted_id)
+        await collection_versions.bump(db, "questions")
+        await course_catalog.changed(db)
         
         return {"message": "Question created successfully", "question": new_question.dict()}
     except HTTPException:
@@ -2878,6 +3071,8 @@ async def delete_subscription(subscription_id: str):
         
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Usuário não foi excluído")
+        await apply_subscription_change(db, subscription, None)
+        await collection_versions.bump(db, "subscriptions")
         
         # Também excluir dados relacionados de pagamento se existirem
         await db.asaas_payments.delete_many({"user_email": subscription.get("email")})
@@ -2896,96 +3091,246 @@ async def delete_subscription(subscription_id: str):
         logging.error(f"❌ Erro ao excluir subscription: {str(e)}")
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
+# Campos exibidos nas listagens do Admin EAD (nunca trazer senha ou foto)
+SUBSCRIPTION_LIST_PROJECTION = {
+    "id": 1, "name": 1, "email": 1, "phone": 1, "cpf": 1, "car_plate": 1,
+    "license_number": 1, "city": 1, "status": 1, "course_access": 1,
+    "created_at": 1, "asaas_payment_id": 1, "asaas_customer_id": 1
+}
+SUBSCRIPTION_SORT_FIELDS = {"created_at", "name", "city", "status"}
+
+PAYMENT_LIST_PROJECTION = {
+    "id": 1, "user_name": 1, "user_email": 1, "amount": 1, "status": 1,
+    "payment_method": 1, "created_at": 1, "asaas_payment_id": 1,
+    "asaas_customer_id": 1, "due_date": 1, "external_reference": 1
+}
+PAYMENT_SORT_FIELDS = {"created_at", "amount", "status"}
+# O webhook só precisa saber de quem é a cobrança (nunca carregar QR Code ou payload antigo)
+PAYMENT_WEBHOOK_PROJECTION = {"_id": 0, "asaas_payment_id": 1, "user_email": 1, "user_name": 1}
+# Status da cobrança que cada evento não pode sobrescrever (eventos fora de ordem)
+PAYMENT_STATUS_GUARDS = {
+    "PAYMENT_CONFIRMED": ["received"],
+    "PAYMENT_RECEIVED": [],
+    "PAYMENT_OVERDUE": ["confirmed", "received"],
+    "PAYMENT_DELETED": ["confirmed", "received"],
+}
+
+ADMIN_USER_LIST_PROJECTION = {
+    "id": 1, "username": 1, "full_name": 1, "role": 1, "active": 1,
+    "created_at": 1, "last_login": 1
+}
+
+def resolve_sort(sort: Optional[str], order: str, allowed: set):
+    """Validar parâmetros de ordenação das listagens"""
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order deve ser 'asc' ou 'desc'")
+    if sort and sort not in allowed:
+        raise HTTPException(status_code=400, detail=f"sort deve ser um de: {', '.join(sorted(allowed))}")
+    return sort or "_id", order == "desc"
+
+def stream_list(request: Request, stream: Optional[str], collection, query: dict, projection: dict, sort_field: str, descending: bool, after: Optional[str], transform):
+    """Exportar a listagem inteira em streaming quando solicitado (?stream= ou Accept: application/x-ndjson)"""
+    stream_mode = resolve_stream_mode(request, stream)
+    if not stream_mode:
+        return None
+    try:
+        cursor = sorted_cursor(collection, query, projection, sort_field, descending, after)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return stream_cursor(cursor, transform, stream_mode)
+
+async def fetch_list_page(response: Response, collection, query: dict, projection: dict, sort_field: str, descending: bool, after: Optional[str], limit: Optional[int]):
+    """Buscar uma página da listagem e expor o cursor da próxima no header X-Next-Cursor
+
+    O painel admin segue o X-Next-Cursor até o fim; nenhuma requisição lê a coleção inteira
+    """
+    try:
+        documents, next_cursor = await fetch_page(collection, query, projection, sort_field, descending, after, limit)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return documents
+
+def format_admin_subscription(sub: dict) -> dict:
+    """Formatar inscrição para o Admin EAD"""
+    return {
+        "id": sub.get("id", str(sub.get("_id", ""))),
+        "name": sub.get("name", ""),
+        "email": sub.get("email", ""),
+        "phone": sub.get("phone", ""),
+        "cpf": sub.get("cpf", ""),
+        "car_plate": sub.get("car_plate", ""),
+        "license_number": sub.get("license_number", ""),
+        "city": sub.get("city", ""),
+        "payment_status": sub.get("status", "pending"),
+        "payment_value": 150.0,  # Valor padrão do curso
+        "created_at": sub.get("created_at", datetime.now(timezone.utc).isoformat()),
+        "course_progress": 0 if sub.get("status") == "pending" else 100,
+        "status": sub.get("course_access", "pending"),
+        "course_access": sub.get("course_access", "denied"),
+        "asaas_payment_id": sub.get("asaas_payment_id", ""),
+        "asaas_customer_id": sub.get("asaas_customer_id", "")
+    }
+
+def format_admin_payment(payment: dict) -> dict:
+    """Formatar pagamento para o Admin EAD"""
+    return {
+        "id": payment.get("id", str(payment.get("_id", ""))),
+        "user_name": payment.get("user_name", ""),
+        "user_email": payment.get("user_email", ""),
+        "amount": payment.get("amount", 0),
+        "status": "completed" if payment.get("status") == "received" else payment.get("status", "pending"),
+        "method": payment.get("payment_method", "PIX").lower(),
+        "created_at": payment.get("created_at", datetime.now(timezone.utc).isoformat()),
+        "asaas_id": payment.get("asaas_payment_id", ""),
+        "asaas_customer_id": payment.get("asaas_customer_id", ""),
+        "due_date": payment.get("due_date", ""),
+        "external_reference": payment.get("external_reference", "")
+    }
+
+def date_range_filter(start: Optional[datetime], end: Optional[datetime]) -> Optional[dict]:
+    """Filtro de intervalo [start, end) sobre uma data BSON (datas sem fuso são tratadas como UTC)"""
+    bounds = {}
+    for op, value in (("$gte", start), ("$lt", end)):
+        if value is not None:
+            bounds[op] = value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    if "$gte" in bounds and "$lt" in bounds and bounds["$gte"] >= bounds["$lt"]:
+        raise HTTPException(status_code=400, detail="created_from deve ser anterior a created_to")
+    return bounds or None
+
+def subscription_list_query(
+    status: Optional[str],
+    city: Optional[str],
+    course_access: Optional[str],
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None
+) -> dict:
+    """Montar filtro das listagens de inscrições"""
+    query = {}
+    if status:
+        query["status"] = status
+    if city:
+        query["city"] = city
+    if course_access:
+        query["course_access"] = course_access
+    created_range = date_range_filter(created_from, created_to)
+    if created_range:
+        query["created_at"] = created_range
+    return query
+
 @app.get("/api/subscriptions")
-async def get_all_subscriptions():
-    """Get all subscriptions for admin dashboard - DADOS REAIS"""
-    try:
-        # Buscar subscriptions reais do banco
-        subscriptions_cursor = db.subscriptions.find({})
-        subscriptions = await subscriptions_cursor.to_list(length=None)
-        
-        real_subscriptions = []
-        for sub in subscriptions:
-            # Converter ObjectId para string e formatar dados
-            subscription_data = {
-                "id": sub.get("id", str(sub.get("_id", ""))),
-                "name": sub.get("name", ""),
-                "email": sub.get("email", ""),
-                "phone": sub.get("phone", ""),
-                "cpf": sub.get("cpf", ""),
-                "car_plate": sub.get("car_plate", ""),
-                "license_number": sub.get("license_number", ""),
-                "city": sub.get("city", ""),
-                "payment_status": sub.get("status", "pending"),
-                "payment_value": 150.0,  # Valor padrão do curso
-                "created_at": sub.get("created_at", datetime.now(timezone.utc).isoformat()),
-                "course_progress": 0 if sub.get("status") == "pending" else 100,
-                "status": sub.get("course_access", "pending"),
-                "course_access": sub.get("course_access", "denied"),
-                "asaas_payment_id": sub.get("asaas_payment_id", ""),
-                "asaas_customer_id": sub.get("asaas_customer_id", "")
-            }
-            real_subscriptions.append(subscription_data)
+async def get_all_subscriptions(
+    request: Request,
+    response: Response,
+    after: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    sort: Optional[str] = None,
+    order: str = "desc",
+    status: Optional[str] = None,
+    city: Optional[str] = None,
+    course_access: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    stream: Optional[str] = None
+):
+    """Get subscriptions for admin dashboard - paginado por cursor (?after=&limit=) ou em streaming (?stream=)"""
+    sort_field, descending = resolve_sort(sort, order, SUBSCRIPTION_SORT_FIELDS)
+    query = subscription_list_query(status, city, course_access, created_from, created_to)
+    streamed = stream_list(
+        request, stream, db.subscriptions, query, SUBSCRIPTION_LIST_PROJECTION,
+        sort_field, descending, after, format_admin_subscription
+    )
+    if streamed:
+        return streamed
+    try:
+        subscriptions = await fetch_list_page(
+            response, db.subscriptions, query,
+            SUBSCRIPTION_LIST_PROJECTION, sort_field, descending, after, limit
+        )
+        real_subscriptions = [format_admin_subscription(sub) for sub in subscriptions]
         
         logging.info(f"✅ Retornando {len(real_subscriptions)} subscriptions reais do banco")
+        return trusted_json(real_subscriptions, response)
         
-        # Se não há dados reais, retornar lista vazia em vez de mock
-        if not real_subscriptions:
-            logging.info("⚠️ Nenhuma subscription encontrada no banco")
-            return []
-            
-        return real_subscriptions
-        
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"❌ Erro ao buscar subscriptions reais: {e}")
         return []
 
 @app.get("/api/users")
-async def get_all_users():
+async def get_all_users(
+    request: Request,
+    response: Response,
+    after: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    sort: Optional[str] = None,
+    order: str = "desc",
+    status: Optional[str] = None,
+    city: Optional[str] = None,
+    course_access: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None
+):
     """Get all users for admin dashboard"""
     try:
         # Return same data as subscriptions for compatibility
-        subscriptions = await get_all_subscriptions()
+        subscriptions = await get_all_subscriptions(
+            request, response, after=after, limit=limit, sort=sort, order=order,
+            status=status, city=city, course_access=course_access,
+            created_from=created_from, created_to=created_to
+        )
         return subscriptions
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error getting users: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/payments")
-async def get_all_payments():
-    """Get all payments for admin dashboard - DADOS REAIS"""
-    try:
-        # Buscar pagamentos reais do banco
-        payments_cursor = db.asaas_payments.find({})
-        payments = await payments_cursor.to_list(length=None)
-        
-        real_payments = []
-        for payment in payments:
-            # Mapear dados do pagamento
-            payment_data = {
-                "id": payment.get("id", str(payment.get("_id", ""))),
-                "user_name": payment.get("user_name", ""),
-                "user_email": payment.get("user_email", ""),
-                "amount": payment.get("amount", 0),
-                "status": "completed" if payment.get("status") == "received" else payment.get("status", "pending"),
-                "method": payment.get("payment_method", "PIX").lower(),
-                "created_at": payment.get("created_at", datetime.now(timezone.utc).isoformat()),
-                "asaas_id": payment.get("asaas_payment_id", ""),
-                "asaas_customer_id": payment.get("asaas_customer_id", ""),
-                "due_date": payment.get("due_date", ""),
-                "external_reference": payment.get("external_reference", "")
-            }
-            real_payments.append(payment_data)
+async def get_all_payments(
+    request: Request,
+    response: Response,
+    after: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    sort: Optional[str] = None,
+    order: str = "desc",
+    status: Optional[str] = None,
+    user_email: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    stream: Optional[str] = None
+):
+    """Get payments for admin dashboard - paginado por cursor (?after=&limit=) ou em streaming (?stream=)"""
+    sort_field, descending = resolve_sort(sort, order, PAYMENT_SORT_FIELDS)
+    query = {}
+    if status:
+        query["status"] = status
+    if user_email:
+        query["user_email"] = user_email
+    created_range = date_range_filter(created_from, created_to)
+    if created_range:
+        query["created_at"] = created_range
+    streamed = stream_list(
+        request, stream, db.asaas_payments, query, PAYMENT_LIST_PROJECTION,
+        sort_field, descending, after, format_admin_payment
+    )
+    if streamed:
+        return streamed
+    try:
+        payments = await fetch_list_page(
+            response, db.asaas_payments, query,
+            PAYMENT_LIST_PROJECTION, sort_field, descending, after, limit
+        )
+        real_payments = [format_admin_payment(payment) for payment in payments]
         
         logging.info(f"✅ Retornando {len(real_payments)} pagamentos reais do banco")
+        return trusted_json(real_payments, response)
         
-        if not real_payments:
-            logging.info("⚠️ Nenhum pagamento encontrado no banco")
-            return []
-            
-        return real_payments
-        
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"❌ Erro ao buscar pagamentos reais: {e}")
         return []
@@ -3016,26 +3361,41 @@ async def get_all_courses():
 async def get_all_cities():
     """Get city statistics for admin dashboard"""
     try:
-        mock_cities = [
-            {"city": "Vitória", "count": 150, "percentage": 35},
-            {"city": "Vila Velha", "count": 120, "percentage": 28},
-            {"city": "Serra", "count": 90, "percentage": 21},
-            {"city": "Cariacica", "count": 68, "percentage": 16}
-        ]
+        cities = await read_city_stats(db)
+        total = sum(city["total"] for city in cities)
         
-        return mock_cities
+        return [
+            {
+                **city,
+                "count": city["total"],
+                "percentage": round(city["total"] / total * 100) if total else 0
+            }
+            for city in cities
+        ]
         
     except Exception as e:
         logger.error(f"Error getting cities: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/admin-users")
-async def get_admin_users():
+async def get_admin_users(
+    response: Response,
+    after: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    active: Optional[bool] = None,
+    role: Optional[str] = None
+):
     """Get admin users for admin dashboard - DADOS REAIS"""
+    query = {}
+    if active is not None:
+        query["active"] = active
+    if role:
+        query["role"] = role
     try:
-        # Buscar usuários admin reais do banco
-        admin_users_cursor = db.admin_users.find({})
-        admin_users = await admin_users_cursor.to_list(length=None)
+        admin_users = await fetch_list_page(
+            response, db.admin_users, query,
+            ADMIN_USER_LIST_PROJECTION, "_id", True, after, limit
+        )
         
         real_admin_users = []
         for admin in admin_users:
@@ -3053,12 +3413,13 @@ async def get_admin_users():
         logging.info(f"✅ Retornando {len(real_admin_users)} usuários admin reais")
         
         # Se não há usuários admin, retornar lista vazia
-        if not real_admin_users:
+        if not real_admin_users and not after:
             logging.warning("⚠️ Nenhum usuário admin encontrado no banco")
-            return []
         
         return real_admin_users
         
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"❌ Erro ao buscar usuários admin: {str(e)}")
         return []
@@ -3108,29 +3469,31 @@ async def admin_login(request: dict):
         logging.error(f"❌ Erro no login admin: {str(e)}")
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
+@api_router.get("/admin/asaas/customer-cache")
+async def get_asaas_customer_cache_stats():
+    """Acertos e faltas do cache de clientes Asaas por CPF"""
+    return asaas_customers.snapshot()
+
+@api_router.get("/admin/resilience")
+async def get_resilience_state():
+    """Estado dos circuit breakers (Asaas, Moodle, LLM) e do orçamento de novas tentativas"""
+    return resilience_snapshot()
+
 @api_router.get("/debug/asaas-info/{payment_id}")
 async def debug_asaas_payment(payment_id: str):
     """Debug - verificar dados do pagamento Asaas"""
     try:
         # Buscar no nosso banco
-        payment_record = await db.asaas_payments.find_one({"asaas_payment_id": payment_id})
+        payment_record = await db.asaas_payments.find_one(
+            {"asaas_payment_id": payment_id},
+            {"_id": 0, "amount": 1, "user_name": 1, "created_at": 1}
+        )
         
         if not payment_record:
             raise HTTPException(status_code=404, detail="Pagamento não encontrado")
         
         # Verificar na Asaas
-        headers = {
-            'access_token': ASAAS_TOKEN,
-            'Content-Type': 'application/json'
-        }
-        
-        asaas_response = requests.get(
-            f"{ASAAS_API_URL}/payments/{payment_id}",
-            headers=headers,
-            timeout=30
-        )
-        
-        asaas_data = asaas_response.json() if asaas_response.status_code == 200 else None
+        asaas_data = await asaas_client.get_payment(payment_id)
         
         return {
             "our_record": {
@@ -3187,6 +3550,7 @@ async def clear_all_data(request: dict):
         collections_to_clear = [
             'subscriptions',
             'asaas_payments', 
+            IMAGE_COLLECTION,
             'admin_users',
             'courses',
             'payments',
@@ -3210,6 +3574,9 @@ async def clear_all_data(request: dict):
                     'error': str(e)
                 })
         
+        await rebuild_city_rollup(db)
+        await collection_versions.bump(db, "subscriptions", "courses")
+        
         # Criar usuário admin padrão
         admin_user = {
             "id": str(uuid.uuid4()),
@@ -3217,7 +3584,7 @@ async def clear_all_data(request: dict):
             "password": "admin123",  # Em produção: hash da senha
             "full_name": "Administrador EAD",
             "role": "admin",
-            "created_at": datetime.now(timezone.utc).isoformat(),
+            "created_at": datetime.now(timezone.utc),
             "active": True
         }
         
@@ -3387,6 +3754,7 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", QUERY_COUNT_HEADER],
 )
 
 # Configure logging
@@ -3400,11 +3768,6 @@ logger = logging.getLogger(__name__)
 async def create_asaas_customer(name: str, email: str, cpf: str, phone: str):
     """Criar cliente na Asaas"""
     try:
-        headers = {
-            'access_token': ASAAS_TOKEN,
-            'Content-Type': 'application/json'
-        }
-        
         # Limpar CPF (remover pontos e hífens)
         clean_cpf = ''.join(filter(str.isdigit, cpf))
         
@@ -3427,33 +3790,18 @@ async def create_asaas_customer(name: str, email: str, cpf: str, phone: str):
             "company": "Taxista Autônomo"
         }
         
-        response = requests.post(
-            f"{ASAAS_API_URL}/customers",
-            json=customer_data,
-            headers=headers,
-            timeout=30
-        )
-        
-        if response.status_code in [200, 201]:
-            customer = response.json()
+        customer = await asaas_client.create_customer(customer_data)
+        if customer:
             logging.info(f"✅ Cliente Asaas criado: {customer.get('id')} - {name}")
-            return customer
-        else:
-            logging.error(f"❌ Erro ao criar cliente Asaas: {response.status_code} - {response.text}")
-            return None
+        return customer
             
     except Exception as e:
         logging.error(f"❌ Exceção ao criar cliente Asaas: {str(e)}")
         return None
 
-async def create_asaas_payment(customer_id: str, value: float, description: str, external_reference: str):
-    """Criar cobrança na Asaas"""
+async def create_asaas_payment(customer_id: str, value: float, description: str, external_reference: str) -> AsaasResult:
+    """Criar cobrança na Asaas (o resultado diz se a Asaas recusou o cliente ou se a falha foi transitória)"""
     try:
-        headers = {
-            'access_token': ASAAS_TOKEN,
-            'Content-Type': 'application/json'
-        }
-        
         # Data de vencimento: 7 dias a partir de hoje
         due_date = (datetime.now() + timedelta(days=7)).strftime('%Y-%m-%d')
         
@@ -3473,52 +3821,86 @@ async def create_asaas_payment(customer_id: str, value: float, description: str,
         # Log detalhado dos dados sendo enviados
         logging.info(f"🔍 Enviando para Asaas: {json.dumps(payment_data, indent=2, default=str)}")
         
-        response = requests.post(
-            f"{ASAAS_API_URL}/payments",
-            json=payment_data,
-            headers=headers,
-            timeout=30
-        )
-        
-        if response.status_code in [200, 201]:
-            payment = response.json()
-            logging.info(f"✅ Cobrança Asaas criada: {payment.get('id')} - R$ {value}")
-            logging.info(f"🔍 Resposta Asaas: {json.dumps(payment, indent=2, default=str)}")
-            return payment
-        else:
-            logging.error(f"❌ Erro ao criar cobrança Asaas: {response.status_code} - {response.text}")
-            return None
+        result = await asaas_client.create_payment(payment_data)
+        if result.data:
+            logging.info(f"✅ Cobrança Asaas criada: {result.data.get('id')} - R$ {value}")
+            logging.info(f"🔍 Resposta Asaas: {json.dumps(result.data, indent=2, default=str)}")
+        return result
             
     except Exception as e:
         logging.error(f"❌ Exceção ao criar cobrança Asaas: {str(e)}")
-        return None
+        return AsaasResult(None)
 
 async def get_asaas_pix_qrcode(payment_id: str):
     """Obter QR Code PIX da cobrança"""
     try:
-        headers = {
-            'access_token': ASAAS_TOKEN,
-            'Content-Type': 'application/json'
-        }
-        
-        response = requests.get(
-            f"{ASAAS_API_URL}/payments/{payment_id}/pixQrCode",
-            headers=headers,
-            timeout=30
-        )
-        
-        if response.status_code == 200:
-            pix_data = response.json()
+        pix_data = await asaas_client.get_pix_qrcode(payment_id)
+        if pix_data:
             logging.info(f"✅ QR Code PIX obtido para cobrança: {payment_id}")
-            return pix_data
-        else:
-            logging.error(f"❌ Erro ao obter QR Code PIX: {response.status_code} - {response.text}")
-            return None
+        return pix_data
             
     except Exception as e:
         logging.error(f"❌ Exceção ao obter QR Code PIX: {str(e)}")
         return None
 
+@app.on_event("startup")
+async def startup_asaas_client():
+    await asaas_client.start()
+
+@app.on_event("startup")
+async def startup_webhook_inbox():
+    webhook_inbox.start(db)
+
+@app.on_event("startup")
+async def startup_db_indexes():
+    try:
+        result = await bootstrap_database(db)
+        logging.info(f"✅ Índices MongoDB verificados: {result['indexes']}")
+    except Exception as e:
+        logging.error(f"❌ Erro ao preparar índices MongoDB: {e}")
+    
+    try:
+        await course_catalog.rebuild(db)
+    except Exception as e:
+        logging.error(f"❌ Erro ao montar catálogo de cursos: {e}")
+    
+    try:
+        await ensure_city_rollup(db)
+    except Exception as e:
+        logging.error(f"❌ Erro ao montar estatísticas por cidade: {e}")
+    
+    # Conversão de datas string para BSON antes de aceitar requisições: estatísticas financeiras e
+    # cursores por created_at só enxergam datas BSON (retomável; depois de concluída é instantânea)
+    await run_date_migration()
+    # Imagens de QR Code PIX ainda embutidas em asaas_payments vão para o armazenamento próprio
+    asyncio.create_task(run_pix_image_migration())
+
+async def run_date_migration():
+    try:
+        report = await migrate_string_dates(db)
+        logging.info(f"✅ Migração de datas concluída: {report}")
+    except Exception as e:
+        logging.error(f"❌ Erro na migração de datas: {e}")
+
+async def run_pix_image_migration():
+    try:
+        moved = await migrate_inline_images(db)
+        logging.info(f"✅ Migração de imagens PIX concluída: {moved} movidas")
+    except Exception as e:
+        logging.error(f"❌ Erro na migração de imagens PIX: {e}")
+
+@app.on_event("shutdown")
+async def shutdown_webhook_inbox():
+    # Antes de fechar o cliente MongoDB: os workers ainda gravam resultados
+    await webhook_inbox.stop()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    client.close()
+
+@app.on_event("shutdown")
+async def shutdown_asaas_client():
+    # Termina as buscas de QR Code PIX pendentes antes de fechar o pool
+    await pix_qrcodes.close()
+    await asaas_client.close()
+    pix_renderer.close()
\ No newline at end of file
@@ -0,0 +1,64 @@
+"""
+Streaming responses for large collections
+Iterates a Motor cursor in batches and writes records as they arrive, either as
+NDJSON (one document per line) or as a chunked JSON array
+"""
+
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+from fastapi import HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+from fast_json import dumps
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+STREAM_MODES = ("ndjson", "json")
+STREAM_BATCH_SIZE = 500   # documentos por round trip ao MongoDB
+STREAM_FLUSH_SIZE = 100   # documentos por chunk HTTP
+
+
+def resolve_stream_mode(request: Request, stream: Optional[str]) -> Optional[str]:
+    """Pick the streaming mode from ?stream= or the Accept header (None = regular response)"""
+    if stream:
+        if stream not in STREAM_MODES:
+            raise HTTPException(status_code=400, detail=f"stream deve ser um de: {', '.join(STREAM_MODES)}")
+        return stream
+    if NDJSON_MEDIA_TYPE in request.headers.get("accept", ""):
+        return "ndjson"
+    return None
+
+
+async def iter_ndjson(cursor, transform: Callable[[Dict[str, Any]], Dict[str, Any]]) -> AsyncIterator[bytes]:
+    """Yield NDJSON chunks of transformed documents (same encoding as the paged endpoints)"""
+    lines = []
+    async for document in cursor:
+        lines.append(dumps(transform(document)))
+        if len(lines) >= STREAM_FLUSH_SIZE:
+            yield b"\n".join(lines) + b"\n"
+            lines = []
+    if lines:
+        yield b"\n".join(lines) + b"\n"
+
+
+async def iter_json_array(cursor, transform: Callable[[Dict[str, Any]], Dict[str, Any]]) -> AsyncIterator[bytes]:
+    """Yield a JSON array in chunks of transformed documents"""
+    yield b"["
+    first = True
+    items = []
+    async for document in cursor:
+        items.append(dumps(transform(document)))
+        if len(items) >= STREAM_FLUSH_SIZE:
+            yield (b"" if first else b",") + b",".join(items)
+            first = False
+            items = []
+    if items:
+        yield (b"" if first else b",") + b",".join(items)
+    yield b"]"
+
+
+def stream_cursor(cursor, transform: Callable[[Dict[str, Any]], Dict[str, Any]], mode: str) -> StreamingResponse:
+    """Wrap a Motor cursor in a StreamingResponse"""
+    cursor = cursor.batch_size(STREAM_BATCH_SIZE)
+    if mode == "ndjson":
+        return StreamingResponse(iter_ndjson(cursor, transform), media_type=NDJSON_MEDIA_TYPE)
+    return StreamingResponse(iter_json_array(cursor, transform), media_type="application/json")
@@ -0,0 +1,51 @@
+"""
+Short-lived result cache with single-flight computation
+Concurrent callers asking for the same key while it is being computed wait
+on the same task instead of issuing their own queries
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlightCache:
+    """Cache coroutine results for `ttl` seconds, computing each key at most once at a time"""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._values: Dict[str, Tuple[float, Any]] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def invalidate(self, key: Optional[str] = None):
+        if key is None:
+            self._values.clear()
+        else:
+            self._values.pop(key, None)
+
+    async def get(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        cached = self._values.get(key)
+        if cached and time.monotonic() - cached[0] < self.ttl:
+            return cached[1]
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        task = asyncio.ensure_future(compute())
+        self._inflight[key] = task
+        task.add_done_callback(lambda done: self._finish(key, done))
+        # shield: o cancelamento de um cliente não cancela o cálculo dos demais
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Future):
+        self._inflight.pop(key, None)
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            logger.error(f"❌ Erro ao calcular {key}: {task.exception()}")
+            return
+        self._values[key] = (time.monotonic(), task.result())
@@ -0,0 +1,345 @@
+"""
+Durable inbox for Asaas webhooks
+The webhook route only stores the raw event in `webhook_inbox` and answers
+200; the real processing runs in background partitions. Each event is
+tagged with a hash slot, crc32(payment_id) % 1024, and belongs to
+partition slot % partitions (a fixed slot space keeps the claim query a
+plain indexed $in whatever the partition count).
+Every partition is its own claim loop: it atomically claims the oldest
+event of its slice, processes it and only then claims the next, so one
+slow payment holds up its partition and nothing else. Nothing is claimed
+ahead of time: the queue lives in the database.
+A payment is skipped while it has an event waiting for a retry (backoff)
+or leased by another process, so within one process a payment's events
+are handled in the order they were received. Across processes this is
+best-effort (two claims can race between the check and the claim); the
+status guards of the processor keep a late event harmless. An event that
+exhausts its attempts is marked failed and stops holding its payment back.
+Claims carry a lease, so events held by a process that died are picked up
+again, and failed events are retried with backoff up to a maximum number
+of attempts. Processing lag (received -> started) is tracked for monitoring.
+Redeliveries are dropped at the door: every event carries an idempotency
+key under a unique index, so a duplicate costs one rejected insert
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import statistics
+import time
+import zlib
+from collections import Counter, deque
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+INBOX_COLLECTION = "webhook_inbox"
+PENDING, PROCESSING, DONE, FAILED = "pending", "processing", "done", "failed"
+HASH_SLOTS = 1024
+
+
+def idempotency_key(payload: Dict[str, Any]) -> str:
+    """Asaas event id when present, otherwise a hash of the whole payload
+
+    Without an event id only a byte-for-byte redelivery is a duplicate:
+    keying on payment + event + status would also swallow a real repeat
+    (OVERDUE, RESTORED, OVERDUE again) and, for events without a payment,
+    every later event of the same type
+    """
+    if payload.get("id"):
+        return f"event:{payload['id']}"
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return f"payload:{hashlib.sha256(canonical.encode('utf-8')).hexdigest()}"
+
+
+class LagStats:
+    """Rolling processing lag (seconds between receipt and start of processing)"""
+
+    def __init__(self, samples: int = 1000):
+        self._samples: Deque[float] = deque(maxlen=samples)
+        self.processed = 0
+        self.failed = 0
+        self.duplicates = 0
+        self.max_lag = 0.0
+
+    def record(self, lag: float):
+        self._samples.append(lag)
+        self.max_lag = max(self.max_lag, lag)
+
+    def snapshot(self) -> Dict[str, Any]:
+        samples = sorted(self._samples)
+        counters = {"processed": self.processed, "failed": self.failed, "duplicates": self.duplicates}
+        if not samples:
+            return {**counters, "lag_p50": None, "lag_p95": None, "lag_max": None}
+        return {
+            **counters,
+            "lag_p50": round(statistics.median(samples), 3),
+            "lag_p95": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+            "lag_max": round(self.max_lag, 3)
+        }
+
+
+def hash_slot(payment_id: Optional[str]) -> int:
+    """Stable slot of a payment id (crc32, identical across processes and restarts)"""
+    return zlib.crc32((payment_id or "").encode("utf-8")) % HASH_SLOTS
+
+
+def partition_for(payment_id: Optional[str], partitions: int) -> int:
+    return hash_slot(payment_id) % partitions
+
+
+class Partition:
+    """Serial claim-and-process loop for one slice of the payment id space"""
+
+    def __init__(self, index: int, partitions: int):
+        self.index = index
+        self.slots = list(range(index, HASH_SLOTS, partitions))
+        self.wakeup = asyncio.Event()
+        self.lag = LagStats()
+        self.current_since: Optional[float] = None
+
+    def snapshot(self, pending: int) -> Dict[str, Any]:
+        busy_for = round(time.monotonic() - self.current_since, 3) if self.current_since else None
+        return {"partition": self.index, "pending": pending, "busy_for": busy_for, **self.lag.snapshot()}
+
+
+class WebhookInbox:
+    """Persist webhook events and drain them through ordered partitions"""
+
+    def __init__(
+        self,
+        process: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+        partitions: int = 8,
+        lease_seconds: float = 60.0,
+        max_attempts: int = 5,
+        idle_poll_seconds: float = 5.0
+    ):
+        self.db = None
+        self._process = process
+        partitions = max(1, partitions)
+        self.partitions = [Partition(index, partitions) for index in range(partitions)]
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.idle_poll_seconds = idle_poll_seconds
+        self._ready = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = False
+        self.lag = LagStats()
+
+    @property
+    def collection(self):
+        return self.db[INBOX_COLLECTION]
+
+    def _partition_of(self, payment_id: Optional[str]) -> Partition:
+        return self.partitions[partition_for(payment_id, len(self.partitions))]
+
+    def _slice(self, partition: Partition) -> Dict[str, Any]:
+        return {"slot": {"$in": partition.slots}}
+
+    async def enqueue(self, db, payload: Dict[str, Any], source: str = "asaas") -> Optional[Any]:
+        """Store the raw event and return its inbox id (None when it was already received)"""
+        now = datetime.now(timezone.utc)
+        payment_id = (payload.get("payment") or {}).get("id")
+        document = {
+            "idempotency_key": idempotency_key(payload),
+            "source": source,
+            "event": payload.get("event"),
+            "payment_id": payment_id,
+            "slot": hash_slot(payment_id),
+            "payload": payload,
+            "status": PENDING,
+            "attempts": 0,
+            "received_at": now,
+            "available_at": now
+        }
+        try:
+            result = await db[INBOX_COLLECTION].insert_one(document)
+        except DuplicateKeyError:
+            self.lag.duplicates += 1
+            return None
+        self._partition_of(payment_id).wakeup.set()
+        return result.inserted_id
+
+    async def _held_payments(self, partition: Partition, now: datetime) -> List[str]:
+        """Payments of the slice with an event in retry backoff or leased by another process"""
+        payment_ids = await self.collection.distinct("payment_id", {
+            **self._slice(partition),
+            "$or": [
+                {"status": PENDING, "available_at": {"$gt": now}},
+                {"status": PROCESSING, "lease_until": {"$gte": now}}
+            ]
+        })
+        return [payment_id for payment_id in payment_ids if payment_id is not None]
+
+    async def _claim(self, partition: Partition) -> Optional[Dict[str, Any]]:
+        now = datetime.now(timezone.utc)
+        query = {
+            **self._slice(partition),
+            "$or": [
+                {"status": PENDING, "available_at": {"$lte": now}},
+                # Lease vencido: o processo que pegou o evento morreu no meio
+                {"status": PROCESSING, "lease_until": {"$lt": now}}
+            ]
+        }
+        held = await self._held_payments(partition, now)
+        if held:
+            query["payment_id"] = {"$nin": held}
+        return await self.collection.find_one_and_update(
+            query,
+            {"$set": {"status": PROCESSING, "started_at": now, "lease_until": now + timedelta(seconds=self.lease_seconds)},
+             "$inc": {"attempts": 1}},
+            sort=[("received_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _run_partition(self, partition: Partition):
+        await self._ready.wait()
+        while not self._stopping:
+            # Limpa antes de buscar: um enqueue durante a busca não se perde
+            partition.wakeup.clear()
+            try:
+                event = await self._claim(partition)
+            except Exception as e:
+                logger.error(f"❌ Erro ao buscar eventos do webhook_inbox (partição {partition.index}): {e}")
+                event = None
+            if event is None:
+                try:
+                    await asyncio.wait_for(partition.wakeup.wait(), self.idle_poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            partition.current_since = time.monotonic()
+            try:
+                await self.handle(event, partition.lag)
+            except Exception as e:
+                # Falha ao gravar o resultado: o lease vence e o evento volta para a fila
+                logger.error(f"❌ Erro ao registrar resultado do webhook {event.get('_id')}: {e}")
+            finally:
+                partition.current_since = None
+
+    async def _backfill_slots(self):
+        """Tag events stored before hash slots existed, then let the partitions start"""
+        try:
+            cursor = self.collection.find(
+                {"slot": {"$exists": False}, "status": {"$in": [PENDING, PROCESSING]}},
+                {"payment_id": 1}
+            )
+            async for event in cursor:
+                await self.collection.update_one(
+                    {"_id": event["_id"]},
+                    {"$set": {"slot": hash_slot(event.get("payment_id"))}}
+                )
+        except Exception as e:
+            logger.error(f"❌ Erro ao preparar partições do webhook_inbox: {e}")
+        finally:
+            self._ready.set()
+
+    async def handle(self, event: Dict[str, Any], partition_lag: Optional[LagStats] = None):
+        """Run one claimed event through the processor and record the outcome"""
+        stats = [self.lag] + ([partition_lag] if partition_lag is not None else [])
+        received_at = event["received_at"]
+        if received_at.tzinfo is None:
+            received_at = received_at.replace(tzinfo=timezone.utc)
+        lag = (datetime.now(timezone.utc) - received_at).total_seconds()
+        for stat in stats:
+            stat.record(lag)
+        started = time.perf_counter()
+        try:
+            result = await self._process(event["payload"])
+        except Exception as e:
+            if await self._fail(event, e):
+                for stat in stats:
+                    stat.failed += 1
+            return
+        written = await self.collection.update_one(
+            self._owned(event),
+            {"$set": {
+                "status": DONE,
+                "processed_at": datetime.now(timezone.utc),
+                "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+                "result": result
+            }, "$unset": {"lease_until": "", "error": ""}}
+        )
+        if written.matched_count:
+            for stat in stats:
+                stat.processed += 1
+
+    @staticmethod
+    def _owned(event: Dict[str, Any]) -> Dict[str, Any]:
+        """Filter matching the event only while this claim is the latest one
+
+        If the lease ran out and the event was claimed again, `attempts`
+        has moved on and the stale outcome is dropped instead of
+        overwriting the newer claim's
+        """
+        return {"_id": event["_id"], "attempts": event["attempts"]}
+
+    async def _fail(self, event: Dict[str, Any], error: Exception) -> bool:
+        """Schedule a retry, or mark the event failed; True when it gave up"""
+        attempts = event["attempts"]
+        logger.error(f"❌ Erro ao processar webhook {event.get('event')} ({event.get('payment_id')}), tentativa {attempts}: {error}")
+        gave_up = attempts >= self.max_attempts
+        if gave_up:
+            update = {"status": FAILED, "error": str(error), "processed_at": datetime.now(timezone.utc)}
+        else:
+            backoff = min(300, 2 ** attempts)
+            update = {"status": PENDING, "error": str(error),
+                      "available_at": datetime.now(timezone.utc) + timedelta(seconds=backoff)}
+        written = await self.collection.update_one(self._owned(event), {"$set": update, "$unset": {"lease_until": ""}})
+        return gave_up and written.matched_count > 0
+
+    def start(self, db):
+        if self._tasks:
+            return
+        self.db = db
+        self._stopping = False
+        self._ready.clear()
+        self._tasks = [asyncio.create_task(self._backfill_slots())]
+        self._tasks += [asyncio.create_task(self._run_partition(partition)) for partition in self.partitions]
+        logger.info(f"✅ webhook_inbox: {len(self.partitions)} partições iniciadas")
+
+    async def stop(self, drain_seconds: float = 10.0):
+        """Stop claiming, let the events being processed finish (bounded), then cancel the loops"""
+        if not self._tasks:
+            return
+        self._stopping = True
+        for partition in self.partitions:
+            partition.wakeup.set()
+        _, pending = await asyncio.wait(self._tasks, timeout=drain_seconds)
+        if pending:
+            logger.warning("⚠️ webhook_inbox: eventos ainda em processamento no desligamento (lease devolve ao banco)")
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def snapshot(self) -> Dict[str, Any]:
+        counts = {status: 0 for status in (PENDING, PROCESSING, DONE, FAILED)}
+        async for row in self.collection.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]):
+            counts[row["_id"]] = row["count"]
+        pending: Counter = Counter()
+        async for row in self.collection.aggregate([
+            {"$match": {"status": PENDING}},
+            {"$group": {"_id": "$slot", "count": {"$sum": 1}}}
+        ]):
+            if row["_id"] is not None:
+                pending[row["_id"] % len(self.partitions)] += row["count"]
+        oldest = await self.collection.find_one({"status": PENDING}, {"received_at": 1}, sort=[("received_at", 1)])
+        oldest_age = None
+        if oldest:
+            received_at = oldest["received_at"]
+            if received_at.tzinfo is None:
+                received_at = received_at.replace(tzinfo=timezone.utc)
+            oldest_age = round((datetime.now(timezone.utc) - received_at).total_seconds(), 3)
+        return {
+            "partitions": len(self.partitions),
+            "counts": counts,
+            "oldest_pending_age": oldest_age,
+            **self.lag.snapshot(),
+            "by_partition": [partition.snapshot(pending[partition.index]) for partition in self.partitions]
+        }
@@ -0,0 +1,363 @@
+"""
+Bulk replay of Asaas webhook events
+Recovers missed or failed payment confirmations by running events through
+the same processor the webhook inbox uses (server.process_asaas_event).
+Events come either from the raw payloads stored in `webhook_inbox` or from
+a list of payments exported from Asaas (GET /v3/payments), which is turned
+into the webhook each payment status implies. Events are spread over
+partitions by payment id like the inbox, so one payment is replayed in
+order while different payments run in parallel. The processor's status
+guards make replays idempotent: a payment already confirmed is not
+notified twice.
+Dry-run mode writes nothing and reports the change each event would make.
+A checkpoint in `migrations` records how far a run got, so an interrupted
+replay resumes where it stopped; it never moves past an event that raised.
+Inbox runs filtered by status keep no checkpoint: the status is what
+changes as events are replayed, so such a run simply picks up whatever
+still matches (a replayed event becomes done, one that raised stays failed)
+
+Usage (from backend/):
+    python webhook_replay.py inbox [--status failed] [--since 2024-05-01] [--until 2024-05-02] [--dry-run]
+    python webhook_replay.py export payments.json [--dry-run]
+    (--reset forgets the checkpoint of that run, --concurrency sets the partitions)
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+from lookup_fields import normalize_email
+from webhook_inbox import DONE, INBOX_COLLECTION, partition_for
+
+logger = logging.getLogger(__name__)
+
+REPLAY_ID = "webhook_replay"
+
+# Status de cobrança exportada -> evento que a Asaas teria enviado
+STATUS_EVENTS = {
+    "CONFIRMED": "PAYMENT_CONFIRMED",
+    "RECEIVED": "PAYMENT_RECEIVED",
+    "OVERDUE": "PAYMENT_OVERDUE",
+}
+CONFIRMATION_EVENTS = ("PAYMENT_CONFIRMED", "PAYMENT_RECEIVED")
+
+Processor = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+ReplayItem = Tuple[Any, Optional[Any], Dict[str, Any]]
+
+
+def payment_event(payment: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Exported Asaas payment (or a raw webhook event) -> webhook payload; None when nothing to replay"""
+    if "event" in payment and "payment" in payment:
+        return payment
+    if payment.get("deleted"):
+        event = "PAYMENT_DELETED"
+    else:
+        event = STATUS_EVENTS.get(payment.get("status"))
+    if event is None:
+        return None
+    return {"event": event, "payment": payment}
+
+
+def _export_records(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as export:
+        if path.endswith(".jsonl"):
+            for line in export:
+                if line.strip():
+                    yield json.loads(line)
+            return
+        data = json.load(export)
+    # Resposta da listagem da Asaas ({"data": [...]}) ou lista pura
+    yield from data.get("data", []) if isinstance(data, dict) else data
+
+
+async def iter_export(path: str, after: Optional[int] = None) -> AsyncIterator[ReplayItem]:
+    """(position, None, payload) for every replayable payment of an export file"""
+    for position, record in enumerate(_export_records(path)):
+        if after is not None and position <= after:
+            continue
+        payload = payment_event(record)
+        if payload is not None:
+            yield position, None, payload
+
+
+def inbox_query(status: Optional[str] = None, since: Optional[datetime] = None, until: Optional[datetime] = None) -> Dict[str, Any]:
+    query: Dict[str, Any] = {}
+    if status:
+        query["status"] = status
+    if since or until:
+        query["received_at"] = {}
+        if since:
+            query["received_at"]["$gte"] = since
+        if until:
+            query["received_at"]["$lt"] = until
+    return query
+
+
+async def iter_inbox(db, query: Dict[str, Any], after: Optional[Any] = None, batch_size: int = 500) -> AsyncIterator[ReplayItem]:
+    """(inbox _id, inbox _id, payload) in arrival order"""
+    if after is not None:
+        query = {"$and": [query, {"_id": {"$gt": after}}]}
+    cursor = db[INBOX_COLLECTION].find(query, {"payload": 1}).sort("_id", 1).batch_size(batch_size)
+    async for document in cursor:
+        yield document["_id"], document["_id"], document["payload"]
+
+
+class DryRunPlanner:
+    """Predict what process_asaas_event would change, without writing
+
+    Mirrors its status guards and remembers the outcome of earlier events
+    in the run, so a CONFIRMED after an OVERDUE for the same payment is
+    planned against the state the OVERDUE would have left
+    """
+
+    def __init__(self, db, guards: Dict[str, List[str]]):
+        self.db = db
+        self.guards = guards
+        self._payments: Dict[str, Dict[str, Any]] = {}
+        self._subscriptions: Dict[str, Optional[str]] = {}
+
+    async def _payment(self, payment_id: str) -> Optional[Dict[str, Any]]:
+        if payment_id not in self._payments:
+            record = await self.db.asaas_payments.find_one(
+                {"asaas_payment_id": payment_id}, {"_id": 0, "status": 1, "user_email": 1}
+            )
+            if record is None:
+                return None
+            self._payments[payment_id] = record
+        return self._payments[payment_id]
+
+    async def _subscription_status(self, email: Optional[str]) -> Optional[str]:
+        if email not in self._subscriptions:
+            record = await self.db.subscriptions.find_one({"email_lower": email}, {"_id": 0, "status": 1})
+            self._subscriptions[email] = record.get("status") if record else None
+        return self._subscriptions[email]
+
+    async def plan(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        event = payload.get("event")
+        payment_data = payload.get("payment") or {}
+        payment_id = payment_data.get("id")
+        status = payment_data.get("status")
+        if event not in self.guards:
+            return {"status": "ignored", "message": f"Evento {event} não processado"}
+        payment = await self._payment(payment_id)
+        if payment is None:
+            return {"status": "error", "message": "Pagamento não encontrado", "payment_id": payment_id}
+        if payment.get("status") in self.guards[event]:
+            return {"status": "ignored", "message": "Cobrança já finalizada", "payment_id": payment_id}
+
+        changes = {}
+        new_status = status.lower() if status else "unknown"
+        if payment.get("status") != new_status:
+            changes["payment"] = {"from": payment.get("status"), "to": new_status}
+            payment["status"] = new_status
+
+        email = normalize_email(payment.get("user_email"))
+        target = None
+        if event in CONFIRMATION_EVENTS and status in ("RECEIVED", "CONFIRMED"):
+            target = "paid"
+        elif event in ("PAYMENT_OVERDUE", "PAYMENT_DELETED"):
+            target = "cancelled" if event == "PAYMENT_DELETED" else "overdue"
+        if target is not None:
+            current = await self._subscription_status(email)
+            if current is None and target == "paid":
+                return {"status": "error", "message": "Falha ao liberar curso", "payment_id": payment_id, **changes}
+            # Mesma regra do processador: inscrição paga nunca muda
+            if current is not None and current != "paid" and current != target:
+                changes["subscription"] = {"email": email, "from": current, "to": target}
+                self._subscriptions[email] = target
+        return {"status": "would_change" if changes else "unchanged", "payment_id": payment_id, **changes}
+
+
+class _Watermark:
+    """Highest position below which every event has succeeded (completion order varies across partitions)
+
+    An event that is never finished (it raised) holds the watermark below
+    it for the rest of the run, so resuming retries it
+    """
+
+    def __init__(self, position: Optional[Any] = None):
+        self._next = 0
+        self._finished: Dict[int, Any] = {}
+        self.position = position
+
+    def finish(self, sequence: int, position: Any):
+        self._finished[sequence] = position
+        while self._next in self._finished:
+            self.position = self._finished.pop(self._next)
+            self._next += 1
+
+
+async def _save_checkpoint(db, checkpoint_id: str, position: Any, counts: Counter, completed: bool = False):
+    await db.migrations.update_one(
+        {"_id": checkpoint_id},
+        {"$set": {
+            "last_position": position,
+            "counts": dict(counts),
+            "completed": completed,
+            "updated_at": datetime.now(timezone.utc)
+        }},
+        upsert=True
+    )
+
+
+async def _mark_inbox_done(db, inbox_id: Any, result: Dict[str, Any]):
+    now = datetime.now(timezone.utc)
+    await db[INBOX_COLLECTION].update_one(
+        {"_id": inbox_id},
+        {"$set": {"status": DONE, "result": result, "processed_at": now, "replayed_at": now},
+         "$unset": {"lease_until": "", "error": ""}}
+    )
+
+
+async def replay(
+    db,
+    process: Processor,
+    items: AsyncIterator[ReplayItem],
+    checkpoint_id: Optional[str] = None,
+    after: Optional[Any] = None,
+    concurrency: int = 8,
+    queue_size: int = 100,
+    planner: Optional[DryRunPlanner] = None,
+    on_result: Optional[Callable[[Dict[str, Any], Dict[str, Any]], None]] = None,
+    checkpoint_every: int = 200
+) -> Dict[str, Any]:
+    """Run items through process (or planner.plan in dry-run) and report the outcomes
+
+    The checkpoint is only written outside dry-run, at the position below
+    which every event has finished; `after` is where the items resume from
+    """
+    started = time.perf_counter()
+    counts: Counter = Counter()
+    watermark = _Watermark(after)
+    queues = [asyncio.Queue(maxsize=queue_size) for _ in range(max(1, concurrency))]
+    save_checkpoints = checkpoint_id is not None and planner is None
+
+    async def work(queue: asyncio.Queue):
+        while True:
+            item = await queue.get()
+            if item is None:
+                queue.task_done()
+                return
+            sequence, position, inbox_id, payload = item
+            succeeded = False
+            try:
+                if planner is not None:
+                    outcome = await planner.plan(payload)
+                else:
+                    outcome = await process(payload)
+                    if inbox_id is not None:
+                        await _mark_inbox_done(db, inbox_id, outcome)
+                succeeded = True
+            except Exception as e:
+                logger.error(f"❌ Erro ao reprocessar evento {position}: {e}")
+                outcome = {"status": "exception", "message": str(e)}
+            counts[outcome.get("status", "unknown")] += 1
+            if on_result is not None:
+                on_result(payload, outcome)
+            if succeeded:
+                watermark.finish(sequence, position)
+            queue.task_done()
+
+    workers = [asyncio.create_task(work(queue)) for queue in queues]
+    read = 0
+    try:
+        async for position, inbox_id, payload in items:
+            payment_id = (payload.get("payment") or {}).get("id")
+            await queues[partition_for(payment_id, len(queues))].put((read, position, inbox_id, payload))
+            read += 1
+            if save_checkpoints and read % checkpoint_every == 0 and watermark.position is not None:
+                await _save_checkpoint(db, checkpoint_id, watermark.position, counts)
+        for queue in queues:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        for worker in workers:
+            worker.cancel()
+
+    if save_checkpoints:
+        await _save_checkpoint(db, checkpoint_id, watermark.position, counts, completed=not counts["exception"])
+    elapsed = time.perf_counter() - started
+    return {
+        "read": read,
+        "outcomes": dict(counts),
+        "dry_run": planner is not None,
+        "elapsed_seconds": round(elapsed, 3),
+        "events_per_second": round(read / elapsed, 1) if elapsed else None
+    }
+
+
+async def load_checkpoint(db, checkpoint_id: str) -> Dict[str, Any]:
+    """Stored progress of a replay run (empty when it never ran)"""
+    return await db.migrations.find_one({"_id": checkpoint_id}) or {}
+
+
+async def reset_checkpoint(db, checkpoint_id: str):
+    await db.migrations.delete_one({"_id": checkpoint_id})
+
+
+def _parse_date(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Reprocessa webhooks da Asaas em lote")
+    parser.add_argument("source", choices=["inbox", "export"])
+    parser.add_argument("path", nargs="?", help="arquivo exportado da Asaas (.json ou .jsonl)")
+    parser.add_argument("--status", default="failed", help="status no webhook_inbox ('all' para todos)")
+    parser.add_argument("--since", help="recebidos a partir de (ISO 8601)")
+    parser.add_argument("--until", help="recebidos antes de (ISO 8601)")
+    parser.add_argument("--dry-run", action="store_true", help="não grava nada, só mostra o que mudaria")
+    parser.add_argument("--concurrency", type=int, default=int(os.environ.get('WEBHOOK_PARTITIONS', '8')))
+    parser.add_argument("--reset", action="store_true", help="esquece o checkpoint desta execução (inbox --status all ou export)")
+    args = parser.parse_args()
+    if args.source == "export" and not args.path:
+        parser.error("export precisa do caminho do arquivo")
+
+    # Importa o backend inteiro: o reprocessamento usa exatamente o mesmo caminho do webhook
+    import server
+
+    def print_result(payload: Dict[str, Any], outcome: Dict[str, Any]):
+        if outcome.get("status") in ("would_change", "error", "exception") or not args.dry_run:
+            print(json.dumps({"event": payload.get("event"), **outcome}, ensure_ascii=False, default=str))
+
+    async def main():
+        db = server.db
+        status = None if args.status == "all" else args.status
+        if args.source == "inbox":
+            # Só o intervalo de received_at identifica a execução; com filtro de status não há checkpoint
+            checkpoint_id = None if status else f"{REPLAY_ID}:inbox:{args.since}:{args.until}"
+        else:
+            checkpoint_id = f"{REPLAY_ID}:export:{os.path.abspath(args.path)}"
+        try:
+            after = None
+            if checkpoint_id is not None:
+                if args.reset:
+                    await reset_checkpoint(db, checkpoint_id)
+                # Retoma depois do último evento concluído sem erro
+                after = (await load_checkpoint(db, checkpoint_id)).get("last_position")
+            if args.source == "inbox":
+                query = inbox_query(status, _parse_date(args.since), _parse_date(args.until))
+                items = iter_inbox(db, query, after)
+            else:
+                items = iter_export(args.path, after)
+            planner = DryRunPlanner(db, server.PAYMENT_STATUS_GUARDS) if args.dry_run else None
+            report = await replay(
+                db, server.process_asaas_event, items, checkpoint_id, after,
+                concurrency=args.concurrency, planner=planner, on_result=print_result
+            )
+            print(json.dumps(report, ensure_ascii=False))
+        finally:
+            server.client.close()
+
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(main())
@@ -39,6 +39,7 @@ import {
   Play
 } from 'lucide-react';
 import axios from 'axios';
+import { fetchAllPages } from '../lib/pagination';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
@@ -129,26 +130,26 @@ const AdminDashboard = () => {
   const fetchAdminData = async () => {
     try {
       setLoading(true);
-      const [statsRes, subscriptionsRes, usersRes, cityStatsRes, coursesRes, coursePriceRes, adminUsersRes] = await Promise.all([
+      const [statsRes, subscriptions, users, cityStatsRes, coursesRes, coursePriceRes, adminUsers] = await Promise.all([
         axios.get(`${API}/admin/stats`),
-        axios.get(`${API}/subscriptions`),
-        axios.get(`${API}/users`),
+        fetchAllPages(`${API}/subscriptions`),
+        fetchAllPages(`${API}/users`),
         axios.get(`${API}/stats/cities`),
         axios.get(`${API}/courses`),
         axios.get(`${API}/courses/default/price`),
-        axios.get(`${API}/admin/users`)
+        fetchAllPages(`${API}/admin/users`)
       ]);
       
       setStats(statsRes.data);
-      setSubscriptions(subscriptionsRes.data);
-      setUsers(usersRes.data);
+      setSubscriptions(subscriptions);
+      setUsers(users);
       setCityStats(cityStatsRes.data || []);
       setCourses(coursesRes.data || []);
       setCoursePrice(coursePriceRes.data?.price || 150);
-      setAdminUsers(adminUsersRes.data || []);
+      setAdminUsers(adminUsers);
       
       // Calcular estatísticas de pagamento
-      calculatePaymentStats(subscriptionsRes.data);
+      calculatePaymentStats(subscriptions);
       
       // Carregar dados dos novos gráficos
       loadRegionData();
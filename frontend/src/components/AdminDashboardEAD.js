@@ -16,6 +16,7 @@ import {
   Calendar as CalendarIcon, Briefcase, Database, Zap, Globe, UserPlus, FileX, Plus
 } from 'lucide-react';
 import axios from 'axios';
+import { fetchAllPages } from '../lib/pagination';
 import { 
   CoursesTab, 
   ClassesTab, 
@@ -255,11 +256,9 @@ const AdminDashboardEAD = () => {
 
   const fetchSubscriptions = async () => {
     try {
-      const response = await axios.get(`${BACKEND_URL}/api/subscriptions`);
-      if (response.data) {
-        setSubscriptions(response.data);
-        console.log(`✅ Carregadas ${response.data.length} inscrições da API`);
-      }
+      const data = await fetchAllPages(`${BACKEND_URL}/api/subscriptions`);
+      setSubscriptions(data);
+      console.log(`✅ Carregadas ${data.length} inscrições da API`);
     } catch (error) {
       console.error('Erro ao buscar inscrições:', error);
       // Manter dados mock se falhar
@@ -269,11 +268,9 @@ const AdminDashboardEAD = () => {
 
   const fetchUsers = async () => {
     try {
-      const response = await axios.get(`${BACKEND_URL}/api/users`);
-      if (response.data) {
-        setUsers(response.data);
-        console.log(`✅ Carregados ${response.data.length} usuários da API`);
-      }
+      const data = await fetchAllPages(`${BACKEND_URL}/api/users`);
+      setUsers(data);
+      console.log(`✅ Carregados ${data.length} usuários da API`);
     } catch (error) {
       console.error('Erro ao buscar usuários:', error);
       setUsers([]);
@@ -282,11 +279,9 @@ const AdminDashboardEAD = () => {
 
   const fetchPayments = async () => {
     try {
-      const response = await axios.get(`${BACKEND_URL}/api/payments`);
-      if (response.data) {
-        setPayments(response.data);
-        console.log(`✅ Carregados ${response.data.length} pagamentos da API`);
-      }
+      const data = await fetchAllPages(`${BACKEND_URL}/api/payments`);
+      setPayments(data);
+      console.log(`✅ Carregados ${data.length} pagamentos da API`);
     } catch (error) {
       console.error('Erro ao buscar pagamentos:', error);
       setPayments([]);
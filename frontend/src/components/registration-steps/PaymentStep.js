@@ -4,6 +4,31 @@ import { Button } from '../ui/button';
 import { Badge } from '../ui/badge';
 import { CheckCircle, ExternalLink, ArrowRight, CreditCard, Smartphone, QrCode } from 'lucide-react';
 
+// Consulta o QR Code PIX enquanto a API responde 202 (a busca na Asaas ainda não terminou)
+const PIX_POLL_ATTEMPTS = 15;
+const PIX_POLL_INTERVAL_MS = 1000;
+
+const waitForPixQrCode = async (backendUrl, paymentResult) => {
+  if (paymentResult.pix_status === 'ready' || !paymentResult.pix_url) {
+    return paymentResult;
+  }
+  for (let attempt = 0; attempt < PIX_POLL_ATTEMPTS; attempt++) {
+    try {
+      const pixResponse = await fetch(`${backendUrl}${paymentResult.pix_url}`);
+      if (pixResponse.status === 200) {
+        return { ...paymentResult, ...(await pixResponse.json()) };
+      }
+      if (pixResponse.status !== 202) {
+        break;
+      }
+    } catch (error) {
+      console.error('Erro ao consultar QR Code PIX:', error);
+    }
+    await new Promise((resolve) => setTimeout(resolve, PIX_POLL_INTERVAL_MS));
+  }
+  return paymentResult;
+};
+
 const PaymentStep = ({ data, updateData, onComplete }) => {
   const [isRedirecting, setIsRedirecting] = useState(false);
 
@@ -61,7 +86,7 @@ const PaymentStep = ({ data, updateData, onComplete }) => {
         });
 
         if (paymentResponse.ok) {
-          const paymentResult = await paymentResponse.json();
+          const paymentResult = await waitForPixQrCode(BACKEND_URL, await paymentResponse.json());
           
           // Mostrar popup melhorado sobre pagamento
           setTimeout(() => {
@@ -0,0 +1,18 @@
+import axios from 'axios';
+
+// Tamanho de página pedido às listagens admin (o backend limita a 1000)
+export const PAGE_SIZE = 500;
+
+// Percorre uma listagem paginada por cursor seguindo o header X-Next-Cursor
+export async function fetchAllPages(url, params = {}) {
+  const items = [];
+  let after = null;
+  do {
+    const response = await axios.get(url, {
+      params: { ...params, limit: PAGE_SIZE, ...(after ? { after } : {}) }
+    });
+    items.push(...(response.data || []));
+    after = response.headers['x-next-cursor'] || null;
+  } while (after);
+  return items;
+}
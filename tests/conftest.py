@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+# Os módulos do backend são importados pelo nome, como o server.py faz
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+# server.py lê a conexão na importação; o banco de verdade é trocado pelo fixture
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test_database")
+
+
+@pytest.fixture
+def db():
+    return AsyncMongoMockClient(tz_aware=True)["test_database"]
+
+
+@pytest.fixture
+def server(db, monkeypatch):
+    """server.py with its module-level database swapped for the test one"""
+    import server
+    monkeypatch.setattr(server, "db", db)
+    return server
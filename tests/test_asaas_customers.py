@@ -0,0 +1,156 @@
+import asyncio
+
+import httpx
+import pytest
+
+from asaas_client import AsaasResult
+from asaas_customers import CustomerResolver
+
+
+class FakeAsaas:
+    def __init__(self, fail: bool = False):
+        self.created = []
+        self.fail = fail
+
+    async def create_customer(self, name, email, cpf, phone):
+        await asyncio.sleep(0)
+        if self.fail:
+            return None
+        self.created.append(cpf)
+        return {"id": f"cus_{len(self.created)}"}
+
+
+def resolve(resolver, db, cpf="123.456.789-00"):
+    return resolver.resolve(db, "Taxista", "taxista@example.com", cpf, "11999999999")
+
+
+def test_creates_once_then_serves_from_cache(db):
+    asaas = FakeAsaas()
+    resolver = CustomerResolver(asaas.create_customer)
+
+    async def scenario():
+        return [await resolve(resolver, db), await resolve(resolver, db, "12345678900")]
+
+    assert asyncio.run(scenario()) == ["cus_1", "cus_1"]
+    assert len(asaas.created) == 1
+    assert resolver.stats["misses"] == 1
+    assert resolver.stats["cache_hits"] == 1
+
+
+def test_reuses_the_customer_stored_in_mongodb(db):
+    asaas = FakeAsaas()
+    resolver = CustomerResolver(asaas.create_customer)
+
+    async def scenario():
+        await db.subscriptions.insert_one({"cpf_digits": "12345678900", "asaas_customer_id": "cus_stored"})
+        return await resolve(resolver, db)
+
+    assert asyncio.run(scenario()) == "cus_stored"
+    assert asaas.created == []
+    assert resolver.stats["storage_hits"] == 1
+
+
+def test_concurrent_requests_share_one_creation(db):
+    asaas = FakeAsaas()
+    resolver = CustomerResolver(asaas.create_customer)
+
+    async def scenario():
+        return await asyncio.gather(*(resolve(resolver, db) for _ in range(10)))
+
+    assert set(asyncio.run(scenario())) == {"cus_1"}
+    assert len(asaas.created) == 1
+
+
+def test_failed_creation_is_not_cached(db):
+    asaas = FakeAsaas(fail=True)
+    resolver = CustomerResolver(asaas.create_customer)
+
+    async def scenario():
+        first = await resolve(resolver, db)
+        asaas.fail = False
+        return first, await resolve(resolver, db)
+
+    assert asyncio.run(scenario()) == (None, "cus_1")
+    assert resolver.stats["errors"] == 1
+
+
+def test_forgotten_customer_is_replaced_even_if_stored(db):
+    asaas = FakeAsaas()
+    resolver = CustomerResolver(asaas.create_customer)
+
+    async def scenario():
+        await db.asaas_payments.insert_one({"cpf_digits": "12345678900", "asaas_customer_id": "cus_deleted"})
+        stale = await resolve(resolver, db)
+        resolver.forget("123.456.789-00", stale)
+        fresh = await resolve(resolver, db)
+        return stale, fresh, await resolve(resolver, db)
+
+    assert asyncio.run(scenario()) == ("cus_deleted", "cus_1", "cus_1")
+    assert len(asaas.created) == 1
+
+
+def asaas_with(handler):
+    from asaas_client import AsaasClient
+    from resilience import ResiliencePolicy, RetryBudget
+
+    client = AsaasClient("https://asaas.test/api/v3", "token")
+    client.resilience = ResiliencePolicy("asaas-test", max_retries=0, budget=RetryBudget())
+    client._client = httpx.AsyncClient(base_url=client.base_url, transport=httpx.MockTransport(handler))
+    return client
+
+
+def respond(status_code, code=None):
+    def handler(request):
+        body = {"errors": [{"code": code, "description": "erro"}]} if code else {}
+        return httpx.Response(status_code, json=body)
+    return handler
+
+
+def timeout(request):
+    raise httpx.ReadTimeout("sem resposta", request=request)
+
+
+@pytest.mark.parametrize("handler, rejected", [
+    (respond(400, "invalid_customer"), True),
+    (respond(404), True),
+    (respond(400, "invalid_value"), False),
+    (respond(429), False),
+    (respond(503), False),
+    (timeout, False),
+])
+def test_only_a_refused_customer_counts_as_rejected(handler, rejected):
+    result = asyncio.run(asaas_with(handler).create_payment({"customer": "cus_1", "value": 150.0}))
+
+    assert result.data is None
+    assert result.customer_rejected is rejected
+
+
+def test_successful_charge_returns_its_body():
+    result = asyncio.run(asaas_with(lambda request: httpx.Response(200, json={"id": "pay_1"})).create_payment({}))
+
+    assert result == AsaasResult({"id": "pay_1"}, 200)
+
+
+@pytest.mark.parametrize("result, new_customer", [
+    (AsaasResult(None, 400, ("invalid_customer",)), True),
+    (AsaasResult(None, 503), False),
+    (AsaasResult(None), False),
+])
+def test_checkout_forgets_the_customer_only_when_asaas_refuses_it(server, db, monkeypatch, result, new_customer):
+    from fastapi import HTTPException
+
+    asaas = FakeAsaas()
+    monkeypatch.setattr(server, "asaas_customers", CustomerResolver(asaas.create_customer))
+
+    async def create_asaas_payment(*args):
+        return result
+
+    monkeypatch.setattr(server, "create_asaas_payment", create_asaas_payment)
+    request = {"userData": {"fullName": "Taxista", "email": "t@example.com", "cpf": "123.456.789-00", "cellPhone": "27999998888"}}
+
+    async def scenario():
+        with pytest.raises(HTTPException):
+            await server.create_payment_asaas(request)
+        return await resolve(server.asaas_customers, db)
+
+    assert asyncio.run(scenario()) == ("cus_2" if new_customer else "cus_1")
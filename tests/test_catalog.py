@@ -0,0 +1,109 @@
+import asyncio
+
+import catalog
+from catalog import CATALOG_SNAPSHOT_ID, CourseCatalog, mark_catalog_changed
+
+
+def module(module_id, order):
+    return {"id": module_id, "title": module_id, "order": order, "active": True}
+
+
+def titles(snapshot):
+    return [module["id"] for module in snapshot.modules]
+
+
+async def stored(db):
+    return await db.catalog_snapshots.find_one({"_id": CATALOG_SNAPSHOT_ID})
+
+
+def test_rebuild_publishes_increasing_versions(db):
+    async def scenario():
+        await db.course_modules.insert_one(module("m1", 1))
+        course_catalog = CourseCatalog()
+        first = await course_catalog.rebuild(db)
+        await db.course_modules.insert_one(module("m2", 2))
+        second = await course_catalog.changed(db)
+        return first, second, await stored(db)
+
+    first, second, document = asyncio.run(scenario())
+
+    assert (first.version, titles(first)) == (1, ["m1"])
+    assert (second.version, titles(second)) == (2, ["m1", "m2"])
+    assert document["source_version"] == document["built_from"] == 1
+
+
+def test_write_during_build_discards_the_stale_build(db, monkeypatch):
+    build = catalog.build_catalog_document
+    builds = []
+
+    async def racing_build(database):
+        document = await build(database)
+        builds.append(len(document["modules"]))
+        if len(builds) == 1:
+            # Outro worker grava um módulo enquanto este ainda monta o catálogo
+            await database.course_modules.insert_one(module("m2", 2))
+            await mark_catalog_changed(database)
+        return document
+
+    async def scenario():
+        await db.course_modules.insert_one(module("m1", 1))
+        monkeypatch.setattr(catalog, "build_catalog_document", racing_build)
+        return await CourseCatalog().rebuild(db), await stored(db)
+
+    snapshot, document = asyncio.run(scenario())
+
+    assert builds == [1, 2]
+    assert (snapshot.version, titles(snapshot)) == (1, ["m1", "m2"])
+    assert document["built_from"] == document["source_version"] == 1
+
+
+def test_falls_back_to_the_stored_snapshot_when_writes_keep_landing(db, monkeypatch):
+    build = catalog.build_catalog_document
+
+    async def always_racing(database):
+        document = await build(database)
+        await mark_catalog_changed(database)
+        return document
+
+    async def scenario():
+        await db.course_modules.insert_one(module("m1", 1))
+        course_catalog = CourseCatalog()
+        published = await course_catalog.rebuild(db)
+        monkeypatch.setattr(catalog, "build_catalog_document", always_racing)
+        return published, await course_catalog.rebuild(db, attempts=2)
+
+    published, fallback = asyncio.run(scenario())
+
+    assert fallback.version == published.version
+
+
+def test_other_worker_picks_up_a_new_version(db):
+    async def scenario():
+        await db.course_modules.insert_one(module("m1", 1))
+        writer, reader = CourseCatalog(), CourseCatalog()
+        await writer.rebuild(db)
+        await reader.get(db)
+        await db.course_modules.insert_one(module("m2", 2))
+        await writer.changed(db)
+        await reader._refresh_if_newer(db)
+        return await reader.get(db)
+
+    snapshot = asyncio.run(scenario())
+
+    assert (snapshot.version, titles(snapshot)) == (2, ["m1", "m2"])
+
+
+def test_write_without_rebuild_is_rebuilt_by_the_next_check(db):
+    async def scenario():
+        await db.course_modules.insert_one(module("m1", 1))
+        course_catalog = CourseCatalog()
+        await course_catalog.rebuild(db)
+        # Como o seed_course_data: grava e só marca a mudança
+        await db.course_modules.insert_one(module("m2", 2))
+        await mark_catalog_changed(db)
+        await course_catalog._refresh_if_newer(db)
+        return await course_catalog.get(db)
+
+    snapshot = asyncio.run(scenario())
+
+    assert (snapshot.version, titles(snapshot)) == (2, ["m1", "m2"])
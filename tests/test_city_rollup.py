@@ -0,0 +1,88 @@
+import asyncio
+
+from city_rollup import ROLLUP_COLLECTION, apply_subscription_change, canonical_city, ensure_city_rollup, read_city_stats, rebuild_city_rollup
+
+SUBSCRIPTIONS = [
+    {"city": "Vitória", "status": "paid"},
+    {"city": "vitoria ", "status": "pending"},
+    {"city": "VITÓRIA", "status": "paid"},
+    {"city": "Vila Velha", "status": "pending"},
+    {"city": None, "status": "paid"},
+]
+
+
+def by_city(stats):
+    # A grafia exibida depende da ordem de agrupamento; compara pela chave canônica
+    return {canonical_city(city["city"]): (city["total"], city["paid"], city["pending"]) for city in stats}
+
+
+def test_canonical_city_folds_case_accents_and_spaces():
+    assert canonical_city("  Vitória ") == canonical_city("VITORIA") == "vitoria"
+    assert canonical_city("Vila   Velha") == "vila velha"
+    assert canonical_city("  ") is None
+
+
+def test_incremental_changes_match_a_rebuild(db):
+    async def scenario():
+        for subscription in SUBSCRIPTIONS:
+            await apply_subscription_change(db, None, subscription)
+        # Pagamento confirmado, mudança de cidade e exclusão
+        await apply_subscription_change(db, SUBSCRIPTIONS[1], {**SUBSCRIPTIONS[1], "status": "paid"})
+        await apply_subscription_change(db, SUBSCRIPTIONS[3], {**SUBSCRIPTIONS[3], "city": "Serra"})
+        await apply_subscription_change(db, SUBSCRIPTIONS[2], None)
+        incremental = by_city(await read_city_stats(db))
+
+        await db.subscriptions.insert_many([
+            {**SUBSCRIPTIONS[0]},
+            {**SUBSCRIPTIONS[1], "status": "paid"},
+            {**SUBSCRIPTIONS[3], "city": "Serra"},
+            {**SUBSCRIPTIONS[4]},
+        ])
+        await rebuild_city_rollup(db)
+        return incremental, by_city(await read_city_stats(db))
+
+    incremental, rebuilt = asyncio.run(scenario())
+
+    assert incremental == {"vitoria": (2, 2, 0), "serra": (1, 0, 1)}
+    assert rebuilt == incremental
+
+
+def test_same_bucket_write_is_a_no_op(db):
+    async def scenario():
+        await apply_subscription_change(db, None, {"city": "Serra", "status": "paid"})
+        await apply_subscription_change(db, {"city": "Serra", "status": "paid"}, {"city": " serra", "status": "paid"})
+        return await db[ROLLUP_COLLECTION].find({}, {"_id": 0, "count": 1}).to_list(length=None)
+
+    assert asyncio.run(scenario()) == [{"count": 1}]
+
+
+def test_concurrent_rebuilds_leave_one_consistent_rollup(db):
+    async def scenario():
+        await db.subscriptions.insert_many([dict(subscription) for subscription in SUBSCRIPTIONS])
+        await asyncio.gather(*(rebuild_city_rollup(db) for _ in range(4)))
+        return by_city(await read_city_stats(db)), await db.list_collection_names()
+
+    stats, collections = asyncio.run(scenario())
+
+    assert stats == {"vitoria": (3, 2, 1), "vila velha": (1, 0, 1)}
+    assert [name for name in collections if name.startswith(f"{ROLLUP_COLLECTION}_rebuild")] == []
+
+
+def test_rebuild_of_empty_subscriptions_clears_the_rollup(db):
+    async def scenario():
+        await apply_subscription_change(db, None, {"city": "Serra", "status": "paid"})
+        await rebuild_city_rollup(db)
+        return await read_city_stats(db)
+
+    assert asyncio.run(scenario()) == []
+
+
+def test_ensure_builds_only_when_missing(db):
+    async def scenario():
+        await db.subscriptions.insert_one({"city": "Serra", "status": "paid"})
+        await ensure_city_rollup(db)
+        await db.subscriptions.insert_one({"city": "Cariacica", "status": "paid"})
+        await ensure_city_rollup(db)
+        return by_city(await read_city_stats(db))
+
+    assert asyncio.run(scenario()) == {"serra": (1, 1, 0)}
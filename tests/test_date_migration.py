@@ -0,0 +1,109 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+
+from date_migration import MIGRATION_ID, migrate_collection, migrate_string_dates, parse_iso_datetime, reset_migration
+
+FIELDS = ["created_at", "updated_at"]
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("2024-05-01T12:30:00Z", datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc)),
+    ("2024-05-01T09:30:00-03:00", datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc)),
+    ("2024-05-01T12:30:00.123456", datetime(2024, 5, 1, 12, 30, 0, 123456, tzinfo=timezone.utc)),
+    (" 2024-05-01 ", datetime(2024, 5, 1, tzinfo=timezone.utc)),
+    ("ontem", None),
+    ("", None),
+])
+def test_parse_iso_datetime(value, expected):
+    assert parse_iso_datetime(value) == expected
+
+
+class FlakyDb:
+    """Database whose bulk writes on one collection fail after a number of calls"""
+
+    def __init__(self, db, collection_name, fail_after):
+        self._db = db
+        self._collection_name = collection_name
+        self.remaining = fail_after
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+    def __getitem__(self, name):
+        collection = self._db[name]
+        if name != self._collection_name:
+            return collection
+        flaky = self
+
+        class Collection:
+            def __getattr__(self, attribute):
+                return getattr(collection, attribute)
+
+            async def bulk_write(self, operations, **kwargs):
+                if flaky.remaining == 0:
+                    raise ConnectionError("conexão perdida")
+                flaky.remaining -= 1
+                return await collection.bulk_write(operations, **kwargs)
+
+        return Collection()
+
+
+def rows(count):
+    return [{"_id": n, "created_at": f"2024-05-{n + 1:02d}T10:00:00Z", "updated_at": "sem data"} for n in range(count)]
+
+
+def test_converts_string_dates_and_keeps_everything_else(db):
+    native = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+    async def scenario():
+        await db.users.insert_many(rows(3) + [{"_id": 3, "created_at": native}])
+        migrated = await migrate_collection(db, "users", FIELDS)
+        return migrated, await db.users.find().sort("_id", 1).to_list(length=None)
+
+    migrated, documents = asyncio.run(scenario())
+
+    assert migrated == 3
+    assert [document["created_at"] for document in documents] == [
+        datetime(2024, 5, 1, 10, tzinfo=timezone.utc),
+        datetime(2024, 5, 2, 10, tzinfo=timezone.utc),
+        datetime(2024, 5, 3, 10, tzinfo=timezone.utc),
+        native,
+    ]
+    assert {document.get("updated_at") for document in documents} == {"sem data", None}
+
+
+def test_interrupted_run_resumes_from_the_checkpoint(db):
+    async def scenario():
+        await db.users.insert_many(rows(7))
+        with pytest.raises(ConnectionError):
+            await migrate_collection(FlakyDb(db, "users", fail_after=2), "users", FIELDS, batch_size=2)
+        checkpoint = await db.migrations.find_one({"_id": f"{MIGRATION_ID}:users"})
+        resumed = await migrate_collection(db, "users", FIELDS, batch_size=2)
+        remaining = await db.users.count_documents({"created_at": {"$type": "string"}})
+        return checkpoint, resumed, remaining, await db.migrations.find_one({"_id": f"{MIGRATION_ID}:users"})
+
+    checkpoint, resumed, remaining, final = asyncio.run(scenario())
+
+    assert (checkpoint["last_id"], checkpoint["converted"], checkpoint.get("completed")) == (3, 4, None)
+    assert resumed == 3
+    assert remaining == 0
+    assert final["completed"] is True
+    assert final["converted"] == 7
+
+
+def test_completed_collections_are_skipped_until_reset(db):
+    async def scenario():
+        await db.users.insert_many(rows(2))
+        first = await migrate_string_dates(db)
+        await db.users.insert_one({"_id": 10, "created_at": "2024-06-01T00:00:00Z"})
+        skipped = await migrate_string_dates(db)
+        await reset_migration(db)
+        return first, skipped, await migrate_string_dates(db)
+
+    first, skipped, after_reset = asyncio.run(scenario())
+
+    assert first["users"] == 2
+    assert skipped["users"] == 0
+    assert after_reset["users"] == 1
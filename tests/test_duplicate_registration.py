@@ -0,0 +1,63 @@
+import asyncio
+
+from lookup_fields import build_lookup_fields
+
+EXISTING = {
+    "name": "João da Silva",
+    "email": "Joao.Silva@Example.com",
+    "cpf": "123.456.789-00",
+    "phone": "(27) 99999-8888",
+    "car_plate": "ABC-1234",
+    "license_number": "al-5678",
+}
+
+
+def store(db, *subscriptions):
+    documents = [{**subscription, **build_lookup_fields(subscription)} for subscription in subscriptions]
+    return db.subscriptions.insert_many(documents)
+
+
+def test_matches_normalized_values(server, db):
+    async def scenario():
+        await store(db, EXISTING)
+        return await server.check_duplicate_registration(
+            db, "  joão  DA silva ", "joao.silva@example.com ", "12345678900",
+            "+55 27 99999-8888", "abc1234", "AL5678"
+        )
+
+    found = asyncio.run(scenario())
+
+    assert list(found) == ["email", "cpf", "phone", "car_plate", "license_number", "name"]
+    assert found["cpf"] == {"field": "CPF", "value": "12345678900", "existing_user": "João da Silva"}
+
+
+def test_reports_each_field_against_the_subscription_that_holds_it(server, db):
+    other = {"name": "Maria Souza", "email": "maria@example.com", "cpf": "98765432100"}
+
+    async def scenario():
+        await store(db, EXISTING, other)
+        return await server.check_duplicate_registration(db, "Pedro", "maria@example.com", "123.456.789-00")
+
+    found = asyncio.run(scenario())
+
+    assert found["email"]["existing_user"] == "Maria Souza"
+    assert found["cpf"]["existing_user"] == "João da Silva"
+    assert "name" not in found
+
+
+def test_new_registration_has_no_duplicates(server, db):
+    async def scenario():
+        await store(db, EXISTING)
+        return await server.check_duplicate_registration(
+            db, "Ana Lima", "ana@example.com", "111.222.333-44", "27 98888-7777", "XYZ9A87", "AL-1"
+        )
+
+    assert asyncio.run(scenario()) == {}
+
+
+def test_blank_fields_are_not_checked(server, db):
+    async def scenario():
+        await db.subscriptions.insert_one({"name": "Sem dados", "email_lower": None, "cpf_digits": None})
+        return await server.check_duplicate_registration(db, "", "", "", None, None, None)
+
+    assert asyncio.run(scenario()) == {}
@@ -0,0 +1,68 @@
+import asyncio
+from datetime import datetime, timezone
+
+
+def at(day, hour=12, month=5):
+    return datetime(2024, month, day, hour, tzinfo=timezone.utc)
+
+
+def stats(server, db, now, subscriptions):
+    async def scenario():
+        await db.subscriptions.insert_many(subscriptions)
+        rows = await db.subscriptions.aggregate(server.financial_stats_pipeline(now)).to_list(length=1)
+        return rows[0] if rows else {}
+
+    totals = asyncio.run(scenario())
+    return {name: (totals.get(f"{name}_paid", 0), totals.get(f"{name}_revenue", 0)) for name in ("today", "week", "month")}
+
+
+def test_windows_count_paid_subscriptions_and_revenue(server, db):
+    # Quarta-feira: a semana começa na segunda, 13/05
+    now = at(15, 15)
+    subscriptions = [
+        {"status": "paid", "subscription_date": at(15, 9), "original_price": 150},
+        {"status": "paid", "subscription_date": at(15, 10), "original_price": 150, "bonus": True},
+        {"status": "active", "subscription_date": at(14), "original_price": 200, "discount": 20},
+        {"status": "paid", "subscription_date": at(2)},
+        {"status": "paid", "subscription_date": at(30, month=4), "original_price": 150},
+        {"status": "pending", "subscription_date": at(15), "original_price": 150},
+        {"status": "paid", "subscription_date": at(16, 0), "original_price": 150},
+        # Sem subscription_date vale o created_at; com ela, o created_at é ignorado
+        {"status": "paid", "created_at": at(15, 8), "original_price": 100},
+        {"status": "paid", "subscription_date": at(20, month=4), "created_at": at(15), "original_price": 150},
+    ]
+
+    result = stats(server, db, now, subscriptions)
+
+    assert result["today"] == (3, 250)
+    assert result["week"] == (5, 560)
+    assert result["month"] == (6, 710)
+
+
+def test_week_that_starts_in_the_previous_month(server, db):
+    # Quinta, 02/05: a semana começou em 29/04, antes do mês
+    now = at(2)
+    subscriptions = [
+        {"status": "paid", "subscription_date": at(30, month=4), "original_price": 150},
+        {"status": "paid", "subscription_date": at(1), "original_price": 150},
+        {"status": "paid", "subscription_date": at(28, month=4), "original_price": 150},
+    ]
+
+    result = stats(server, db, now, subscriptions)
+
+    assert result["today"] == (0, 0)
+    assert result["week"] == (2, 300)
+    assert result["month"] == (1, 150)
+
+
+def test_endpoint_reports_zeros_without_paid_subscriptions(server, db):
+    from fastapi.testclient import TestClient
+
+    response = TestClient(server.app).get("/api/admin/financial-stats")
+
+    assert response.json() == {
+        "today": {"paid": 0, "revenue": 0},
+        "week": {"paid": 0, "revenue": 0},
+        "month": {"paid": 0, "revenue": 0},
+        "total_revenue": 0
+    }
@@ -0,0 +1,127 @@
+import asyncio
+
+import pytest
+from starlette.requests import Request
+
+from http_cache import CollectionVersions, ConditionalResponder
+
+
+def request(if_none_match=None):
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+class Builder:
+    def __init__(self, *contents):
+        self.contents = list(contents)
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        content = self.contents.pop(0)
+        if isinstance(content, Exception):
+            raise content
+        return content
+
+
+def test_body_is_built_once_per_version_and_revalidated_with_304():
+    responder = ConditionalResponder()
+    build = Builder({"price": 200.0}, {"price": 250.0})
+
+    async def scenario():
+        first = await responder.respond(request(), "price", (1,), build)
+        revalidated = await responder.respond(request(first.headers["ETag"]), "price", (1,), build)
+        changed = await responder.respond(request(first.headers["ETag"]), "price", (2,), build)
+        return first, revalidated, changed
+
+    first, revalidated, changed = asyncio.run(scenario())
+
+    assert first.status_code == 200 and first.body == b'{"price":200.0}'
+    assert first.headers["Cache-Control"] == "no-cache"
+    assert revalidated.status_code == 304 and revalidated.body == b""
+    assert changed.status_code == 200 and changed.body == b'{"price":250.0}'
+    assert changed.headers["ETag"] != first.headers["ETag"]
+    assert build.calls == 2
+
+
+@pytest.mark.parametrize("header", ['W/"{}"', '"other", "{}"', "*"])
+def test_weak_lists_and_wildcard_etags_match(header):
+    responder = ConditionalResponder()
+    build = Builder({"a": 1})
+
+    async def scenario():
+        first = await responder.respond(request(), "key", (1,), build)
+        etag = first.headers["ETag"].strip('"')
+        return await responder.respond(request(header.format(etag)), "key", (1,), build)
+
+    assert asyncio.run(scenario()).status_code == 304
+
+
+def test_failed_build_is_not_cached():
+    responder = ConditionalResponder()
+    build = Builder(ConnectionError("mongo down"), {"price": 200.0})
+
+    async def scenario():
+        with pytest.raises(ConnectionError):
+            await responder.respond(request(), "price", (1,), build)
+        return await responder.respond(request(), "price", (1,), build)
+
+    response = asyncio.run(scenario())
+
+    assert response.body == b'{"price":200.0}'
+    assert build.calls == 2
+
+
+def test_cache_is_bounded():
+    responder = ConditionalResponder(max_entries=2)
+    build = Builder({"n": 1}, {"n": 2}, {"n": 3}, {"n": 1})
+
+    async def scenario():
+        for key in ("a", "b", "c", "a"):
+            await responder.respond(request(), key, (1,), build)
+
+    asyncio.run(scenario())
+
+    assert build.calls == 4
+
+
+def test_versions_bump_and_are_shared_through_mongodb(db):
+    writer, reader = CollectionVersions(ttl=0), CollectionVersions(ttl=0)
+
+    async def scenario():
+        before = await reader.get(db, ["courses", "questions"])
+        await writer.bump(db, "courses")
+        return before, await reader.get(db, ["courses", "questions"])
+
+    assert asyncio.run(scenario()) == ((0, 0), (1, 0))
+
+
+class BrokenCourses:
+    """Database whose courses collection is unreachable"""
+
+    def __init__(self, db):
+        self._db = db
+
+    def __getattr__(self, name):
+        if name == "courses":
+            raise ConnectionError("courses indisponível")
+        return getattr(self._db, name)
+
+
+def test_price_fallback_after_a_db_error_is_not_served_later(server, db, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    asyncio.run(db.courses.insert_one({"category": "obrigatorio", "active": True, "price": 200.0}))
+    monkeypatch.setattr(server, "collection_versions", CollectionVersions())
+    monkeypatch.setattr(server, "conditional_responses", ConditionalResponder())
+    client = TestClient(server.app)
+
+    monkeypatch.setattr(server, "db", BrokenCourses(db))
+    fallback = client.get("/api/courses/default/price")
+    monkeypatch.setattr(server, "db", db)
+    recovered = client.get("/api/courses/default/price")
+
+    assert fallback.json() == {"price": 150.0}
+    assert "ETag" not in fallback.headers
+    assert recovered.json() == {"price": 200.0}
+    assert "ETag" in recovered.headers
@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+from lookup_fields import build_lookup_fields, normalize_phone, phone_duplicate_query
+
+
+@pytest.mark.parametrize("phone", [
+    "(27) 99999-8888",
+    "27999998888",
+    "+55 27 99999-8888",
+    "0055 27 99999 8888",
+    "027 99999-8888",
+])
+def test_formats_of_the_same_number_share_one_canonical_form(phone):
+    assert normalize_phone(phone) == {
+        "phone_digits": "5527999998888",
+        "phone_local": "999998888",
+        "phone_suffix": "99998888",
+    }
+
+
+def test_number_without_ddd_keeps_its_local_digits():
+    assert normalize_phone("99999-8888") == {
+        "phone_digits": "999998888",
+        "phone_local": "999998888",
+        "phone_suffix": "99998888",
+    }
+
+
+def test_empty_phone_has_no_query():
+    assert normalize_phone("") == {"phone_digits": None, "phone_local": None, "phone_suffix": None}
+    assert phone_duplicate_query("sem número") is None
+
+
+def test_query_uses_indexed_equality_only():
+    assert phone_duplicate_query("(27) 99999-8888") == {"phone_digits": {"$in": ["5527999998888", "999998888"]}}
+    assert phone_duplicate_query("9999-8888") == {"phone_suffix": "99998888"}
+
+
+@pytest.mark.parametrize("stored, searched, duplicate", [
+    ("(27) 99999-8888", "+55 27 99999-8888", True),
+    ("99999-8888", "(27) 99999-8888", True),
+    ("(27) 99999-8888", "9999-8888", True),
+    ("(27) 99999-8888", "(11) 99999-8888", False),
+    ("(27) 99999-8888", "(27) 99999-8887", False),
+    # Substring do número não é duplicidade (a regex antiga casava)
+    ("(27) 99999-8888", "9999", False),
+])
+def test_duplicate_lookup(db, stored, searched, duplicate):
+    async def scenario():
+        await db.subscriptions.insert_one({"phone": stored, **build_lookup_fields({"phone": stored})})
+        query = phone_duplicate_query(searched)
+        return query is not None and await db.subscriptions.count_documents(query) > 0
+
+    assert asyncio.run(scenario()) is duplicate
@@ -0,0 +1,83 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from bson import ObjectId
+
+from pagination import InvalidCursorError, decode_cursor, encode_cursor, fetch_page
+
+
+def test_cursor_round_trip_keeps_bson_types():
+    created_at = datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc)
+    object_id = ObjectId()
+
+    sort_value, decoded_id = decode_cursor(encode_cursor(created_at, object_id))
+
+    assert sort_value.replace(tzinfo=timezone.utc) == created_at
+    assert decoded_id == object_id
+
+
+def test_decode_rejects_garbage():
+    with pytest.raises(InvalidCursorError):
+        decode_cursor("not-a-cursor")
+
+
+@pytest.mark.parametrize("descending", [False, True])
+def test_pages_cover_every_document_once(db, descending):
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    # Datas repetidas: o _id desempata dentro da mesma data
+    documents = [{"n": i, "created_at": start + timedelta(days=i // 3)} for i in range(25)]
+    documents.append({"n": 25})
+
+    async def scenario():
+        await db.payments.insert_many(documents)
+        seen, after, pages = [], None, 0
+        while True:
+            page, after = await fetch_page(db.payments, {}, {"n": 1}, "created_at", descending, after, limit=4)
+            seen.extend(document["n"] for document in page)
+            pages += 1
+            if after is None:
+                return seen, pages
+
+    seen, pages = asyncio.run(scenario())
+
+    assert sorted(seen) == list(range(26))
+    assert pages == 7
+    dated = [n for n in seen if n != 25]
+    assert dated == sorted(dated, key=lambda n: n // 3, reverse=descending)
+
+
+def test_last_page_has_no_cursor(db):
+    async def scenario():
+        await db.payments.insert_many([{"n": i} for i in range(3)])
+        return await fetch_page(db.payments, {}, {"n": 1}, limit=3)
+
+    page, after = asyncio.run(scenario())
+
+    assert [document["n"] for document in page] == [0, 1, 2]
+    assert after is None
+
+
+@pytest.mark.parametrize("sort_value", [{"$ne": None}, [1, 2], {"$gt": ""}])
+def test_decode_rejects_operators_smuggled_in_the_cursor(sort_value):
+    with pytest.raises(InvalidCursorError):
+        decode_cursor(encode_cursor(sort_value, ObjectId()))
+    with pytest.raises(InvalidCursorError):
+        decode_cursor(encode_cursor("2024-01-01", sort_value))
+
+
+def test_listing_is_paged_by_default_and_rejects_bad_cursors(server, db):
+    from fastapi.testclient import TestClient
+
+    asyncio.run(db.subscriptions.insert_many([{"id": str(i), "name": f"Taxista {i}"} for i in range(150)]))
+    client = TestClient(server.app)
+
+    first = client.get("/api/subscriptions")
+    second = client.get("/api/subscriptions", params={"after": first.headers["X-Next-Cursor"]})
+    injected = client.get("/api/subscriptions", params={"after": encode_cursor({"$ne": None}, ObjectId())})
+
+    assert len(first.json()) == 100
+    assert len(second.json()) == 50
+    assert "X-Next-Cursor" not in second.headers
+    assert [row["id"] for row in first.json()][:2] == ["149", "148"]
+    assert injected.status_code == 400
@@ -0,0 +1,82 @@
+import asyncio
+import base64
+
+from pix_images import IMAGE_COLLECTION, image_id_for, load_image, migrate_inline_images, reset_migration, store_encoded_image
+
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(64))
+ENCODED = base64.b64encode(PNG).decode()
+
+
+def test_same_image_is_stored_once_under_its_hash(db):
+    async def scenario():
+        first = await store_encoded_image(db, ENCODED)
+        second = await store_encoded_image(db, ENCODED)
+        return first, second, await db[IMAGE_COLLECTION].count_documents({}), await load_image(db, first)
+
+    first, second, stored, image = asyncio.run(scenario())
+
+    assert first == second == image_id_for(PNG)
+    assert stored == 1
+    assert bytes(image["data"]) == PNG
+
+
+def test_invalid_base64_and_bad_ids_are_ignored(db):
+    async def scenario():
+        return await store_encoded_image(db, "não é base64"), await load_image(db, "../etc/passwd")
+
+    assert asyncio.run(scenario()) == (None, None)
+
+
+def test_migration_moves_images_and_keeps_invalid_ones(db):
+    async def scenario():
+        await db.asaas_payments.insert_many([
+            {"_id": 1, "pix_qrcode_image": ENCODED},
+            {"_id": 2, "pix_qrcode_image": ENCODED},
+            {"_id": 3, "pix_qrcode_image": "não é base64"},
+            {"_id": 4, "pix_qrcode_image_id": "abc"},
+        ])
+        moved = await migrate_inline_images(db)
+        return moved, await db.asaas_payments.find().sort("_id", 1).to_list(length=None)
+
+    moved, payments = asyncio.run(scenario())
+
+    assert moved == 2
+    assert [payment.get("pix_qrcode_image_id") for payment in payments] == [image_id_for(PNG)] * 2 + [None, "abc"]
+    assert "pix_qrcode_image" not in payments[0]
+    assert payments[2]["pix_qrcode_image"] == "não é base64"
+    assert payments[2]["pix_qrcode_image_invalid"] is True
+
+
+def test_completed_migration_does_not_scan_again(db):
+    scans = []
+
+    class CountingDb:
+        def __getattr__(self, name):
+            collection = getattr(db, name)
+            if name != "asaas_payments":
+                return collection
+
+            class Payments:
+                def __getattr__(self, attribute):
+                    return getattr(collection, attribute)
+
+                def find(self, *args, **kwargs):
+                    scans.append(args[0])
+                    return collection.find(*args, **kwargs)
+
+            return Payments()
+
+        def __getitem__(self, name):
+            return db[name]
+
+    async def scenario():
+        await db.asaas_payments.insert_one({"_id": 1, "pix_qrcode_image": "não é base64"})
+        await migrate_inline_images(CountingDb())
+        await migrate_inline_images(CountingDb())
+        await reset_migration(db)
+        return await db.asaas_payments.find_one({"_id": 1})
+
+    payment = asyncio.run(scenario())
+
+    assert len(scans) == 1
+    assert "pix_qrcode_image_invalid" not in payment
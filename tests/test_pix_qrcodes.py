@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException, Response
+
+from pix_qrcodes import PixQrCodeFetcher
+
+PAYLOAD = "00020101021226800014br.gov.bcb.pix2558pix.example.com/qr/v2/cobv/1234567890520400005303986540515.005802BR5905ASAAS6009SAO PAULO62070503***6304ABCD"
+
+
+def fetcher(delay, pix_data):
+    calls = []
+
+    async def fetch(payment_id):
+        calls.append(payment_id)
+        await asyncio.sleep(delay)
+        return pix_data
+
+    qrcodes = PixQrCodeFetcher(fetch)
+    qrcodes.calls = calls
+    return qrcodes
+
+
+@pytest.fixture
+def pix_server(server, monkeypatch):
+    monkeypatch.setattr(server, "PIX_QRCODE_POLL_WAIT_SECONDS", 0.05)
+    return server
+
+
+def poll(server, payment_id):
+    response = Response()
+    body = asyncio.run(server.get_payment_pix(payment_id, response))
+    return response.status_code or 200, body
+
+
+def test_unknown_payment_is_404(pix_server):
+    with pytest.raises(HTTPException) as error:
+        poll(pix_server, "pay_unknown")
+    assert error.value.status_code == 404
+
+
+def test_stored_qr_code_is_returned_without_asking_asaas(pix_server, db, monkeypatch):
+    qrcodes = fetcher(0, None)
+    monkeypatch.setattr(pix_server, "pix_qrcodes", qrcodes)
+    asyncio.run(db.asaas_payments.insert_one({"asaas_payment_id": "pay_1", "pix_qrcode": PAYLOAD}))
+
+    status, body = poll(pix_server, "pay_1")
+
+    assert status == 200
+    assert (body["pix_status"], body["pix_qrcode"]) == ("ready", PAYLOAD)
+    assert qrcodes.calls == []
+
+
+def test_slow_fetch_answers_202_until_the_qr_code_is_stored(pix_server, db, monkeypatch):
+    qrcodes = fetcher(0.2, {"payload": PAYLOAD})
+    monkeypatch.setattr(pix_server, "pix_qrcodes", qrcodes)
+
+    async def scenario():
+        await db.asaas_payments.insert_one({"asaas_payment_id": "pay_1"})
+        pending = Response()
+        first = await pix_server.get_payment_pix("pay_1", pending)
+        await asyncio.sleep(0.3)
+        ready = Response()
+        second = await pix_server.get_payment_pix("pay_1", ready)
+        return (pending.status_code, first), (ready.status_code, second)
+
+    (pending_status, pending), (ready_status, ready) = asyncio.run(scenario())
+
+    assert (pending_status, pending["pix_status"], pending["pix_qrcode"]) == (202, "pending", None)
+    assert ready_status in (None, 200)
+    assert (ready["pix_status"], ready["pix_qrcode"]) == ("ready", PAYLOAD)
+    assert qrcodes.calls == ["pay_1"]
+
+
+def test_checkout_does_not_wait_for_the_qr_code_by_default(pix_server):
+    assert pix_server.PIX_QRCODE_GRACE_SECONDS == 0
@@ -0,0 +1,62 @@
+import asyncio
+import random
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from pix_render import QR_RENDERING_AVAILABLE, QrRenderer, draw_png, encode_matrix, snap_size
+
+PAYLOAD = "00020101021226800014br.gov.bcb.pix2558pix.example.com/qr/v2/cobv/1234567890520400005303986540515.005802BR5905ASAAS6009SAO PAULO62070503***6304ABCD"
+
+
+def random_matrix(modules, seed=1):
+    generator = random.Random(seed)
+    return [[generator.random() < 0.5 for _ in range(modules)] for _ in range(modules)]
+
+
+def module_colors(png, modules):
+    """Color at the centre of each module, dark as True"""
+    image = Image.open(BytesIO(png)).convert("L")
+    step = image.width / modules
+    return [
+        [image.getpixel((int((column + 0.5) * step), int((row + 0.5) * step))) < 128 for column in range(modules)]
+        for row in range(modules)
+    ]
+
+
+@pytest.mark.parametrize("modules", [57, 65, 73, 129])
+@pytest.mark.parametrize("size", [128, 256, 512])
+def test_qr_fills_the_requested_canvas(modules, size):
+    matrix = random_matrix(modules)
+
+    png = draw_png(matrix, size)
+
+    assert Image.open(BytesIO(png)).size == (max(size, modules), max(size, modules))
+    assert module_colors(png, modules) == matrix
+
+
+def test_snap_size_rounds_up_to_a_served_size():
+    assert [snap_size(size) for size in (64, 128, 129, 300, 5000)] == [128, 128, 256, 512, 1024]
+
+
+@pytest.mark.skipif(not QR_RENDERING_AVAILABLE, reason="pacote qrcode não instalado")
+def test_renders_are_cached_and_shared():
+    renderer = QrRenderer()
+
+    async def scenario():
+        first, second = await asyncio.gather(renderer.render(PAYLOAD, 200), renderer.render(PAYLOAD, 256))
+        third = await renderer.render(PAYLOAD, 256)
+        return first, second, third
+
+    try:
+        first, second, third = asyncio.run(scenario())
+    finally:
+        renderer.close()
+
+    assert first == second == third
+    assert first[1] == 256
+    assert Image.open(BytesIO(first[2])).size == (256, 256)
+    assert renderer.stats["renders"] == 1
+    assert renderer.stats["hits"] == 1
+    assert module_colors(first[2], len(encode_matrix(PAYLOAD))) == encode_matrix(PAYLOAD)
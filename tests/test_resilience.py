@@ -0,0 +1,167 @@
+import asyncio
+
+import pytest
+
+import resilience
+from resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, ResiliencePolicy, RetryBudget
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(resilience.time, "monotonic", clock)
+    return clock
+
+
+def test_breaker_opens_after_threshold_and_rejects(clock):
+    breaker = CircuitBreaker("svc", failure_threshold=3, reset_timeout=30)
+    for _ in range(3):
+        breaker.before_call()
+        breaker.record_failure()
+
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    assert breaker.stats["rejected"] == 1
+
+
+def test_success_resets_the_consecutive_count(clock):
+    breaker = CircuitBreaker("svc", failure_threshold=3)
+    for outcome in (False, False, True, False, False):
+        breaker.before_call()
+        breaker.record_success() if outcome else breaker.record_failure()
+
+    assert breaker.state == CLOSED
+
+
+def test_half_open_allows_one_trial_then_closes(clock):
+    breaker = CircuitBreaker("svc", failure_threshold=1, reset_timeout=30)
+    breaker.before_call()
+    breaker.record_failure()
+    clock.now += 31
+
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    breaker.before_call()
+
+
+def test_failed_trial_reopens(clock):
+    breaker = CircuitBreaker("svc", failure_threshold=1, reset_timeout=30)
+    breaker.before_call()
+    breaker.record_failure()
+    clock.now += 31
+    breaker.before_call()
+
+    breaker.record_failure()
+
+    assert breaker.state == OPEN
+    assert breaker.stats["opened"] == 2
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_cancelled_trial_frees_the_half_open_slot(clock):
+    breaker = CircuitBreaker("svc", failure_threshold=1, reset_timeout=30)
+    breaker.before_call()
+    breaker.record_failure()
+    clock.now += 31
+    breaker.before_call()
+
+    breaker.release()
+
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+
+
+def policy(**kwargs):
+    return ResiliencePolicy("svc", base_delay=0, max_delay=0, budget=RetryBudget(min_retries=10), **kwargs)
+
+
+def test_policy_retries_then_succeeds():
+    calls = []
+
+    async def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise ConnectionError("reset")
+        return "ok"
+
+    svc = policy(max_retries=2)
+
+    assert asyncio.run(svc.call(flaky)) == "ok"
+    assert len(calls) == 3
+    assert svc.stats["retries"] == 2
+    assert svc.breaker.state == CLOSED
+
+
+def test_policy_does_not_retry_other_exceptions():
+    calls = []
+
+    async def invalid():
+        calls.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        asyncio.run(policy().call(invalid, retry_on=(ConnectionError,)))
+    assert len(calls) == 1
+
+
+def test_policy_stops_retrying_once_the_breaker_opens():
+    calls = []
+
+    async def down():
+        calls.append(1)
+        raise ConnectionError("down")
+
+    svc = policy(failure_threshold=2, max_retries=5)
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(svc.call(down))
+    assert len(calls) == 2
+    assert svc.breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(svc.call(down))
+    assert len(calls) == 2
+
+
+def test_exhausted_budget_stops_retries():
+    calls = []
+
+    async def down():
+        calls.append(1)
+        raise ConnectionError("down")
+
+    svc = ResiliencePolicy("svc", max_retries=5, base_delay=0, budget=RetryBudget(ratio=0, min_retries=1))
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(svc.call(down))
+    assert len(calls) == 2
+    assert svc.budget.exhausted == 1
+
+
+def test_hedge_returns_the_faster_attempt():
+    started = []
+
+    async def slow_then_fast():
+        started.append(1)
+        await asyncio.sleep(1 if len(started) == 1 else 0)
+        return len(started)
+
+    svc = policy(hedge_after=0.01)
+
+    assert asyncio.run(svc.call(slow_then_fast, hedge=True)) == 2
+    assert svc.stats["hedges"] == 1
+    assert svc.stats["hedge_wins"] == 1
@@ -0,0 +1,50 @@
+import asyncio
+import json
+from datetime import datetime, timezone
+
+import pytest
+from bson import ObjectId
+
+import fast_json
+from streaming import STREAM_FLUSH_SIZE, iter_json_array, iter_ndjson
+
+
+def transform(document):
+    return {"id": str(document["_id"]), "n": document["n"], "created_at": document["created_at"]}
+
+
+async def collect(iterator):
+    return b"".join([chunk async for chunk in iterator])
+
+
+@pytest.fixture
+def documents(db):
+    created_at = datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc)
+    rows = [{"_id": ObjectId(), "n": n, "created_at": created_at} for n in range(STREAM_FLUSH_SIZE + 5)]
+    asyncio.run(db.payments.insert_many(rows))
+    return rows
+
+
+def test_ndjson_lines_match_the_paged_encoding(db, documents):
+    body = asyncio.run(collect(iter_ndjson(db.payments.find().sort("n", 1), transform)))
+
+    lines = body.split(b"\n")
+    assert lines[-1] == b""
+    assert lines[:-1] == [fast_json.dumps(transform(row)) for row in documents]
+
+
+def test_chunked_array_is_one_json_document(db, documents):
+    body = asyncio.run(collect(iter_json_array(db.payments.find().sort("n", 1), transform)))
+
+    assert json.loads(body) == json.loads(fast_json.dumps([transform(row) for row in documents]))
+
+
+def test_empty_cursor_streams_an_empty_array(db):
+    assert asyncio.run(collect(iter_json_array(db.payments.find(), transform))) == b"[]"
+
+
+def test_unknown_types_are_not_silently_stringified(db):
+    asyncio.run(db.payments.insert_one({"n": 0}))
+
+    with pytest.raises(TypeError):
+        asyncio.run(collect(iter_ndjson(db.payments.find(), lambda document: {"value": object()})))
@@ -0,0 +1,156 @@
+import asyncio
+
+from city_rollup import apply_subscription_change, read_city_stats
+
+EMAIL = "Maria@Example.com"
+
+
+def event(name, status, payment_id="pay_1"):
+    return {"event": name, "payment": {"id": payment_id, "status": status, "value": 150.0, "billingType": "PIX"}}
+
+
+async def seed(db, payment_status="pending"):
+    subscription = {"email": EMAIL, "email_lower": EMAIL.lower(), "city": "Vitória", "status": "pending", "phone": "27999990000"}
+    await db.subscriptions.insert_one({**subscription})
+    await apply_subscription_change(db, None, subscription)
+    await db.asaas_payments.insert_one({
+        "asaas_payment_id": "pay_1", "user_email": EMAIL, "user_name": "Maria", "status": payment_status
+    })
+
+
+async def state(db):
+    payment = await db.asaas_payments.find_one({"asaas_payment_id": "pay_1"})
+    subscription = await db.subscriptions.find_one({"email_lower": EMAIL.lower()})
+    version = await db.collection_versions.find_one({"_id": "subscriptions"})
+    (city,) = await read_city_stats(db)
+    return payment["status"], subscription["status"], (version or {}).get("version", 0), (city["paid"], city["pending"])
+
+
+def test_received_grants_access_once(server, db):
+    async def scenario():
+        await seed(db)
+        result = await server.process_asaas_event(event("PAYMENT_RECEIVED", "RECEIVED"))
+        return result, await state(db)
+
+    result, after = asyncio.run(scenario())
+
+    assert result["course_access"] == "granted"
+    assert result["message"] == "Pagamento processado e curso liberado"
+    assert after == ("received", "paid", 1, (1, 0))
+
+
+def test_late_events_do_not_regress_a_received_payment(server, db):
+    async def scenario():
+        await seed(db)
+        await server.process_asaas_event(event("PAYMENT_RECEIVED", "RECEIVED"))
+        late = [
+            await server.process_asaas_event(event("PAYMENT_UPDATED", "PENDING")),
+            await server.process_asaas_event(event("PAYMENT_CONFIRMED", "CONFIRMED")),
+            await server.process_asaas_event(event("PAYMENT_OVERDUE", "OVERDUE")),
+            await server.process_asaas_event(event("PAYMENT_DELETED", "DELETED")),
+        ]
+        return late, await state(db)
+
+    late, after = asyncio.run(scenario())
+
+    assert [result["status"] for result in late] == ["ignored"] * 4
+    assert after == ("received", "paid", 1, (1, 0))
+
+
+def test_overdue_after_confirmation_keeps_the_course(server, db):
+    async def scenario():
+        await seed(db)
+        await server.process_asaas_event(event("PAYMENT_CONFIRMED", "CONFIRMED"))
+        overdue = await server.process_asaas_event(event("PAYMENT_OVERDUE", "OVERDUE"))
+        # O RECEIVED que chega depois do CONFIRMED ainda avança o status da cobrança
+        received = await server.process_asaas_event(event("PAYMENT_RECEIVED", "RECEIVED"))
+        return overdue, received, await state(db)
+
+    overdue, received, after = asyncio.run(scenario())
+
+    assert overdue["status"] == "ignored"
+    assert received["message"] == "Curso já liberado"
+    assert after == ("received", "paid", 1, (1, 0))
+
+
+def test_duplicate_event_is_a_no_op(server, db):
+    async def scenario():
+        await seed(db)
+        first = await server.process_asaas_event(event("PAYMENT_RECEIVED", "RECEIVED"))
+        once = await state(db)
+        duplicate = await server.process_asaas_event(event("PAYMENT_RECEIVED", "RECEIVED"))
+        return first, once, duplicate, await state(db)
+
+    first, once, duplicate, twice = asyncio.run(scenario())
+
+    assert first["message"] == "Pagamento processado e curso liberado"
+    assert duplicate["message"] == "Curso já liberado"
+    assert twice == once
+
+
+def test_duplicate_cancellation_is_a_no_op(server, db):
+    async def scenario():
+        await seed(db)
+        await server.process_asaas_event(event("PAYMENT_OVERDUE", "OVERDUE"))
+        once = await state(db)
+        await server.process_asaas_event(event("PAYMENT_OVERDUE", "OVERDUE"))
+        return once, await state(db)
+
+    once, twice = asyncio.run(scenario())
+
+    assert once[:2] == ("overdue", "overdue")
+    # A inscrição não muda de novo: nem versão nem contagem por cidade
+    assert twice == once
+
+
+def test_concurrent_confirmations_release_the_course_once(server, db):
+    async def scenario():
+        await seed(db)
+        results = await asyncio.gather(
+            server.process_asaas_event(event("PAYMENT_CONFIRMED", "CONFIRMED")),
+            server.process_asaas_event(event("PAYMENT_RECEIVED", "RECEIVED")),
+            server.process_asaas_event(event("PAYMENT_RECEIVED", "RECEIVED")),
+        )
+        return results, await state(db)
+
+    results, after = asyncio.run(scenario())
+
+    messages = sorted(result["message"] for result in results)
+    assert messages.count("Pagamento processado e curso liberado") == 1
+    assert messages.count("Curso já liberado") == 2
+    assert after[1:] == ("paid", 1, (1, 0))
+
+
+def test_concurrent_confirmation_and_cancellation_only_one_wins(server, db):
+    async def scenario():
+        await seed(db)
+        await asyncio.gather(
+            server.process_asaas_event(event("PAYMENT_RECEIVED", "RECEIVED")),
+            server.process_asaas_event(event("PAYMENT_DELETED", "DELETED")),
+        )
+        return await state(db)
+
+    payment_status, subscription_status, _, (paid, pending) = asyncio.run(scenario())
+
+    # Seja qual for a ordem, a contagem por cidade fica coerente com a inscrição
+    assert (payment_status, subscription_status) in {("received", "paid"), ("deleted", "cancelled")}
+    assert paid == (subscription_status == "paid")
+    assert pending == 0
+
+
+def test_payment_record_without_owner_fields_is_still_found(server, db):
+    async def scenario():
+        await db.asaas_payments.insert_one({"asaas_payment_id": "pay_2", "status": "pending"})
+        result = await server.process_asaas_event(event("PAYMENT_OVERDUE", "OVERDUE", payment_id="pay_2"))
+        return result, await db.asaas_payments.find_one({"asaas_payment_id": "pay_2"})
+
+    result, payment = asyncio.run(scenario())
+
+    assert result["status"] == "processed"
+    assert payment["status"] == "overdue"
+
+
+def test_unknown_payment_is_reported(server, db):
+    result = asyncio.run(server.process_asaas_event(event("PAYMENT_RECEIVED", "RECEIVED", payment_id="missing")))
+
+    assert result == {"status": "error", "message": "Pagamento não encontrado"}
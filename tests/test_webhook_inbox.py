@@ -0,0 +1,204 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from webhook_inbox import DONE, FAILED, INBOX_COLLECTION, PENDING, PROCESSING, WebhookInbox, idempotency_key
+
+
+def payload(payment_id, event="PAYMENT_CONFIRMED", event_id=None):
+    body = {"event": event, "payment": {"id": payment_id, "status": event.split("_")[-1]}}
+    if event_id:
+        body["id"] = event_id
+    return body
+
+
+async def make_inbox(db, process=None, **kwargs):
+    async def ok(body):
+        return {"status": "ok"}
+
+    await db[INBOX_COLLECTION].create_index("idempotency_key", unique=True)
+    inbox = WebhookInbox(process or ok, partitions=1, **kwargs)
+    inbox.db = db
+    return inbox
+
+
+async def expire_lease(db, event_id):
+    await db[INBOX_COLLECTION].update_one(
+        {"_id": event_id}, {"$set": {"lease_until": datetime.now(timezone.utc) - timedelta(seconds=1)}}
+    )
+
+
+def test_idempotency_key_prefers_the_event_id():
+    assert idempotency_key(payload("pay_1", event_id="evt_1")) == "event:evt_1"
+
+
+def test_idempotency_key_hashes_the_payload_without_event_id():
+    first = payload("pay_1")
+    reordered = {"payment": dict(reversed(list(first["payment"].items()))), "event": first["event"]}
+
+    assert idempotency_key(first) == idempotency_key(reordered)
+    assert idempotency_key(first) != idempotency_key(payload("pay_2"))
+    # Sem pagamento nem id: eventos diferentes não colidem
+    assert idempotency_key({"event": "A", "data": 1}) != idempotency_key({"event": "A", "data": 2})
+
+
+def test_redelivery_is_stored_once(db):
+    async def scenario():
+        inbox = await make_inbox(db)
+        first = await inbox.enqueue(db, payload("pay_1", event_id="evt_1"))
+        again = await inbox.enqueue(db, payload("pay_1", event_id="evt_1"))
+        return inbox, first, again, await db[INBOX_COLLECTION].count_documents({})
+
+    inbox, first, again, stored = asyncio.run(scenario())
+
+    assert first is not None and again is None
+    assert stored == 1
+    assert inbox.lag.duplicates == 1
+
+
+def test_claim_takes_the_oldest_event_and_starts_a_lease(db):
+    async def scenario():
+        inbox = await make_inbox(db, lease_seconds=60)
+        first = await inbox.enqueue(db, payload("pay_1", "PAYMENT_CREATED"))
+        await inbox.enqueue(db, payload("pay_2"))
+        return first, await inbox._claim(inbox.partitions[0])
+
+    first, claimed = asyncio.run(scenario())
+
+    assert claimed["_id"] == first
+    assert claimed["status"] == PROCESSING
+    assert claimed["attempts"] == 1
+    assert claimed["lease_until"] > datetime.now(timezone.utc) + timedelta(seconds=50)
+
+
+def test_payment_in_flight_or_in_backoff_is_held_back(db):
+    async def scenario():
+        inbox = await make_inbox(db)
+        partition = inbox.partitions[0]
+        await inbox.enqueue(db, payload("pay_1", "PAYMENT_CONFIRMED"))
+        await inbox.enqueue(db, payload("pay_1", "PAYMENT_OVERDUE"))
+        other = await inbox.enqueue(db, payload("pay_2"))
+
+        in_flight = await inbox._claim(partition)
+        while_in_flight = await inbox._claim(partition)
+        await inbox._fail(in_flight, RuntimeError("timeout"))
+        while_in_backoff = await inbox._claim(partition)
+        return other, while_in_flight, while_in_backoff
+
+    other, while_in_flight, while_in_backoff = asyncio.run(scenario())
+
+    assert while_in_flight["_id"] == other
+    assert while_in_backoff is None
+
+
+def test_retry_keeps_the_payment_order(db):
+    async def scenario():
+        inbox = await make_inbox(db)
+        partition = inbox.partitions[0]
+        confirmed = await inbox.enqueue(db, payload("pay_1", "PAYMENT_CONFIRMED"))
+        await inbox.enqueue(db, payload("pay_1", "PAYMENT_OVERDUE"))
+
+        await inbox._fail(await inbox._claim(partition), RuntimeError("timeout"))
+        await db[INBOX_COLLECTION].update_one(
+            {"_id": confirmed}, {"$set": {"available_at": datetime.now(timezone.utc)}}
+        )
+        return confirmed, await inbox._claim(partition)
+
+    confirmed, retried = asyncio.run(scenario())
+
+    assert retried["_id"] == confirmed
+    assert retried["attempts"] == 2
+
+
+def test_failure_backs_off_then_gives_up(db):
+    async def boom(body):
+        raise RuntimeError("boom")
+
+    async def scenario():
+        inbox = await make_inbox(db, boom, max_attempts=2)
+        partition = inbox.partitions[0]
+        event_id = await inbox.enqueue(db, payload("pay_1"))
+
+        await inbox.handle(await inbox._claim(partition))
+        retry = await db[INBOX_COLLECTION].find_one({"_id": event_id})
+        await db[INBOX_COLLECTION].update_one({"_id": event_id}, {"$set": {"available_at": datetime.now(timezone.utc)}})
+        await inbox.handle(await inbox._claim(partition))
+        return inbox, retry, await db[INBOX_COLLECTION].find_one({"_id": event_id})
+
+    inbox, retry, final = asyncio.run(scenario())
+
+    assert retry["status"] == PENDING
+    assert retry["available_at"] > datetime.now(timezone.utc)
+    assert retry["error"] == "boom"
+    assert final["status"] == FAILED
+    assert final["attempts"] == 2
+    assert inbox.lag.failed == 1
+
+
+def test_expired_lease_is_claimed_again(db):
+    async def scenario():
+        inbox = await make_inbox(db)
+        partition = inbox.partitions[0]
+        event_id = await inbox.enqueue(db, payload("pay_1"))
+        await inbox._claim(partition)
+        before_expiry = await inbox._claim(partition)
+        await expire_lease(db, event_id)
+        return event_id, before_expiry, await inbox._claim(partition)
+
+    event_id, before_expiry, reclaimed = asyncio.run(scenario())
+
+    assert before_expiry is None
+    assert reclaimed["_id"] == event_id
+    assert reclaimed["attempts"] == 2
+
+
+def test_stale_claim_cannot_overwrite_the_newer_one(db):
+    async def scenario():
+        inbox = await make_inbox(db)
+        partition = inbox.partitions[0]
+        event_id = await inbox.enqueue(db, payload("pay_1"))
+        stale = await inbox._claim(partition)
+        await expire_lease(db, event_id)
+        fresh = await inbox._claim(partition)
+
+        await inbox._fail(stale, RuntimeError("late timeout"))
+        after_stale_failure = await db[INBOX_COLLECTION].find_one({"_id": event_id})
+        await inbox.handle(stale)
+        after_stale_success = await db[INBOX_COLLECTION].find_one({"_id": event_id})
+        await inbox.handle(fresh)
+        return inbox, after_stale_failure, after_stale_success, await db[INBOX_COLLECTION].find_one({"_id": event_id})
+
+    inbox, after_stale_failure, after_stale_success, final = asyncio.run(scenario())
+
+    assert after_stale_failure["status"] == PROCESSING
+    assert after_stale_success["status"] == PROCESSING
+    assert final["status"] == DONE
+    assert inbox.lag.processed == 1
+
+
+def test_running_inbox_processes_each_payment_in_order(db):
+    seen = []
+
+    async def process(body):
+        await asyncio.sleep(0)
+        seen.append((body["payment"]["id"], body["event"]))
+        return {"status": "ok"}
+
+    async def scenario():
+        await db[INBOX_COLLECTION].create_index("idempotency_key", unique=True)
+        inbox = WebhookInbox(process, partitions=4, idle_poll_seconds=0.05)
+        inbox.start(db)
+        for event in ("PAYMENT_CREATED", "PAYMENT_CONFIRMED", "PAYMENT_REFUNDED"):
+            for n in range(5):
+                await inbox.enqueue(db, payload(f"pay_{n}", event))
+        for _ in range(200):
+            if await db[INBOX_COLLECTION].count_documents({"status": DONE}) == 15:
+                break
+            await asyncio.sleep(0.01)
+        await inbox.stop(drain_seconds=1)
+
+    asyncio.run(scenario())
+
+    assert len(seen) == 15
+    for n in range(5):
+        events = [event for payment_id, event in seen if payment_id == f"pay_{n}"]
+        assert events == ["PAYMENT_CREATED", "PAYMENT_CONFIRMED", "PAYMENT_REFUNDED"]
@@ -0,0 +1,103 @@
+import asyncio
+
+from webhook_inbox import DONE, INBOX_COLLECTION
+from webhook_replay import _Watermark, DryRunPlanner, iter_inbox, load_checkpoint, replay
+
+
+def event(n):
+    return {"event": "PAYMENT_CONFIRMED", "payment": {"id": f"pay_{n}", "status": "CONFIRMED"}}
+
+
+async def items(count):
+    for n in range(count):
+        yield n, None, event(n)
+
+
+def failing_on(*failing):
+    async def process(payload):
+        await asyncio.sleep(0)
+        if payload["payment"]["id"] in failing:
+            raise RuntimeError("boom")
+        return {"status": "success"}
+    return process
+
+
+def test_watermark_waits_for_the_lowest_unfinished_event():
+    watermark = _Watermark()
+    watermark.finish(1, "b")
+    watermark.finish(2, "c")
+    assert watermark.position is None
+
+    watermark.finish(0, "a")
+    assert watermark.position == "c"
+
+
+def test_watermark_starts_from_the_resume_position():
+    watermark = _Watermark("resumed")
+    watermark.finish(1, "b")
+    assert watermark.position == "resumed"
+
+
+def test_completed_run_checkpoints_the_last_event(db):
+    async def scenario():
+        result = await replay(db, failing_on(), items(20), "replay:test", concurrency=4, checkpoint_every=5)
+        return result, await load_checkpoint(db, "replay:test")
+
+    result, checkpoint = asyncio.run(scenario())
+
+    assert result["outcomes"] == {"success": 20}
+    assert checkpoint["last_position"] == 19
+    assert checkpoint["completed"] is True
+
+
+def test_checkpoint_stops_before_an_event_that_raised(db):
+    async def scenario():
+        result = await replay(db, failing_on("pay_7"), items(20), "replay:test", concurrency=4, checkpoint_every=5)
+        return result, await load_checkpoint(db, "replay:test")
+
+    result, checkpoint = asyncio.run(scenario())
+
+    assert result["outcomes"] == {"success": 19, "exception": 1}
+    assert checkpoint["last_position"] == 6
+    assert checkpoint["completed"] is False
+
+
+def test_resume_from_inbox_checkpoint_retries_the_failed_event(db):
+    async def scenario():
+        ids = (await db[INBOX_COLLECTION].insert_many([{"payload": event(n)} for n in range(6)])).inserted_ids
+        await replay(db, failing_on("pay_2"), iter_inbox(db, {}), "replay:inbox", concurrency=3)
+        first = await load_checkpoint(db, "replay:inbox")
+
+        retried = []
+
+        def on_result(payload, outcome):
+            retried.append(payload["payment"]["id"])
+
+        await replay(db, failing_on(), iter_inbox(db, {}, after=first["last_position"]), "replay:inbox",
+                     after=first["last_position"], on_result=on_result)
+        second = await load_checkpoint(db, "replay:inbox")
+        done = await db[INBOX_COLLECTION].count_documents({"status": DONE})
+        return ids, first, retried, second, done
+
+    ids, first, retried, second, done = asyncio.run(scenario())
+
+    assert first["last_position"] == ids[1]
+    assert sorted(retried) == ["pay_2", "pay_3", "pay_4", "pay_5"]
+    assert second["last_position"] == ids[-1]
+    assert second["completed"] is True
+    assert done == 6
+
+
+def test_dry_run_writes_nothing(db):
+    async def scenario():
+        await db.asaas_payments.insert_one({"asaas_payment_id": "pay_0", "status": "pending", "user_email": "a@b.com"})
+        planner = DryRunPlanner(db, {"PAYMENT_CONFIRMED": []})
+        result = await replay(db, failing_on(), items(1), "replay:dry", planner=planner)
+        payment = await db.asaas_payments.find_one({"asaas_payment_id": "pay_0"})
+        return result, payment, await load_checkpoint(db, "replay:dry")
+
+    result, payment, checkpoint = asyncio.run(scenario())
+
+    assert result["dry_run"] is True
+    assert payment["status"] == "pending"
+    assert checkpoint == {}